@@ -0,0 +1,213 @@
+"""Benchmarks the rhythmslicer and timbrematcher pipelines on synthetic audio.
+
+For every combination of duration, sample rate and content kind, each stage
+is timed over several runs (median wall time) and run once more under
+tracemalloc to record its peak memory. Results are written as JSON and can
+be compared against a saved baseline:
+
+    python benchmarks/run_benchmarks.py --seconds 10,60 --json results.json
+    python benchmarks/run_benchmarks.py --seconds 10,60 --baseline results.json
+
+The benchmarks use a private, temporary feature cache that is cleared
+before every run, so the numbers describe cold runs and the user's own
+cache is left untouched.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable
+
+import librosa
+import numpy as np
+import soundfile as sf
+
+import synthetic
+from rhythmslicer import cache as cache_module
+from rhythmslicer.analysis import analyze_audio
+from rhythmslicer.cache import get_cache
+from rhythmslicer.export import save_processed_files
+from rhythmslicer.pipeline import run_slicing_pipeline
+from rhythmslicer.processing import slice_audio_on_beats
+from timbrematcher.pipeline import run_timbre_matching_pipeline
+from timbrematcher.processing import find_best_match
+
+# Length of the target snippet cut from each source for the matcher benchmarks.
+TARGET_SECONDS = 1.0
+
+
+class Case:
+    """The synthetic inputs for one (seconds, sr, content) combination."""
+
+    def __init__(self, work_dir: str, seconds: float, sr: int, content: str):
+        self.seconds, self.sr, self.content = seconds, sr, content
+        self.work_dir = work_dir
+        self.source_path = os.path.join(work_dir, "source.wav")
+        self.target_path = os.path.join(work_dir, "target.wav")
+        self.output_dir = os.path.join(work_dir, "out")
+
+        self.source_y = synthetic.generate(content, seconds, sr, seed=1)
+        offset = int(min(seconds / 2, seconds - TARGET_SECONDS) * sr)
+        self.target_y = self.source_y[offset:offset + int(TARGET_SECONDS * sr)].copy()
+        sf.write(self.source_path, self.source_y, sr)
+        sf.write(self.target_path, self.target_y, sr)
+
+        # Precomputed inputs for the stages that run after analysis
+        self.analysis = analyze_audio(self.source_path)
+        self.slices = slice_audio_on_beats(self.analysis.y_percussive, self.analysis.beat_frames)
+
+
+def benchmarks(case: Case) -> dict:
+    """Returns the stages to measure, keyed by name."""
+    return {
+        "analyze_audio": lambda: analyze_audio(case.source_path),
+        "slice_audio_on_beats": lambda: slice_audio_on_beats(
+            case.analysis.y_percussive, case.analysis.beat_frames
+        ),
+        "save_processed_files": lambda: save_processed_files(
+            case.output_dir, "source", case.analysis.y_harmonic, case.slices, case.sr
+        ),
+        "find_best_match": lambda: find_best_match(
+            case.target_y, case.sr, case.source_y, case.sr, top_n=3
+        ),
+        "run_slicing_pipeline": lambda: run_slicing_pipeline(case.source_path, case.output_dir),
+        "run_timbre_matching_pipeline": lambda: run_timbre_matching_pipeline(
+            case.target_path, case.source_path, case.output_dir, top_n=3
+        ),
+    }
+
+
+@contextlib.contextmanager
+def private_cache():
+    """Points the process-wide cache at a temporary directory for the duration."""
+    previous = os.environ.get("TIMBRESWAP_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["TIMBRESWAP_CACHE_DIR"] = cache_dir
+        cache_module._default_cache = None
+        try:
+            yield cache_dir
+        finally:
+            cache_module._default_cache = None
+            if previous is None:
+                del os.environ["TIMBRESWAP_CACHE_DIR"]
+            else:
+                os.environ["TIMBRESWAP_CACHE_DIR"] = previous
+
+
+def _run_quietly(fn: Callable) -> None:
+    # Only ever called inside ``private_cache``
+    cache = get_cache()
+    if cache is not None:
+        cache.clear()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+
+
+def measure(fn: Callable, repeat: int) -> dict:
+    """Measures the median wall time over ``repeat`` runs and the peak memory of one run."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run_quietly(fn)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    _run_quietly(fn)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "wall_s": statistics.median(timings),
+        "wall_min_s": min(timings),
+        "peak_mb": peak / 2**20,
+    }
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """Returns a description of every metric that regressed beyond ``tolerance``."""
+    key = lambda r: (r["benchmark"], r["seconds"], r["sr"], r["content"])
+    reference = {key(r): r for r in baseline}
+    regressions = []
+    for result in results:
+        base = reference.get(key(result))
+        if base is None:
+            continue
+        for metric in ("wall_s", "peak_mb"):
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{result['benchmark']} [{result['seconds']}s, {result['sr']} Hz, "
+                    f"{result['content']}] {metric}: {base[metric]:.3f} -> {result[metric]:.3f}"
+                )
+    return regressions
+
+
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=_csv(float), default=[10.0, 60.0], help="Comma-separated durations.")
+    parser.add_argument("--sr", type=_csv(int), default=[22050], help="Comma-separated sample rates.")
+    parser.add_argument("--content", type=_csv(str), default=["mix"], help=f"Comma-separated kinds: {', '.join(synthetic.CONTENT_KINDS)}.")
+    parser.add_argument("--only", type=_csv(str), default=None, help="Comma-separated benchmark names to run.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark.")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare against a results file written by --json.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression (default 0.2 = 20%%).")
+    args = parser.parse_args()
+
+    results = []
+    with private_cache():
+        for content in args.content:
+            for sr in args.sr:
+                for seconds in args.seconds:
+                    with tempfile.TemporaryDirectory() as work_dir:
+                        case = Case(work_dir, seconds, sr, content)
+                        for name, fn in benchmarks(case).items():
+                            if args.only and name not in args.only:
+                                continue
+                            result = {"benchmark": name, "seconds": seconds, "sr": sr, "content": content}
+                            result.update(measure(fn, args.repeat))
+                            results.append(result)
+                            print(
+                                f"{name:<30} {seconds:>7.1f}s {sr:>6} Hz {content:<6} "
+                                f"{result['wall_s']:8.3f}s {result['peak_mb']:9.1f} MB"
+                            )
+
+    report = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": np.__version__,
+            "librosa": librosa.__version__,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f)["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
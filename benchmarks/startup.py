@@ -0,0 +1,100 @@
+"""Measures CLI startup cost for rhythmslicer and timbrematcher.
+
+Each scenario runs the CLI in a fresh interpreter, the way a scheduler
+launches short-lived jobs, and reports the median and best wall time.
+
+    python benchmarks/startup.py --repeat 5 --json startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import soundfile as sf
+
+import synthetic
+
+# Modules that must not be imported just to build the command-line parser.
+HEAVY_MODULES = ("librosa", "scipy", "soundfile", "numba")
+
+
+def _write_fixtures(tmp_dir: Path, sr: int = 22050) -> dict:
+    """Writes a one-second rhythmic source and a short target for the trivial runs."""
+    source = synthetic.mixture(1.0, sr)
+    sf.write(tmp_dir / "source.wav", source, sr)
+    sf.write(tmp_dir / "target.wav", source[: sr // 4], sr)
+    return {
+        "source": str(tmp_dir / "source.wav"),
+        "target": str(tmp_dir / "target.wav"),
+        "out": str(tmp_dir / "out"),
+    }
+
+
+def scenarios(fixtures: dict) -> dict:
+    """Returns the command lines to time, keyed by scenario name."""
+    rhythmslicer = [sys.executable, "-m", "rhythmslicer.cli"]
+    timbrematcher = [sys.executable, "-m", "timbrematcher.cli"]
+    return {
+        "rhythmslicer --help": rhythmslicer + ["--help"],
+        "timbrematcher --help": timbrematcher + ["--help"],
+        "timbrematcher bad arguments": timbrematcher + ["match"],
+        "rhythmslicer trivial run": rhythmslicer
+        + ["process", fixtures["source"], fixtures["out"] + "/slices"],
+        "timbrematcher trivial run": timbrematcher
+        + [fixtures["target"], fixtures["source"], "--out", fixtures["out"] + "/matches", "-n", "1"],
+    }
+
+
+def heavy_imports(module: str) -> list:
+    """Returns the heavy modules that importing ``module`` pulls in."""
+    code = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def time_command(command: list, repeat: int) -> dict:
+    """Runs a command ``repeat`` times and summarises its wall time."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "runs": timings}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario.")
+    parser.add_argument("--json", dest="json_path", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    results = {
+        "python": sys.version.split()[0],
+        "imports": {
+            module: heavy_imports(module) for module in ("rhythmslicer.cli", "timbrematcher.cli")
+        },
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = _write_fixtures(Path(tmp))
+        for name, command in scenarios(fixtures).items():
+            results["scenarios"][name] = time_command(command, args.repeat)
+            summary = results["scenarios"][name]
+            print(f"{name:<32} median {summary['median_s']:.3f}s  best {summary['min_s']:.3f}s")
+
+    for module, heavy in results["imports"].items():
+        print(f"import {module:<20} heavy modules: {', '.join(heavy) or 'none'}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
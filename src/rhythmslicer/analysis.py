@@ -2,20 +2,100 @@
 import librosa
 import numpy as np
 import logging
-from typing import Any
+from typing import Any, Optional, Sequence
 from dataclasses import dataclass
-from .config import config
+from .audio_io import analysis_rate
+from .cache import get_cache, load_audio
+from .config import Config, get_config
+from .memo import StageMemo
+from .profiling import stage
 
 logger = logging.getLogger(__name__)
+# STFT parameters shared by HPSS and onset detection (librosa's defaults).
+N_FFT = 2048
+HOP_LENGTH = 512
+
+# The signals analyze_audio can reconstruct with an inverse STFT.
+ANALYSIS_OUTPUTS = ('harmonic', 'percussive')
+
 @dataclass
 class AudioAnalysisResult:
-    y_percussive: np.ndarray
-    y_harmonic: np.ndarray
+    y_percussive: Optional[np.ndarray]
+    y_harmonic: Optional[np.ndarray]
     tempo: float
     beat_frames: np.ndarray
     sr: int
 
-def analyze_audio(file_path: str) -> AudioAnalysisResult:
+@dataclass
+class SpectralAnalysis:
+    y_harmonic: Optional[np.ndarray]
+    y_percussive: Optional[np.ndarray]
+    onset_envelope: np.ndarray
+
+def separate_with_onsets(
+    y: np.ndarray,
+    sr: int,
+    hpss_params: Optional[dict] = None,
+    outputs: Sequence[str] = ANALYSIS_OUTPUTS,
+    analysis_sr: Optional[int] = None,
+) -> SpectralAnalysis:
+    """
+    Separates harmonic and percussive components and detects onsets from one STFT.
+
+    The STFT is computed once and median-filtered into harmonic and
+    percussive spectrograms. The onset envelope is derived directly from
+    the percussive magnitude, rather than from a re-analysed percussive
+    waveform, and inverse STFTs are only run for the requested outputs.
+
+    Args:
+        y: The audio time series.
+        sr: The sampling rate of the audio.
+        hpss_params: Keyword arguments for ``librosa.decompose.hpss``.
+        outputs: Which of 'harmonic' and 'percussive' to reconstruct.
+        analysis_sr: If below ``sr``, the onset envelope only uses the band
+            up to ``analysis_sr / 2``, as if the signal had been resampled.
+
+    Returns:
+        The requested waveforms (None for the others) and the onset
+        envelope, with one value per STFT frame.
+    """
+    unknown = set(outputs) - set(ANALYSIS_OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown analysis outputs {sorted(unknown)}. Expected some of {ANALYSIS_OUTPUTS}.")
+
+    with stage('stft') as s:
+        D = librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH)
+        s.arrays(stft=D)
+    with stage('hpss') as s:
+        D_harmonic, D_percussive = librosa.decompose.hpss(D, **(hpss_params or {}))
+        s.arrays(harmonic=D_harmonic, percussive=D_percussive)
+
+    with stage('onset_envelope') as s:
+        mel = librosa.feature.melspectrogram(
+            S=np.abs(D_percussive) ** 2, sr=sr, n_fft=N_FFT,
+            fmax=analysis_rate(sr, analysis_sr) / 2,
+        )
+        onset_envelope = librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel), sr=sr, hop_length=HOP_LENGTH
+        )
+        s.arrays(onset_envelope=onset_envelope)
+
+    with stage('istft') as s:
+        y_harmonic = y_percussive = None
+        if 'harmonic' in outputs:
+            y_harmonic = librosa.istft(D_harmonic, hop_length=HOP_LENGTH, dtype=y.dtype, length=len(y))
+        if 'percussive' in outputs:
+            y_percussive = librosa.istft(D_percussive, hop_length=HOP_LENGTH, dtype=y.dtype, length=len(y))
+        s.arrays(y_harmonic=y_harmonic, y_percussive=y_percussive)
+
+    return SpectralAnalysis(y_harmonic, y_percussive, onset_envelope)
+
+def analyze_audio(
+    file_path: str,
+    analysis_sr: Optional[int] = None,
+    outputs: Sequence[str] = ANALYSIS_OUTPUTS,
+    config: Optional[Config] = None,
+) -> AudioAnalysisResult:
     """
     Loads and analyzes an audio file for its rhythmic and harmonic components.
 
@@ -24,8 +104,21 @@ def analyze_audio(file_path: str) -> AudioAnalysisResult:
     2. Separates the audio into harmonic and percussive components using HPSS.
     3. Tracks the beats and estimates the tempo from the percussive component.
 
+    Both HPSS and onset detection work on a single STFT of the signal, see
+    ``separate_with_onsets``. When the feature cache is enabled, the
+    separation and the beats are memoized by the file contents and the
+    config they depend on (``rhythmslicer.memo.StageMemo``), so a run with
+    new beat tracking parameters skips decoding and HPSS.
+
     Args:
         file_path: The full path to the input audio file.
+        analysis_sr: Limits the onset analysis to the band a signal at this
+            sample rate would contain. Defaults to the 'analysis.sample_rate'
+            config value.
+        outputs: Which of 'harmonic' and 'percussive' to reconstruct. The
+            others are returned as None.
+        config: The 'hpss', 'beat_tracker', 'analysis' and 'cache.stages'
+            settings to use. Defaults to ``get_config()``.
 
     Returns:
         A tuple containing:
@@ -33,35 +126,117 @@ def analyze_audio(file_path: str) -> AudioAnalysisResult:
         - y_harmonic (np.ndarray): The harmonic component of the audio.
         - tempo (float): The estimated tempo in beats per minute (BPM).
         - beat_frames (np.ndarray): An array of frame indices corresponding to beat events.
-        - sr (int): The sample rate of the audio.
+        - sr (int): The sample rate of the audio, which beat_frames also refer to.
     
     Raises:
         FileNotFoundError: If the input file does not exist.
     """
     logger.info(f"Starting analysis for: {file_path}")
-    
-    # 1. Load audio file
-    y, sr = librosa.load(file_path, sr=None)
+    config = config or get_config()
+    analysis_sr = analysis_sr or config.get('analysis.sample_rate')
+    cache = get_cache() if config.get('cache.stages', True) else None
+    if cache is None:
+        # 1. Load audio file (served from the feature cache on repeat runs)
+        with stage('decode') as s:
+            y, sr = load_audio(file_path, sr=None)
+            s.arrays(y=y)
+        return analyze_signal(y, sr, analysis_sr, outputs, config)
 
-    # 2. Get HPSS parameters from config and perform separation
-    hpss_params = config.get('hpss', {})
-    y_harmonic, y_percussive = librosa.effects.hpss(y, **hpss_params)
-    logger.info("Separated audio into harmonic and percussive components.")
+    # Each stage is memoized by the file contents and the config it depends
+    # on, so e.g. a new 'beat_tracker' setting skips decoding and HPSS.
+    memo = StageMemo(cache, file_path, overrides={'analysis.sample_rate': analysis_sr}, config=config)
+    names = {'harmonic': 'y_harmonic', 'percussive': 'y_percussive'}
+    separated = memo.load('separate', [names[o] for o in outputs] + ['onset_envelope'])
+    if separated is None:
+        with stage('decode') as s:
+            y, sr = load_audio(file_path, sr=None)
+            s.arrays(y=y)
+        spectral = _separate(y, sr, analysis_sr, outputs, config)
+        memo.store('separate', {
+            'y_harmonic': spectral.y_harmonic,
+            'y_percussive': spectral.y_percussive,
+            'onset_envelope': spectral.onset_envelope,
+        }, {'sr': int(sr)})
+    else:
+        arrays, metadata = separated
+        sr = metadata['sr']
+        spectral = SpectralAnalysis(arrays.get('y_harmonic'), arrays.get('y_percussive'), arrays['onset_envelope'])
 
+    beats = memo.load('beat_track', ['beat_frames'])
+    if beats is None:
+        tempo, beat_frames = _track_beats(spectral.onset_envelope, sr, config)
+        memo.store('beat_track', {'beat_frames': beat_frames}, {'tempo': np.atleast_1d(tempo).tolist()})
+    else:
+        beat_frames, metadata = beats[0]['beat_frames'], beats[1]
+        tempo = np.array(metadata['tempo'])
 
-    # 3. Get beat tracking parameters from config and analyze rhythm
-    beat_tracker_params = config.get('beat_tracker', {})
-    tempo, beat_frames = librosa.beat.beat_track(
-        y=y_percussive, 
+    return AudioAnalysisResult(
+        y_percussive=spectral.y_percussive,
+        y_harmonic=spectral.y_harmonic,
+        tempo=tempo,
+        beat_frames=beat_frames,
         sr=sr,
-        **beat_tracker_params
     )
-    logger.info(f"Analysis complete. Detected Tempo: {np.mean(tempo):.2f} BPM.")
 
+def analyze_signal(
+    y: np.ndarray,
+    sr: int,
+    analysis_sr: Optional[int] = None,
+    outputs: Sequence[str] = ANALYSIS_OUTPUTS,
+    config: Optional[Config] = None,
+) -> AudioAnalysisResult:
+    """
+    Analyzes an already decoded signal, see ``analyze_audio``.
+
+    Args:
+        y: The mono audio time series.
+        sr: The sampling rate of the audio.
+        analysis_sr: See ``analyze_audio``.
+        outputs: See ``analyze_audio``.
+        config: See ``analyze_audio``.
+
+    Returns:
+        The AudioAnalysisResult of the signal.
+    """
+    config = config or get_config()
+    spectral = _separate(y, sr, analysis_sr, outputs, config)
+    tempo, beat_frames = _track_beats(spectral.onset_envelope, sr, config)
     return AudioAnalysisResult(
-        y_percussive=y_percussive,
-        y_harmonic=y_harmonic,
+        y_percussive=spectral.y_percussive,
+        y_harmonic=spectral.y_harmonic,
         tempo=tempo,
         beat_frames=beat_frames,
-        sr=sr
-    )
\ No newline at end of file
+        sr=sr,
+    )
+
+def _separate(
+    y: np.ndarray,
+    sr: int,
+    analysis_sr: Optional[int],
+    outputs: Sequence[str],
+    config: Config,
+) -> SpectralAnalysis:
+    # 2. Get HPSS parameters from config and perform separation
+    spectral = separate_with_onsets(
+        y,
+        sr,
+        hpss_params=config.get('hpss', {}),
+        outputs=outputs,
+        analysis_sr=analysis_sr or config.get('analysis.sample_rate'),
+    )
+    logger.info("Separated audio into harmonic and percussive components.")
+    return spectral
+
+def _track_beats(onset_envelope: np.ndarray, sr: int, config: Config):
+    # 3. Get beat tracking parameters from config and analyze rhythm
+    beat_tracker_params = config.get('beat_tracker', {})
+    with stage('beat_track') as s:
+        tempo, beat_frames = librosa.beat.beat_track(
+            onset_envelope=onset_envelope,
+            sr=sr,
+            hop_length=HOP_LENGTH,
+            **beat_tracker_params
+        )
+        s.arrays(beat_frames=beat_frames)
+    logger.info(f"Analysis complete. Detected Tempo: {np.mean(tempo):.2f} BPM.")
+    return tempo, beat_frames
@@ -0,0 +1,225 @@
+# src/rhythmslicer/audio_io.py
+
+import math
+import logging
+import librosa
+import numpy as np
+import soundfile as sf
+from typing import Iterator, Optional
+
+from .cache import AUDIO_DTYPE, load_audio
+from .export import wav_data_offset
+
+logger = logging.getLogger(__name__)
+
+# Containers whose frame count is exact and that support sample-accurate seeks.
+SEEKABLE_FORMATS = ('WAV', 'WAVEX', 'RF64', 'W64', 'FLAC', 'AIFF')
+
+# PCM subtypes whose samples can be memory-mapped, with their little-endian
+# dtype and the scale that maps them to [-1, 1) like libsndfile does.
+_MEMMAP_SUBTYPES = {
+    'PCM_16': ('<i2', 2.0 ** 15),
+    'PCM_32': ('<i4', 2.0 ** 31),
+    'FLOAT': ('<f4', 1.0),
+    'DOUBLE': ('<f8', 1.0),
+}
+
+# Extra output samples resampled on each side of a region read at another
+# rate, so the polyphase filter sees the same neighbourhood as it would when
+# resampling the whole signal.
+RESAMPLE_MARGIN = 256
+
+
+def as_audio(y: np.ndarray) -> np.ndarray:
+    """Returns ``y`` as a float32 array, copying only if it has another dtype."""
+    return np.asarray(y, dtype=AUDIO_DTYPE)
+
+
+def analysis_rate(sr: int, analysis_sr: Optional[int]) -> int:
+    """
+    Returns the sample rate to analyse a signal at.
+
+    Signals are only ever downsampled: ``analysis_sr`` is capped at the
+    native rate, and None keeps the native rate.
+
+    Args:
+        sr: The native sample rate.
+        analysis_sr: The requested analysis rate, or None.
+
+    Returns:
+        The analysis sample rate.
+    """
+    return sr if not analysis_sr else min(int(analysis_sr), sr)
+
+
+def resample(y: np.ndarray, orig_sr: int, target_sr: int) -> np.ndarray:
+    """Resamples a signal with a polyphase filter (``scipy.signal.resample_poly``)."""
+    if orig_sr == target_sr:
+        return y
+    return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr, res_type='polyphase')
+
+
+def resampled_length(n_samples: int, orig_sr: int, target_sr: int) -> int:
+    """Returns the length of a signal of ``n_samples`` after ``resample``."""
+    return int(math.ceil(n_samples * target_sr / orig_sr))
+
+
+class AudioSource:
+    """
+    Read-only, mono, float32 access to regions of an audio file.
+
+    The file is opened lazily in one of three ways:
+    - 16/32-bit PCM and float WAV files are memory-mapped.
+    - Other WAV, FLAC and AIFF files are read with seek-and-read.
+    - Anything else (e.g. MP3, whose frame count is only an estimate) is
+      decoded once with ``load_audio``.
+
+    An AudioSource behaves like the 1-D array ``load_audio`` would return:
+    ``len(source)`` is the number of samples and ``source[start:stop]``
+    reads just that region, downmixed to mono.
+
+    Example:
+        with AudioSource("long_recording.wav") as source:
+            segment = source[44100:88200]
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._samples: Optional[np.ndarray] = None
+        self._scale = 1.0
+        self._file: Optional[sf.SoundFile] = None
+        self._decoded: Optional[np.ndarray] = None
+
+        try:
+            info = sf.info(file_path)
+        except RuntimeError:
+            info = None
+
+        if info is not None and info.format in SEEKABLE_FORMATS:
+            self.samplerate = info.samplerate
+            self.channels = info.channels
+            self.frames = info.frames
+            if info.format in ('WAV', 'WAVEX') and info.subtype in _MEMMAP_SUBTYPES:
+                self._open_memmap(info)
+            if self._samples is None:
+                self._file = sf.SoundFile(file_path)
+        else:
+            logger.debug(f"Decoding {file_path} in full: format does not support exact seeks.")
+            self._decoded, self.samplerate = load_audio(file_path, sr=None)
+            self.channels = 1
+            self.frames = len(self._decoded)
+
+    def _open_memmap(self, info) -> None:
+        dtype, scale = _MEMMAP_SUBTYPES[info.subtype]
+        try:
+            offset = wav_data_offset(self.file_path)
+        except ValueError:  # e.g. a big-endian RIFX file
+            return
+        self._samples = np.memmap(
+            self.file_path, dtype=dtype, mode='r', offset=offset,
+            shape=(info.frames, info.channels),
+        )
+        self._scale = scale
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.samplerate
+
+    @property
+    def is_lazy(self) -> bool:
+        """Whether regions are read from disk on demand rather than held in memory."""
+        return self._decoded is None
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def __getitem__(self, key: slice) -> np.ndarray:
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("AudioSource only supports contiguous slices.")
+        start, stop, _ = key.indices(self.frames)
+        return self.read(start, stop)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """
+        Reads samples ``[start, stop)`` as a mono float32 array.
+
+        Args:
+            start: The first sample to read.
+            stop: One past the last sample to read. Clipped to the file length.
+
+        Returns:
+            The samples, downmixed to mono by averaging the channels.
+        """
+        start = max(0, int(start))
+        stop = max(start, min(int(stop), self.frames))
+        if self._decoded is not None:
+            return self._decoded[start:stop]
+        if self._samples is not None:
+            region = np.asarray(self._samples[start:stop], dtype=AUDIO_DTYPE)
+            if self._scale != 1.0:
+                region /= AUDIO_DTYPE(self._scale)
+        else:
+            self._file.seek(start)
+            region = self._file.read(stop - start, dtype='float32', always_2d=True)
+        return region.mean(axis=1, dtype=AUDIO_DTYPE) if self.channels > 1 else region[:, 0]
+
+    def read_resampled(self, start: int, stop: int, sr: int) -> np.ndarray:
+        """
+        Reads samples ``[start, stop)`` of the signal resampled to ``sr``.
+
+        Only the region and a small margin around it are read and resampled,
+        and the result equals the same region of ``resample`` applied to the
+        whole signal, up to floating-point error. Positions outside the
+        signal read as zeros.
+
+        Args:
+            start: The first sample to read, at the rate ``sr``.
+            stop: One past the last sample to read, at the rate ``sr``.
+            sr: The sample rate to read at.
+
+        Returns:
+            The mono float32 samples, of length ``stop - start``.
+        """
+        if sr == self.samplerate:
+            region = np.zeros(stop - start, dtype=AUDIO_DTYPE)
+            samples = self.read(start, stop)
+            offset = max(0, -start)
+            region[offset:offset + len(samples)] = samples
+            return region
+
+        # Output sample j of resample_poly lines up with input sample j * down / up,
+        # so reading from a multiple of 'up' keeps both grids aligned.
+        g = math.gcd(sr, self.samplerate)
+        up, down = sr // g, self.samplerate // g
+        first = (start - RESAMPLE_MARGIN) // up * up
+        last = -(-(stop + RESAMPLE_MARGIN) // up) * up
+        native_start, native_stop = first // up * down, last // up * down
+
+        native = np.zeros(native_stop - native_start, dtype=AUDIO_DTYPE)
+        samples = self.read(native_start, native_stop)
+        offset = max(0, -native_start)
+        native[offset:offset + len(samples)] = samples
+        region = resample(native, self.samplerate, sr)[start - first:stop - first]
+
+        # Zero the filter's ringing beyond either end of the resampled signal
+        region[:max(0, -start)] = 0
+        region[max(0, resampled_length(self.frames, self.samplerate, sr) - start):] = 0
+        return region
+
+    def blocks(self, block_size: int) -> Iterator[np.ndarray]:
+        """Yields consecutive mono blocks of at most ``block_size`` samples."""
+        for start in range(0, self.frames, block_size):
+            yield self.read(start, start + block_size)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._samples = None
+        self._decoded = None
+
+    def __enter__(self) -> "AudioSource":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,418 @@
+# src/rhythmslicer/batch.py
+
+import os
+import glob
+import json
+import time
+import logging
+import traceback
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .analysis import analyze_signal
+from .cache import load_audio
+from .config import Config, get_config, load_config
+from .journal import JobJournal, atomic_output_dir, input_hash, open_journal, params_hash, shard
+from .pipeline import EXPORT_FORMATS, export_analysis, run_slicing_pipeline
+from .staging import PipelineStage, run_staged
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.mp3', '.ogg', '.aiff', '.aif')
+
+
+@dataclass
+class BatchItemResult:
+    input_file: str
+    output_dir: str
+    status: str
+    tempo: Optional[float] = None
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def collect_inputs(specs: Iterable[str]) -> List[str]:
+    """
+    Expands directories, glob patterns and manifests into a list of audio files.
+
+    Each spec is interpreted as follows:
+    - A directory is searched recursively for audio files.
+    - A pattern containing '*', '?' or '[' is expanded with ``glob``
+      (``**`` matches nested directories).
+    - An existing file with an audio extension is used as-is.
+    - Any other existing file is read as a manifest with one path per line.
+      Blank lines and lines starting with '#' are ignored, and relative
+      paths are resolved against the manifest's directory.
+
+    Args:
+        specs: The directories, patterns, audio files or manifests.
+
+    Returns:
+        The audio file paths in order of first appearance, without duplicates.
+
+    Raises:
+        FileNotFoundError: If a spec matches nothing on disk.
+    """
+    found: List[str] = []
+    for spec in specs:
+        if os.path.isdir(spec):
+            for root, dirs, names in os.walk(spec):
+                dirs.sort()
+                found.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if name.lower().endswith(AUDIO_EXTENSIONS)
+                )
+        elif any(ch in spec for ch in '*?['):
+            found.extend(sorted(glob.glob(spec, recursive=True)))
+        elif spec.lower().endswith(AUDIO_EXTENSIONS):
+            found.append(spec)
+        elif os.path.isfile(spec):
+            base_dir = os.path.dirname(os.path.abspath(spec))
+            with open(spec, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        found.append(os.path.join(base_dir, line))
+        else:
+            raise FileNotFoundError(f"No such file, directory or manifest: {spec}")
+    return list(dict.fromkeys(found))
+
+
+def _init_worker(config_path: Optional[str], log_level: int) -> None:
+    """Loads the process default configuration (e.g. the cache settings) once per worker."""
+    logging.basicConfig(level=log_level, format="%(asctime)s - [%(levelname)s] - %(message)s")
+    if config_path:
+        load_config(config_path)
+
+
+def _process_one(input_file: str, output_dir: str, streaming: bool, config: Config) -> BatchItemResult:
+    """Runs the slicing pipeline on one file, capturing any failure."""
+    started = time.perf_counter()
+    try:
+        with atomic_output_dir(output_dir) as tmp_dir:
+            tempo = run_slicing_pipeline(input_file, tmp_dir, streaming=streaming, config=config)
+    except Exception as e:
+        logger.error(f"Failed to process {input_file}: {e}")
+        return BatchItemResult(
+            input_file=input_file,
+            output_dir=output_dir,
+            status='error',
+            seconds=time.perf_counter() - started,
+            error=''.join(traceback.format_exception_only(type(e), e)).strip(),
+        )
+    return BatchItemResult(
+        input_file=input_file,
+        output_dir=output_dir,
+        status='ok',
+        tempo=tempo,
+        seconds=time.perf_counter() - started,
+    )
+
+
+def _output_dirs(input_files: List[str], output_dir: str) -> List[str]:
+    """Gives every input its own sub-directory, disambiguating repeated names."""
+    seen = {}
+    dirs = []
+    for input_file in input_files:
+        stem = os.path.splitext(os.path.basename(input_file))[0]
+        seen[stem] = seen.get(stem, 0) + 1
+        name = stem if seen[stem] == 1 else f"{stem}_{seen[stem]}"
+        dirs.append(os.path.join(output_dir, name))
+    return dirs
+
+
+def _plan(
+    input_files: List[str],
+    output_dir: str,
+    shard_index: int,
+    shard_count: int,
+    journal: Optional[JobJournal],
+    config_hash: str,
+) -> Tuple[List[Tuple[str, str]], List[Optional[BatchItemResult]], List[str]]:
+    """
+    Picks the items of this shard and looks up those the journal records as done.
+
+    Output directories are assigned before sharding, so every node gives an
+    item the same directory.
+
+    Returns:
+        The (input file, output directory) items of the shard, the result of
+        every item that can be skipped (None for the others), and the input
+        hash of every item ('' without a journal).
+    """
+    items = shard(list(zip(input_files, _output_dirs(input_files, output_dir))), shard_index, shard_count)
+    skipped: List[Optional[BatchItemResult]] = [None] * len(items)
+    hashes = [''] * len(items)
+    if journal is None:
+        return items, skipped, hashes
+
+    for i, (input_file, item_dir) in enumerate(items):
+        try:
+            hashes[i] = input_hash(input_file)
+        except OSError:
+            continue  # the run records the error
+        job_id = os.path.relpath(item_dir, output_dir)
+        if os.path.isdir(item_dir) and journal.is_done(job_id, hashes[i], config_hash):
+            entry = journal.get(job_id)
+            skipped[i] = BatchItemResult(input_file, item_dir, 'skipped', tempo=entry.result.get('tempo'))
+    n_skipped = sum(r is not None for r in skipped)
+    if n_skipped:
+        logger.info(f"Skipping {n_skipped} file(s) already processed with the same input and configuration.")
+    return items, skipped, hashes
+
+
+def _record(
+    journal: Optional[JobJournal],
+    result: BatchItemResult,
+    output_dir: str,
+    in_hash: str,
+    config_hash: str,
+) -> None:
+    """Records the outcome of one item in the journal, if there is one."""
+    if journal is None:
+        return
+    job_id = os.path.relpath(result.output_dir, output_dir)
+    if result.status == 'ok':
+        journal.record(job_id, 'done', in_hash, config_hash, result={'tempo': result.tempo})
+    else:
+        journal.record(job_id, 'error', in_hash, config_hash, error=result.error)
+
+
+def report_file_name(shard_index: int = 0, shard_count: int = 1) -> str:
+    """Returns the name of the batch report, which is per shard when sharded."""
+    if shard_count == 1:
+        return 'batch_report.json'
+    return f'batch_report.shard-{shard_index}-of-{shard_count}.json'
+
+
+def run_batch(
+    input_files: List[str],
+    output_dir: str,
+    workers: Optional[int] = None,
+    streaming: bool = False,
+    config_path: Optional[str] = None,
+    journal_path: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    config: Optional[Config] = None,
+) -> List[BatchItemResult]:
+    """
+    Runs the slicing pipeline over many files in a pool of worker processes.
+
+    Each file is written to its own sub-directory of ``output_dir``, which
+    only appears once the file is fully processed. A failure on one file is
+    recorded in its result and does not stop the batch. A summary report is
+    written to ``<output_dir>/batch_report.json``.
+
+    With a journal, a restarted batch skips the files that were already
+    processed with the same content and configuration (status 'skipped').
+    With several shards, each node processes a disjoint part of the inputs
+    into the same ``output_dir`` and writes its own report.
+
+    Args:
+        input_files: The audio files to process, e.g. from ``collect_inputs``.
+        output_dir: The directory that receives one sub-directory per file.
+        workers: The number of worker processes. Defaults to the CPU count.
+        streaming: Use the block-streaming analysis for every file.
+        config_path: A configuration file to load in each worker.
+        journal_path: A SQLite job journal (see ``JobJournal``) to resume from
+            and record to. None processes every file.
+        shard_index: The shard of this node, from 0 to ``shard_count - 1``.
+        shard_count: The number of nodes sharing the batch.
+        config: The configuration every file is processed with. Defaults to
+            the contents of ``config_path`` if given, else ``get_config()``.
+
+    Returns:
+        One BatchItemResult per input file of the shard, in input order.
+    """
+    workers = workers or os.cpu_count() or 1
+    config = config or (Config.from_file(config_path) if config_path else get_config())
+    with open_journal(journal_path) as journal:
+        config_hash = params_hash(config=config.digest(), streaming=streaming)
+        items, results, hashes = _plan(input_files, output_dir, shard_index, shard_count, journal, config_hash)
+        pending = [i for i, result in enumerate(results) if result is None]
+        logger.info(f"Processing {len(pending)} file(s) with {workers} worker(s).")
+
+        started = time.perf_counter()
+        initargs = (config_path, logging.getLogger().level)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = {
+                pool.submit(_process_one, *items[i], streaming, config): i
+                for i in pending
+            }
+            # Journal every file as soon as it finishes, so an interrupted run keeps its progress
+            for future in as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:  # e.g. a worker process died
+                    results[i] = BatchItemResult(*items[i], 'error', error=repr(e))
+                _record(journal, results[i], output_dir, hashes[i], config_hash)
+        wall_seconds = time.perf_counter() - started
+
+    write_batch_report(results, output_dir, wall_seconds, workers, report_file_name(shard_index, shard_count))
+    return results
+
+
+def run_pipelined(
+    input_files: List[str],
+    output_dir: str,
+    compute_workers: Optional[int] = None,
+    write_workers: Optional[int] = None,
+    queue_size: Optional[int] = None,
+    export_format: Optional[str] = None,
+    journal_path: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    config: Optional[Config] = None,
+) -> List[BatchItemResult]:
+    """
+    Runs the slicing pipeline over many files with decoding, analysis and
+    export overlapping in one process.
+
+    One I/O thread decodes the next files while the compute threads analyze
+    the current ones, and a pool of writer threads exports finished results
+    in the background. The queues between the stages are bounded, so at most
+    a few decoded signals and analysis results are in memory at a time.
+    Outputs and the report are the same as for ``run_batch``.
+
+    Args:
+        input_files: The audio files to process, e.g. from ``collect_inputs``.
+        output_dir: The directory that receives one sub-directory per file.
+        compute_workers: Threads running the analysis. Defaults to the
+            'pipeline.compute_workers' config value.
+        write_workers: Threads exporting results. Defaults to the
+            'pipeline.write_workers' config value.
+        queue_size: Items held between two stages. Defaults to the
+            'pipeline.queue_size' config value.
+        export_format: 'wav' or 'container', see ``run_slicing_pipeline``.
+        journal_path: See ``run_batch``.
+        shard_index: See ``run_batch``.
+        shard_count: See ``run_batch``.
+        config: The configuration every file is processed with. Defaults to
+            ``get_config()``.
+
+    Returns:
+        One BatchItemResult per input file of the shard, in input order.
+    """
+    config = config or get_config()
+    compute_workers = compute_workers or config.get('pipeline.compute_workers', 1)
+    write_workers = write_workers or config.get('pipeline.write_workers', 2)
+    queue_size = queue_size or config.get('pipeline.queue_size', 2)
+    export_format = export_format or config.get('export.format', 'wav')
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of {EXPORT_FORMATS}.")
+    slice_table = config.get('export.slice_table', False)
+
+    with open_journal(journal_path) as journal:
+        config_hash = params_hash(config=config.digest(), export_format=export_format)
+        items, results, hashes = _plan(input_files, output_dir, shard_index, shard_count, journal, config_hash)
+        pending = [i for i, result in enumerate(results) if result is None]
+        hash_by_dir = {item_dir: in_hash for (_, item_dir), in_hash in zip(items, hashes)}
+        logger.info(
+            f"Processing {len(pending)} file(s) pipelined with {compute_workers} "
+            f"compute and {write_workers} writer thread(s)."
+        )
+
+        def decode(item):
+            input_file, item_dir = item
+            y, sr = load_audio(input_file, sr=None)
+            return item, y, sr
+
+        def analyze(decoded):
+            item, y, sr = decoded
+            return item, analyze_signal(y, sr, config=config)
+
+        def export(analyzed):
+            (input_file, item_dir), result = analyzed
+            base_filename = os.path.splitext(os.path.basename(input_file))[0]
+            with atomic_output_dir(item_dir) as tmp_dir:
+                export_analysis(result, tmp_dir, base_filename, export_format, slice_table, config)
+            tempo = float(np.mean(result.tempo))
+            _record(
+                journal, BatchItemResult(input_file, item_dir, 'ok', tempo),
+                output_dir, hash_by_dir[item_dir], config_hash,
+            )
+            return tempo
+
+        started = time.perf_counter()
+        staged = run_staged(
+            [items[i] for i in pending],
+            [
+                PipelineStage('decode', decode),
+                PipelineStage('analyze', analyze, workers=compute_workers),
+                PipelineStage('export', export, workers=write_workers),
+            ],
+            queue_size=queue_size,
+        )
+        wall_seconds = time.perf_counter() - started
+
+        for i, r in zip(pending, staged):
+            input_file, item_dir = r.item
+            results[i] = BatchItemResult(
+                input_file=input_file,
+                output_dir=item_dir,
+                status='ok' if r.error is None else 'error',
+                tempo=r.value,
+                seconds=sum(r.seconds.values()),
+                error=None if r.error is None else ''.join(
+                    traceback.format_exception_only(type(r.error), r.error)
+                ).strip(),
+            )
+            if r.error is not None:
+                _record(journal, results[i], output_dir, hashes[i], config_hash)
+
+    write_batch_report(
+        results, output_dir, wall_seconds, None, report_file_name(shard_index, shard_count),
+        pipeline={'compute_workers': compute_workers, 'write_workers': write_workers, 'queue_size': queue_size},
+    )
+    return results
+
+
+def write_batch_report(
+    results: List[BatchItemResult],
+    output_dir: str,
+    wall_seconds: float,
+    workers: Optional[int],
+    report_name: str = 'batch_report.json',
+    pipeline: Optional[Dict[str, int]] = None,
+) -> str:
+    """
+    Writes a JSON summary of a batch run.
+
+    The report's 'mode' is 'processes' for ``run_batch`` and 'pipelined'
+    for ``run_pipelined``. Only the former has worker processes, so
+    'workers' is null in pipelined mode and 'pipeline' holds the stage
+    layout instead.
+
+    Args:
+        results: The per-file results.
+        output_dir: The batch output directory.
+        wall_seconds: The total wall-clock time of the batch.
+        workers: The number of worker processes used, or None when pipelined.
+        report_name: The file name of the report, see ``report_file_name``.
+        pipeline: The 'compute_workers', 'write_workers' and 'queue_size'
+            of a pipelined run.
+
+    Returns:
+        The path of the report file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    report_path = os.path.join(output_dir, report_name)
+    report = {
+        'total': len(results),
+        'succeeded': sum(1 for r in results if r.status == 'ok'),
+        'skipped': sum(1 for r in results if r.status == 'skipped'),
+        'failed': sum(1 for r in results if r.status == 'error'),
+        'mode': 'processes' if pipeline is None else 'pipelined',
+        'workers': workers,
+        'pipeline': pipeline,
+        'wall_seconds': wall_seconds,
+        'items': [asdict(r) for r in results],
+    }
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Batch report written to {report_path}")
+    return report_path
@@ -0,0 +1,386 @@
+# src/rhythmslicer/cache.py
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import librosa
+import numpy as np
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "timbreswap")
+DEFAULT_MAX_SIZE_MB = 2048
+
+# Audio is decoded to, processed in and written from float32 in both packages.
+AUDIO_DTYPE = np.float32
+
+# Content digests keyed by (path, size, mtime), so a file is only hashed once
+# per process unless it changes on disk.
+_digest_memo: Dict[Tuple[str, int, int], str] = {}
+
+
+def file_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Computes a content hash of a file.
+
+    Args:
+        file_path: The path of the file to hash.
+        chunk_size: The number of bytes read per iteration.
+
+    Returns:
+        The hexadecimal BLAKE2b digest of the file contents.
+    """
+    real_path = os.path.realpath(file_path)
+    stat = os.stat(real_path)
+    memo_key = (real_path, stat.st_size, stat.st_mtime_ns)
+    if memo_key in _digest_memo:
+        return _digest_memo[memo_key]
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(real_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    _digest_memo[memo_key] = digest.hexdigest()
+    return _digest_memo[memo_key]
+
+
+def cache_key(file_path: str, kind: str, **params: Any) -> str:
+    """Builds the key of a cache entry, see ``FeatureCache.make_key``."""
+    param_blob = json.dumps(params, sort_keys=True, default=str).encode()
+    param_hash = hashlib.blake2b(param_blob, digest_size=8).hexdigest()
+    return f"{kind}-{file_digest(file_path)}-{param_hash}"
+
+
+class FeatureCache:
+    """
+    A content-addressed, size-bounded on-disk cache of NumPy arrays.
+
+    Each entry is stored as a ``.npy`` file with a JSON metadata sidecar and
+    is returned as a read-only memory map. Reading an entry refreshes its
+    modification time, and the least recently used entries are evicted once
+    the cache grows beyond ``max_bytes``.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, file_path: str, kind: str, **params: Any) -> str:
+        """
+        Builds a cache key from a file's contents, the entry kind and its parameters.
+
+        Args:
+            file_path: The input file the entry is derived from.
+            kind: A short label for the entry type, e.g. 'audio' or 'mfcc'.
+            **params: Every parameter that affects the cached array.
+
+        Returns:
+            A key that is safe to use as a file name.
+        """
+        return cache_key(file_path, kind, **params)
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.npy", f"{base}.json"
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+        """
+        Looks up an entry.
+
+        Args:
+            key: A key produced by ``make_key``.
+
+        Returns:
+            A (memory-mapped array, metadata) tuple, or None on a cache miss.
+        """
+        array_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as f:
+                metadata = json.load(f)
+            array = np.load(array_path, mmap_mode='r')
+            os.utime(array_path)
+        except (OSError, ValueError):
+            return None
+        logger.debug(f"Cache hit: {key}")
+        return array, metadata
+
+    def put(
+        self,
+        key: str,
+        array: np.ndarray,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        """
+        Stores an entry and evicts old entries if the cache is over budget.
+
+        Both files are written to temporary names and renamed into place, so
+        concurrent readers never observe a partially written entry.
+
+        Args:
+            key: A key produced by ``make_key``.
+            array: The array to store.
+            metadata: JSON-serialisable data stored alongside the array.
+
+        Returns:
+            The stored array, memory-mapped from the cache when possible.
+        """
+        array_path, meta_path = self._paths(key)
+        self._write_atomic(array_path, lambda f: np.save(f, np.ascontiguousarray(array)))
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(metadata or {}).encode()))
+        logger.debug(f"Cache store: {key}")
+
+        stored = np.load(array_path, mmap_mode='r')
+        self.evict()
+        return stored
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Tuple[np.ndarray, Dict[str, Any]]],
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        """
+        Returns a cached entry, computing and storing it on a miss.
+
+        Args:
+            key: A key produced by ``make_key``.
+            compute: A callable returning the (array, metadata) to store.
+
+        Returns:
+            An (array, metadata) tuple.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        array, metadata = compute()
+        return self.put(key, array, metadata), metadata
+
+    def _write_atomic(self, path: str, write: Callable[[Any], Any]) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def size_bytes(self) -> int:
+        """Returns the total size of all cache entries in bytes."""
+        return sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.npy'):
+                continue
+            array_path = os.path.join(self.cache_dir, name)
+            meta_path = array_path[:-4] + '.json'
+            try:
+                stat = os.stat(array_path)
+                size = stat.st_size
+                if os.path.exists(meta_path):
+                    size += os.path.getsize(meta_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, size, array_path))
+        return entries
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits its budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, array_path in entries:
+            if total <= self.max_bytes:
+                break
+            for path in (array_path, array_path[:-4] + '.json'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            logger.debug(f"Cache evict: {os.path.basename(array_path)}")
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(('.npy', '.json')):
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+class MemoryCache:
+    """
+    A thread-safe, size-bounded LRU cache of arrays held in memory.
+
+    It has the same interface as FeatureCache and can sit in front of one:
+    misses are looked up in the backing cache and copied into memory, and
+    new entries are stored in both. Used by long-running processes such as
+    ``rhythmslicer serve``, where the same sources are requested again and
+    again.
+    """
+
+    def __init__(self, max_bytes: int, backing: Optional[FeatureCache] = None):
+        self.max_bytes = max_bytes
+        self.backing = backing
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, Dict[str, Any]]]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, file_path: str, kind: str, **params: Any) -> str:
+        return cache_key(file_path, kind, **params)
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.backing is None:
+            return None
+        entry = self.backing.get(key)
+        if entry is None:
+            return None
+        return self._remember(key, np.array(entry[0]), entry[1])
+
+    def put(
+        self,
+        key: str,
+        array: np.ndarray,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        if self.backing is not None:
+            self.backing.put(key, array, metadata)
+        return self._remember(key, np.array(array), metadata or {})[0]
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Tuple[np.ndarray, Dict[str, Any]]],
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        array, metadata = compute()
+        return self.put(key, array, metadata), metadata
+
+    def _remember(
+        self,
+        key: str,
+        array: np.ndarray,
+        metadata: Dict[str, Any],
+    ) -> Tuple[np.ndarray, Dict[str, Any]]:
+        # Entries are shared between requests, so they must not be modified
+        array.flags.writeable = False
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[0].nbytes
+            self._entries[key] = (array, metadata)
+            self._nbytes += array.nbytes
+            while self._nbytes > self.max_bytes and len(self._entries) > 1:
+                evicted, (old, _) = self._entries.popitem(last=False)
+                self._nbytes -= old.nbytes
+                logger.debug(f"Memory cache evict: {evicted}")
+        return array, metadata
+
+    def size_bytes(self) -> int:
+        """Returns the total size of the arrays held in memory."""
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        """Removes every entry from memory and from the backing cache."""
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+        if self.backing is not None:
+            self.backing.clear()
+
+
+_default_cache: Optional[FeatureCache] = None
+_memory_cache: Optional[MemoryCache] = None
+
+
+def use_memory_cache(max_bytes: int) -> MemoryCache:
+    """
+    Puts an in-memory LRU cache in front of the process-wide cache.
+
+    From then on ``get_cache`` returns the MemoryCache, which is backed by
+    the on-disk cache if that is enabled.
+
+    Args:
+        max_bytes: The memory budget of the cached arrays.
+
+    Returns:
+        The installed MemoryCache.
+    """
+    global _memory_cache
+    _memory_cache = None
+    _memory_cache = MemoryCache(max_bytes, backing=get_cache())
+    return _memory_cache
+
+
+def get_cache() -> Optional[Union[FeatureCache, MemoryCache]]:
+    """
+    Returns the process-wide cache configured in the 'cache' section of the
+    process default configuration (``get_config``).
+
+    The ``TIMBRESWAP_CACHE_DIR`` environment variable takes precedence over
+    the configured directory.
+
+    Returns:
+        The MemoryCache installed by ``use_memory_cache`` if any, else the
+        shared FeatureCache, or None if caching is disabled.
+    """
+    global _default_cache
+    if _memory_cache is not None:
+        return _memory_cache
+    config = get_config()
+    if not config.get('cache.enabled', True):
+        return None
+    if _default_cache is None:
+        cache_dir = os.environ.get(
+            'TIMBRESWAP_CACHE_DIR', config.get('cache.dir', DEFAULT_CACHE_DIR)
+        )
+        max_size_mb = config.get('cache.max_size_mb', DEFAULT_MAX_SIZE_MB)
+        _default_cache = FeatureCache(cache_dir, int(max_size_mb * 1024 * 1024))
+    return _default_cache
+
+
+def load_audio(
+    file_path: str,
+    sr: Optional[int] = None,
+    cache: Optional[Union[FeatureCache, MemoryCache]] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    Decodes an audio file to mono, reusing a cached decode when available.
+
+    Args:
+        file_path: The path to the audio file.
+        sr: The target sample rate, or None to keep the native rate.
+        cache: The cache to use. Defaults to ``get_cache()``.
+
+    Returns:
+        A tuple of (waveform, sample_rate).
+    """
+    cache = cache or get_cache()
+    if cache is None:
+        return librosa.load(file_path, sr=sr, dtype=AUDIO_DTYPE)
+
+    def decode():
+        y, native_sr = librosa.load(file_path, sr=sr, dtype=AUDIO_DTYPE)
+        return y, {'sr': int(native_sr)}
+
+    key = cache.make_key(file_path, 'audio', sr=sr, mono=True)
+    y, metadata = cache.get_or_compute(key, decode)
+    return y, metadata['sr']
@@ -3,9 +3,12 @@
 import typer
 import logging
 from pathlib import Path
+from typing import List, Optional
 
-from .config import config
-from .pipeline import run_slicing_pipeline
+from .config import load_config
+
+# The pipeline modules pull in librosa, scipy and soundfile. They are imported
+# inside the commands that need them so that --help and argument errors stay fast.
 
 # Create a Typer application
 app = typer.Typer(
@@ -40,10 +43,11 @@ def main_callback(
     """
     setup_logging()
     try:
-        config.load_config(str(config_file))
+        load_config(str(config_file))
     except (FileNotFoundError, ValueError) as e:
         logging.error(f"Configuration Error: {e}")
         raise typer.Exit(code=1)
+    ctx.obj = {"config_file": str(config_file)}
 
 @app.command()
 def process(
@@ -60,16 +64,183 @@ def process(
         writable=True,
         resolve_path=True,
     ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Analyze block by block with bounded memory (for very long files).",
+    ),
+    block_size: Optional[int] = typer.Option(
+        None,
+        "--block-size",
+        help="Samples per block in streaming mode. Defaults to the config value.",
+    ),
+    export_format: Optional[str] = typer.Option(
+        None,
+        "--format",
+        help="'wav' for one file per slice, or 'container' for one percussive track plus a slice manifest. Defaults to the config value.",
+    ),
+    slice_table: Optional[bool] = typer.Option(
+        None,
+        "--slice-table/--no-slice-table",
+        help="Also write per-slice duration, RMS, spectral centroid and MFCC statistics to <name>_slice_features.npz. Defaults to the config value.",
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        help="Record per-stage timings and memory to profile.json and profile.trace.json (Chrome trace) in the output directory.",
+    ),
 ):
     """
     Analyzes, processes, and slices an audio file.
     """
+    from .pipeline import run_slicing_pipeline
+    from .profiling import profile_to
+
     try:
-        run_slicing_pipeline(str(input_file), str(output_dir))
+        with profile_to(str(output_dir) if profile else None):
+            run_slicing_pipeline(
+                str(input_file),
+                str(output_dir),
+                streaming=stream,
+                block_size=block_size,
+                export_format=export_format,
+                slice_table=slice_table,
+            )
         typer.secho("\nProcessing complete! ✅", fg=typer.colors.GREEN)
     except Exception as e:
         logging.error(f"An unexpected error occurred during processing: {e}", exc_info=True)
         raise typer.Exit(code=1)
 
+@app.command()
+def batch(
+    ctx: typer.Context,
+    inputs: List[str] = typer.Argument(
+        ...,
+        help="Audio files, directories, glob patterns (quoted) or manifest files listing one path per line.",
+    ),
+    output_dir: Path = typer.Option(
+        ...,
+        "--output",
+        "-o",
+        help="Directory that receives one sub-directory per input file.",
+        writable=True,
+        resolve_path=True,
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-j",
+        help="Number of worker processes (compute threads with --pipelined). Defaults to the number of CPUs.",
+    ),
+    stream: bool = typer.Option(
+        False,
+        "--stream",
+        help="Analyze every file block by block with bounded memory.",
+    ),
+    pipelined: bool = typer.Option(
+        False,
+        "--pipelined",
+        help="Overlap decoding, analysis and export in one process using bounded queues.",
+    ),
+    journal: Optional[Path] = typer.Option(
+        None,
+        "--journal",
+        help="SQLite job journal. Files already processed with the same content and configuration are skipped, so an interrupted batch can be resumed.",
+        resolve_path=True,
+    ),
+    shard: str = typer.Option(
+        "0/1",
+        "--shard",
+        help="Process only shard INDEX/COUNT of the inputs (e.g. 2/4), to split a batch across machines.",
+    ),
+):
+    """
+    Processes many audio files in parallel and writes a summary report.
+    """
+    from .batch import collect_inputs, report_file_name, run_batch, run_pipelined
+    from .journal import parse_shard
+
+    if pipelined and stream:
+        logging.error("--pipelined and --stream cannot be combined.")
+        raise typer.Exit(code=1)
+
+    try:
+        shard_index, shard_count = parse_shard(shard)
+        input_files = collect_inputs(inputs)
+    except (FileNotFoundError, ValueError) as e:
+        logging.error(str(e))
+        raise typer.Exit(code=1)
+    if not input_files:
+        logging.error("No audio files matched the given inputs.")
+        raise typer.Exit(code=1)
+
+    journal_path = str(journal) if journal else None
+    if pipelined:
+        results = run_pipelined(
+            input_files,
+            str(output_dir),
+            compute_workers=workers,
+            journal_path=journal_path,
+            shard_index=shard_index,
+            shard_count=shard_count,
+        )
+    else:
+        results = run_batch(
+            input_files,
+            str(output_dir),
+            workers=workers,
+            streaming=stream,
+            config_path=ctx.obj["config_file"],
+            journal_path=journal_path,
+            shard_index=shard_index,
+            shard_count=shard_count,
+        )
+    failed = [r for r in results if r.status == "error"]
+    for r in results:
+        tempo = f"{r.tempo:.2f} BPM" if r.tempo is not None else r.error
+        typer.echo(f"[{r.status}] {r.input_file} ({r.seconds:.1f}s): {tempo}")
+    typer.secho(
+        f"\n{len(results) - len(failed)}/{len(results)} file(s) processed. "
+        f"Report: {output_dir / report_file_name(shard_index, shard_count)}",
+        fg=typer.colors.RED if failed else typer.colors.GREEN,
+    )
+    if failed:
+        raise typer.Exit(code=1)
+
+@app.command()
+def serve(
+    host: str = typer.Option("127.0.0.1", "--host", help="Interface to listen on."),
+    port: int = typer.Option(8765, "--port", "-p", help="TCP port to listen on."),
+    socket_path: Optional[Path] = typer.Option(
+        None,
+        "--socket",
+        help="Listen on this Unix socket instead of TCP.",
+        resolve_path=True,
+    ),
+    workers: Optional[int] = typer.Option(
+        None,
+        "--workers",
+        "-j",
+        help="Requests processed concurrently. Defaults to the config value.",
+    ),
+    memory_cache_mb: Optional[float] = typer.Option(
+        None,
+        "--memory-cache-mb",
+        help="Memory budget for decoded audio and features kept between requests. Defaults to the config value.",
+    ),
+):
+    """
+    Runs the slicing and timbre matching pipelines as a local HTTP service.
+    """
+    from .service import serve as run_service
+
+    run_service(
+        host=host,
+        port=port,
+        socket_path=str(socket_path) if socket_path else None,
+        workers=workers,
+        memory_cache_mb=memory_cache_mb,
+    )
+
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -1,47 +1,131 @@
 # src/rhythmslicer/config.py
 
 import os
+import copy
+import json
 import yaml
+import hashlib
 import logging
-from typing import Any, Dict
+import threading
+from typing import Any, Dict, Mapping, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
-class AppConfig:
+DEFAULT_CONFIG_PATH = "config/defaults.yml"
+
+# Checks applied to the known settings: (accepted types, predicate, description).
+# Other keys are allowed, e.g. extra keyword arguments for librosa in 'hpss'
+# and 'beat_tracker'.
+_POSITIVE = (lambda v: v > 0, "a positive number")
+_NON_NEGATIVE = (lambda v: v >= 0, "a non-negative number")
+_RULES: Dict[str, Tuple[tuple, Any, str]] = {
+    'beat_tracker': ((dict,), None, "a mapping"),
+    'hpss': ((dict,), None, "a mapping"),
+    'analysis.sample_rate': ((int, type(None)), lambda v: v is None or v > 0, "a positive integer or null"),
+    'cache.enabled': ((bool,), None, "true or false"),
+    'cache.dir': ((str,), None, "a path"),
+    'cache.max_size_mb': ((int, float), *_POSITIVE),
+    'cache.stages': ((bool,), None, "true or false"),
+    'streaming.block_size': ((int,), *_POSITIVE),
+    'streaming.margin': ((int,), *_NON_NEGATIVE),
+    'streaming.crossfade': ((int,), *_NON_NEGATIVE),
+    'export.format': ((str,), lambda v: v in ('wav', 'container'), "'wav' or 'container'"),
+    'export.workers': ((int,), *_POSITIVE),
+    'export.slice_table': ((bool,), None, "true or false"),
+    'pipeline.compute_workers': ((int,), *_POSITIVE),
+    'pipeline.write_workers': ((int,), *_POSITIVE),
+    'pipeline.queue_size': ((int,), *_POSITIVE),
+    'service.workers': ((int,), *_POSITIVE),
+    'service.max_pending': ((int,), *_POSITIVE),
+    'service.memory_cache_mb': ((int, float), *_POSITIVE),
+    'timbrematcher.n_mfcc': ((int,), *_POSITIVE),
+    'timbrematcher.hop_ratio': ((int, float), lambda v: 0 < v <= 1, "a number in (0, 1]"),
+}
+
+_MISSING = object()
+
+
+def _lookup(data: Mapping[str, Any], key: str) -> Any:
+    value: Any = data
+    for k in key.split('.'):
+        if isinstance(value, dict) and k in value:
+            value = value[k]
+        else:
+            return _MISSING
+    return value
+
+
+def validate_config(data: Mapping[str, Any]) -> None:
     """
-    A singleton class to manage application configuration from a YAML file.
+    Checks the types and ranges of the known settings.
+
+    Args:
+        data: The nested configuration values.
+
+    Raises:
+        ValueError: If a setting has an invalid value.
     """
-    _instance = None
-    _config_data: Dict[str, Any] = {}
+    if not isinstance(data, dict):
+        raise ValueError("The configuration must be a mapping.")
+    for key, (types, check, description) in _RULES.items():
+        value = _lookup(data, key)
+        if value is _MISSING:
+            continue
+        # bool is a subclass of int, but 'true' is never a valid count
+        valid = isinstance(value, types) and (bool in types or not isinstance(value, bool))
+        if not valid or (check is not None and not check(value)):
+            raise ValueError(f"Invalid configuration value for '{key}': {value!r} (expected {description}).")
+
+
+class Config:
+    """
+    An immutable, validated set of configuration values.
+
+    A Config never changes after it is created, so one instance can be
+    shared between threads, and different instances can be used side by
+    side in one process, e.g. for a parameter sweep in a thread pool. The
+    pipeline and analysis functions take a Config argument; those called
+    without one use the process default from ``get_config``, which the
+    command-line tools load from ``config/defaults.yml``.
+
+    Example:
+        base = Config.from_file("config/defaults.yml")
+        tight = base.with_overrides({'beat_tracker.tightness': 400})
+        run_slicing_pipeline("song.wav", "output/tight", config=tight)
 
-    def __new__(cls):
-        if not cls._instance:
-            cls._instance = super(AppConfig, cls).__new__(cls)
-        return cls._instance
+    Args:
+        data: The nested configuration values, as read from the YAML file.
+            They are copied.
 
-    def load_config(self, config_path: str = "config/defaults.yml") -> None:
+    Raises:
+        ValueError: If a setting has an invalid value.
+    """
+
+    def __init__(self, data: Optional[Mapping[str, Any]] = None):
+        data = copy.deepcopy(dict(data or {}))
+        validate_config(data)
+        self._data = data
+        self._digest: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, config_path: str = DEFAULT_CONFIG_PATH) -> "Config":
         """
-        Loads configuration from a YAML file if not already loaded.
+        Loads a configuration from a YAML file.
 
-        Args:
-            config_path: The path to the configuration file.
-        
         Raises:
             FileNotFoundError: If the configuration file cannot be found.
-            ValueError: If there is an error parsing the YAML file.
+            ValueError: If the file cannot be parsed or has invalid values.
         """
-        if self._config_data:
-            return  # Prevent reloading
-
         if not os.path.exists(config_path):
             raise FileNotFoundError(f"Configuration file not found at: {config_path}")
 
         logger.info(f"Loading configuration from {config_path}")
         try:
             with open(config_path, 'r') as f:
-                self._config_data = yaml.safe_load(f)
+                data = yaml.safe_load(f)
         except yaml.YAMLError as e:
             raise ValueError(f"Error parsing YAML configuration file: {e}")
+        return cls(data)
 
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -54,16 +138,107 @@ class AppConfig:
             default: The default value to return if the key is not found.
 
         Returns:
-            The configuration value or the default.
+            The configuration value or the default. Mappings and lists are
+            returned as copies.
+        """
+        value = _lookup(self._data, key)
+        if value is _MISSING:
+            return default
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def with_overrides(self, overrides: Mapping[str, Any]) -> "Config":
+        """
+        Returns a copy of the configuration with some values replaced.
+
+        Args:
+            overrides: New values by dotted key, e.g.
+                ``{'hpss.margin': 2.0, 'analysis.sample_rate': None}``.
+
+        Returns:
+            A new Config. This one is unchanged.
+
+        Raises:
+            ValueError: If an override has an invalid value.
+        """
+        data = copy.deepcopy(self._data)
+        for key, value in overrides.items():
+            *parents, leaf = key.split('.')
+            node = data
+            for k in parents:
+                if not isinstance(node.get(k), dict):
+                    node[k] = {}
+                node = node[k]
+            node[leaf] = value
+        return Config(data)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a mutable copy of all values."""
+        return copy.deepcopy(self._data)
+
+    def digest(self) -> str:
         """
-        keys = key.split('.')
-        value = self._config_data
-        for k in keys:
-            if isinstance(value, dict) and k in value:
-                value = value[k]
-            else:
-                return default
-        return value
+        Returns a hash of the configuration.
+
+        Any change to a configuration value changes the hash, e.g. to tell
+        whether outputs were produced with the current settings.
+        """
+        if self._digest is None:
+            blob = json.dumps(self._data, sort_keys=True, default=str).encode()
+            self._digest = hashlib.blake2b(blob, digest_size=8).hexdigest()
+        return self._digest
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Config) and self._data == other._data
+
+    def __hash__(self) -> int:
+        return hash(self.digest())
+
+    def __repr__(self) -> str:
+        return f"Config({self._data!r})"
+
+
+_default_config = Config()
+_default_lock = threading.Lock()
+
+
+def get_config() -> Config:
+    """Returns the process default configuration, used when no Config is passed."""
+    return _default_config
+
+
+def set_config(new_config: Config) -> None:
+    """Replaces the process default configuration."""
+    global _default_config
+    with _default_lock:
+        _default_config = new_config
+
+
+def load_config(config_path: str = DEFAULT_CONFIG_PATH) -> Config:
+    """Loads a YAML file and makes it the process default configuration."""
+    loaded = Config.from_file(config_path)
+    set_config(loaded)
+    return loaded
+
+
+class AppConfig:
+    """
+    Reads and loads the process default configuration.
+
+    Kept for existing callers of ``config.get`` and ``config.load_config``;
+    new code should pass a Config explicitly or call ``get_config``.
+    """
+
+    def load_config(self, config_path: str = DEFAULT_CONFIG_PATH) -> None:
+        """Loads a YAML file as the process default, replacing any earlier one."""
+        load_config(config_path)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """See ``Config.get``."""
+        return get_config().get(key, default)
+
+    def digest(self) -> str:
+        """See ``Config.digest``."""
+        return get_config().digest()
 
 # Global instance to be imported by other modules
-config = AppConfig()
\ No newline at end of file
+config = AppConfig()
@@ -1,19 +1,29 @@
 # src/rhythmslicer/export.py
 
 import os
+import json
+import struct
 import soundfile as sf
 import numpy as np
 import logging
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .config import get_config
 
 logger = logging.getLogger(__name__)
 
+CONTAINER_FORMAT_VERSION = 1
+SLICE_TABLE_VERSION = 1
+DEFAULT_EXPORT_WORKERS = 4
+
 def save_processed_files(
     output_dir: str,
     base_filename: str,
     harmonic_track: np.ndarray,
     percussive_slices: List[np.ndarray],
-    sample_rate: int
+    sample_rate: int,
+    workers: Optional[int] = None,
 ):
     """
     Saves the harmonic track and all percussive slices to the output directory.
@@ -24,22 +34,266 @@ def save_processed_files(
         harmonic_track: The waveform of the harmonic component.
         percussive_slices: A list of waveforms for each percussive slice.
         sample_rate: The sample rate to use for saving the WAV files.
+        workers: The number of threads writing slices. Defaults to the
+            'export.workers' config value.
     """
     logger.info(f"Exporting files to directory: {output_dir}")
-    os.makedirs(output_dir, exist_ok=True)
 
     # Save the full-length harmonic track
-    harmonic_path = os.path.join(output_dir, f"{base_filename}_harmonic.wav")
-    sf.write(harmonic_path, harmonic_track, sample_rate)
-    logger.info(f"Successfully saved harmonic track: {harmonic_path}")
+    save_harmonic_track(output_dir, base_filename, harmonic_track, sample_rate)
 
     # Create a subdirectory for the slices
     slices_dir = os.path.join(output_dir, "percussive_slices")
     os.makedirs(slices_dir, exist_ok=True)
 
-    # Save each percussive slice as a separate file
-    for i, audio_slice in enumerate(percussive_slices):
-        slice_path = os.path.join(slices_dir, f"{base_filename}_slice_{i+1:03d}.wav")
-        sf.write(slice_path, audio_slice, sample_rate)
+    # Save each percussive slice as a separate file. libsndfile releases the
+    # GIL while encoding, so a small thread pool overlaps the file writes.
+    def write_slice(i: int) -> None:
+        slice_path = os.path.join(slices_dir, slice_file_name(base_filename, i))
+        sf.write(slice_path, percussive_slices[i], sample_rate)
+
+    workers = workers or get_config().get('export.workers', DEFAULT_EXPORT_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(write_slice, range(len(percussive_slices))))
+
+    logger.info(f"Successfully saved {len(percussive_slices)} slices to '{slices_dir}'.")
+
+def save_slices_from_file(
+    output_dir: str,
+    base_filename: str,
+    percussive_path: str,
+    slice_points: np.ndarray,
+):
+    """
+    Saves percussive slices by reading each one from an audio file on disk.
+
+    Only one slice is held in memory at a time, which keeps streaming runs
+    bounded regardless of the length of the source.
+
+    Args:
+        output_dir: The directory where all files will be saved.
+        base_filename: The original name of the file, used for naming outputs.
+        percussive_path: The audio file holding the full percussive track.
+        slice_points: Sample boundaries of the slices, as returned by
+            ``beat_slice_points``.
+    """
+    slices_dir = os.path.join(output_dir, "percussive_slices")
+    os.makedirs(slices_dir, exist_ok=True)
+
+    with sf.SoundFile(percussive_path) as percussive:
+        for i in range(len(slice_points) - 1):
+            percussive.seek(int(slice_points[i]))
+            audio_slice = percussive.read(int(slice_points[i+1] - slice_points[i]), dtype='float32')
+            slice_path = os.path.join(slices_dir, slice_file_name(base_filename, i))
+            sf.write(slice_path, audio_slice, percussive.samplerate)
+
+    logger.info(f"Successfully saved {len(slice_points) - 1} slices to '{slices_dir}'.")
+
+def save_harmonic_track(
+    output_dir: str,
+    base_filename: str,
+    harmonic_track: np.ndarray,
+    sample_rate: int,
+) -> str:
+    """
+    Saves only the full-length harmonic track.
+
+    Args:
+        output_dir: The directory where the file will be saved.
+        base_filename: The original name of the file, used for naming outputs.
+        harmonic_track: The waveform of the harmonic component.
+        sample_rate: The sample rate to use for saving the WAV file.
+
+    Returns:
+        The path of the written file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    harmonic_path = os.path.join(output_dir, f"{base_filename}_harmonic.wav")
+    sf.write(harmonic_path, harmonic_track, sample_rate)
+    logger.info(f"Successfully saved harmonic track: {harmonic_path}")
+    return harmonic_path
+
+def save_slice_container(
+    output_dir: str,
+    base_filename: str,
+    percussive_track: np.ndarray,
+    slice_points: np.ndarray,
+    sample_rate: int,
+) -> str:
+    """
+    Saves the percussive track once, with a manifest of the slice boundaries.
+
+    This replaces one WAV file per slice with two files: a 32-bit float WAV
+    of the whole percussive track and a JSON manifest of sample offsets.
+    Use ``load_slices`` to read the slices back without copying.
+
+    Args:
+        output_dir: The directory where the files will be saved.
+        base_filename: The original name of the file, used for naming outputs.
+        percussive_track: The waveform of the percussive component.
+        slice_points: Sample boundaries of the slices, as returned by
+            ``beat_slice_points``.
+        sample_rate: The sample rate of the percussive track.
 
-    logger.info(f"Successfully saved {len(percussive_slices)} slices to '{slices_dir}'.")
\ No newline at end of file
+    Returns:
+        The path of the manifest file.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    audio_path = os.path.join(output_dir, f"{base_filename}_percussive.wav")
+    sf.write(audio_path, percussive_track, sample_rate, subtype='FLOAT')
+    return write_slice_manifest(output_dir, base_filename, audio_path, slice_points, sample_rate)
+
+def write_slice_manifest(
+    output_dir: str,
+    base_filename: str,
+    audio_path: str,
+    slice_points: np.ndarray,
+    sample_rate: int,
+) -> str:
+    """
+    Writes the JSON manifest describing the slices of a 32-bit float WAV file.
+
+    Args:
+        output_dir: The directory where the manifest will be saved.
+        base_filename: The original name of the file, used for naming outputs.
+        audio_path: The 32-bit float mono WAV holding the percussive track.
+        slice_points: Sample boundaries of the slices.
+        sample_rate: The sample rate of the percussive track.
+
+    Returns:
+        The path of the manifest file.
+    """
+    manifest = {
+        'format_version': CONTAINER_FORMAT_VERSION,
+        'audio_file': os.path.basename(audio_path),
+        'sample_rate': int(sample_rate),
+        'dtype': 'float32',
+        'data_offset': wav_data_offset(audio_path),
+        'n_samples': int(sf.info(audio_path).frames),
+        'slice_points': [int(p) for p in slice_points],
+    }
+    manifest_path = os.path.join(output_dir, f"{base_filename}_slices.json")
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+    logger.info(f"Successfully saved {len(slice_points) - 1} slice offsets to '{manifest_path}'.")
+    return manifest_path
+
+def load_slices(manifest_path: str) -> List[np.ndarray]:
+    """
+    Reads the slices described by a manifest written by ``save_slice_container``.
+
+    The audio data is memory-mapped, so every slice is a read-only view into
+    the file and no samples are copied until they are used.
+
+    Args:
+        manifest_path: The path of the JSON manifest.
+
+    Returns:
+        A list of float32 views, one per slice.
+
+    Raises:
+        ValueError: If the manifest was written by an incompatible version.
+    """
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    if manifest.get('format_version') != CONTAINER_FORMAT_VERSION:
+        raise ValueError(f"Unsupported slice manifest version: {manifest.get('format_version')}")
+
+    audio_path = os.path.join(os.path.dirname(manifest_path), manifest['audio_file'])
+    samples = np.memmap(
+        audio_path,
+        dtype=np.dtype(manifest['dtype']).newbyteorder('<'),
+        mode='r',
+        offset=manifest['data_offset'],
+        shape=(manifest['n_samples'],),
+    )
+    points = manifest['slice_points']
+    return [samples[points[i]:points[i+1]] for i in range(len(points) - 1)]
+
+def save_slice_table(
+    output_dir: str,
+    base_filename: str,
+    features: Dict[str, np.ndarray],
+    sample_rate: int,
+    slice_files: Optional[List[str]] = None,
+) -> str:
+    """
+    Saves per-slice descriptors as one columnar NPZ table.
+
+    Args:
+        output_dir: The directory where the table will be saved.
+        base_filename: The original name of the file, used for naming outputs.
+        features: Columns with one row per slice, as returned by
+            ``slice_features``.
+        sample_rate: The sample rate the slice boundaries refer to.
+        slice_files: The file of every slice, relative to ``output_dir``,
+            when the slices were written as separate files.
+
+    Returns:
+        The path of the table, ``<base_filename>_slice_features.npz``.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    table_path = os.path.join(output_dir, f"{base_filename}_slice_features.npz")
+    columns = dict(features)
+    if slice_files is not None:
+        columns['slice_file'] = np.array(slice_files, dtype=str)
+    np.savez(
+        table_path,
+        format_version=np.array(SLICE_TABLE_VERSION),
+        sample_rate=np.array(int(sample_rate)),
+        **columns,
+    )
+    logger.info(f"Successfully saved features of {len(features['start'])} slices to '{table_path}'.")
+    return table_path
+
+def load_slice_table(table_path: str) -> Dict[str, np.ndarray]:
+    """
+    Reads a table written by ``save_slice_table``.
+
+    Args:
+        table_path: The path of the NPZ table.
+
+    Returns:
+        The columns by name. 'format_version' and 'sample_rate' are
+        returned as Python ints.
+
+    Raises:
+        ValueError: If the table was written by an incompatible version.
+    """
+    with np.load(table_path, allow_pickle=False) as data:
+        table = {name: data[name] for name in data.files}
+    table['format_version'] = int(table['format_version'])
+    table['sample_rate'] = int(table['sample_rate'])
+    if table['format_version'] != SLICE_TABLE_VERSION:
+        raise ValueError(f"Unsupported slice table version: {table['format_version']}")
+    return table
+
+def slice_file_name(base_filename: str, index: int) -> str:
+    """Returns the file name ``save_processed_files`` gives to a slice (0-based index)."""
+    return f"{base_filename}_slice_{index+1:03d}.wav"
+
+def wav_data_offset(path: str) -> int:
+    """
+    Finds the byte offset of the sample data in a RIFF/WAVE file.
+
+    Args:
+        path: The path of the WAV file.
+
+    Returns:
+        The offset of the first byte of the 'data' chunk payload.
+
+    Raises:
+        ValueError: If the file is not a WAV file or has no 'data' chunk.
+    """
+    with open(path, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"Not a RIFF/WAVE file: {path}")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No 'data' chunk found in: {path}")
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'data':
+                return f.tell()
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
@@ -0,0 +1,252 @@
+# src/rhythmslicer/journal.py
+
+import os
+import json
+import time
+import glob
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Any, ContextManager, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from .cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_hash TEXT NOT NULL,
+    config_hash TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+@dataclass
+class JournalEntry:
+    job_id: str
+    status: str
+    input_hash: str
+    config_hash: str
+    result: Any = None
+    error: Optional[str] = None
+    updated_at: float = 0.0
+
+
+def input_hash(*file_paths: str) -> str:
+    """Returns a hash of the contents of the input files of a job."""
+    digest = hashlib.blake2b(digest_size=16)
+    for file_path in file_paths:
+        digest.update(file_digest(file_path).encode())
+    return digest.hexdigest()
+
+
+def params_hash(**params: Any) -> str:
+    """Returns a hash of the parameters of a job, e.g. ``config.digest()`` and its arguments."""
+    blob = json.dumps(params, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(blob, digest_size=8).hexdigest()
+
+
+class JobJournal:
+    """
+    Records the outcome of every job of a batch in a local SQLite database.
+
+    A job is identified by a name that is stable across runs (e.g. its
+    output sub-directory), and is recorded with the hash of its input files
+    and of the configuration it ran with. A job counts as done only while
+    both hashes are unchanged, so a restarted batch skips finished jobs but
+    re-runs those whose input or settings changed.
+
+    Every update is committed immediately, so a run that is killed loses at
+    most the jobs that were in progress. Keep the journal on a local disk:
+    when a batch is sharded, every node should use its own journal.
+
+    Example:
+        with JobJournal("output/journal.sqlite") as journal:
+            if not journal.is_done(job_id, in_hash, cfg_hash):
+                ...
+                journal.record(job_id, 'done', in_hash, cfg_hash, result={'tempo': 120.0})
+
+    Args:
+        path: The database file. It is created if it does not exist.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(_SCHEMA)
+
+    def get(self, job_id: str) -> Optional[JournalEntry]:
+        """Returns the last recorded outcome of a job, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, status, input_hash, config_hash, result, error, updated_at "
+                "FROM jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        return None if row is None else _to_entry(row)
+
+    def is_done(self, job_id: str, input_hash: str, config_hash: str) -> bool:
+        """Whether a job finished successfully with the same inputs and configuration."""
+        entry = self.get(job_id)
+        return (
+            entry is not None
+            and entry.status == 'done'
+            and entry.input_hash == input_hash
+            and entry.config_hash == config_hash
+        )
+
+    def record(
+        self,
+        job_id: str,
+        status: str,
+        input_hash: str,
+        config_hash: str,
+        result: Any = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """
+        Records the outcome of a job, replacing any earlier outcome.
+
+        Args:
+            job_id: The job name.
+            status: 'done' or 'error'.
+            input_hash: See ``input_hash``.
+            config_hash: See ``params_hash``.
+            result: A JSON-serialisable result, returned to skipped runs.
+            error: The error message of a failed job.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, status, input_hash, config_hash, json.dumps(result), error, time.time()),
+            )
+
+    def entries(self) -> List[JournalEntry]:
+        """Returns every recorded job, ordered by job name."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT job_id, status, input_hash, config_hash, result, error, updated_at "
+                "FROM jobs ORDER BY job_id"
+            ).fetchall()
+        return [_to_entry(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self) -> "JobJournal":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def open_journal(path: Optional[str]) -> ContextManager[Optional[JobJournal]]:
+    """
+    Opens a journal for the duration of a ``with`` block, which closes it
+    even if the batch fails. Without a path the block gets None.
+    """
+    return JobJournal(path) if path else nullcontext()
+
+
+def _to_entry(row: tuple) -> JournalEntry:
+    job_id, status, in_hash, cfg_hash, result, error, updated_at = row
+    return JournalEntry(job_id, status, in_hash, cfg_hash, json.loads(result) if result else None, error, updated_at)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parses a shard given as 'INDEX/COUNT', e.g. '2/4' for the third of four shards.
+
+    Raises:
+        ValueError: If the spec is malformed or the index is out of range.
+    """
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}'. Expected INDEX/COUNT, e.g. 0/4.")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}': the index must be in [0, {count}).")
+    return index, count
+
+
+def shard(items: Sequence[T], shard_index: int = 0, shard_count: int = 1) -> List[T]:
+    """
+    Returns the items assigned to one shard of a batch.
+
+    Items are dealt out round-robin in manifest order, so the shards are
+    disjoint, together cover every item, and differ in size by at most one.
+    Every node must see the items in the same order.
+
+    Args:
+        items: The items of the whole batch.
+        shard_index: The shard of this node, from 0 to ``shard_count - 1``.
+        shard_count: The number of shards.
+
+    Returns:
+        Every ``shard_count``-th item, starting at ``shard_index``.
+    """
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {shard_index}/{shard_count}.")
+    return list(items[shard_index::shard_count])
+
+
+@contextmanager
+def atomic_output_dir(output_dir: str) -> Iterator[str]:
+    """
+    Lets a job write its outputs to a temporary directory that replaces
+    ``output_dir`` only when the job succeeds.
+
+    The temporary directory is a hidden sibling of ``output_dir``, so the
+    final rename stays on one file system. An interrupted job therefore never
+    leaves partial outputs in ``output_dir``; its temporary directory is
+    removed on failure, or by the next attempt if the process was killed.
+
+    Example:
+        with atomic_output_dir("output/song") as tmp_dir:
+            run_slicing_pipeline("song.wav", tmp_dir)
+
+    Args:
+        output_dir: The final directory of the job's outputs.
+
+    Yields:
+        The temporary directory to write to.
+    """
+    output_dir = os.path.abspath(output_dir)
+    parent, name = os.path.split(output_dir)
+    os.makedirs(parent, exist_ok=True)
+    for stale in glob.glob(os.path.join(parent, f".{glob.escape(name)}.*.tmp")):
+        if '.' not in os.path.basename(stale)[len(name) + 2:-len('.tmp')]:
+            logger.info(f"Removing partial outputs of an interrupted run: {stale}")
+            shutil.rmtree(stale, ignore_errors=True)
+
+    tmp_dir = tempfile.mkdtemp(prefix=f".{name}.", suffix='.tmp', dir=parent)
+    try:
+        yield tmp_dir
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    # Move the previous outputs aside first, since a directory cannot be
+    # renamed over a non-empty one
+    old_dir = None
+    if os.path.exists(output_dir):
+        old_dir = tempfile.mkdtemp(prefix=f".{name}.", suffix='.tmp', dir=parent)
+        os.rename(output_dir, os.path.join(old_dir, name))
+    os.rename(tmp_dir, output_dir)
+    if old_dir is not None:
+        shutil.rmtree(old_dir, ignore_errors=True)
@@ -0,0 +1,158 @@
+# src/rhythmslicer/memo.py
+
+import logging
+import numpy as np
+from dataclasses import dataclass
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+from .cache import FeatureCache, MemoryCache
+from .config import Config, get_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StageNode:
+    """
+    A memoizable stage of a pipeline.
+
+    Args:
+        name: The stage name.
+        config_keys: The config keys the stage reads itself.
+        inputs: The stages whose outputs it consumes.
+        version: Bumped whenever a code change alters the stage's output,
+            which invalidates its memoized results and those downstream.
+    """
+    name: str
+    config_keys: Tuple[str, ...] = ()
+    inputs: Tuple[str, ...] = ()
+    version: int = 1
+
+
+# The analysis stages of the slicing pipeline. Slicing and export follow
+# beat tracking but are not memoized: they only cut and write the arrays.
+SLICING_STAGES: Dict[str, StageNode] = {
+    node.name: node for node in (
+        StageNode('decode'),
+        StageNode('separate', config_keys=('hpss', 'analysis.sample_rate'), inputs=('decode',)),
+        StageNode('beat_track', config_keys=('beat_tracker',), inputs=('separate',)),
+    )
+}
+
+
+def stage_params(
+    name: str,
+    stages: Mapping[str, StageNode] = SLICING_STAGES,
+    overrides: Optional[Mapping[str, Any]] = None,
+    config: Optional[Config] = None,
+) -> Dict[str, Any]:
+    """
+    Collects the config values a stage depends on, including through its inputs.
+
+    Args:
+        name: The stage name.
+        stages: The stage graph.
+        overrides: Values that take precedence over the config, e.g. from
+            function arguments. None values are ignored.
+        config: The configuration the stage runs with. Defaults to
+            ``get_config()``.
+
+    Returns:
+        A flat mapping of config key to value, plus the version of every
+        stage involved.
+    """
+    config = config or get_config()
+    node = stages[name]
+    params: Dict[str, Any] = {}
+    for upstream in node.inputs:
+        params.update(stage_params(upstream, stages, overrides, config))
+    for key in node.config_keys:
+        value = (overrides or {}).get(key)
+        params[key] = config.get(key) if value is None else value
+    params[f'{name}.version'] = node.version
+    return params
+
+
+class StageMemo:
+    """
+    Memoizes the outputs of pipeline stages for one input file.
+
+    Each output array is stored in the feature cache under a key made of the
+    file's content hash and ``stage_params`` of its stage. Changing a config
+    value therefore only invalidates the stages that read it and the stages
+    downstream of them: tuning 'beat_tracker' reuses the separation, while
+    changing 'hpss' re-runs both.
+
+    Args:
+        cache: The cache to store the outputs in.
+        file_path: The input file of the pipeline.
+        stages: The stage graph.
+        overrides: See ``stage_params``.
+        config: The configuration the stages run with. Defaults to
+            ``get_config()``.
+    """
+
+    def __init__(
+        self,
+        cache: Union[FeatureCache, MemoryCache],
+        file_path: str,
+        stages: Mapping[str, StageNode] = SLICING_STAGES,
+        overrides: Optional[Mapping[str, Any]] = None,
+        config: Optional[Config] = None,
+    ):
+        self.cache = cache
+        self.file_path = file_path
+        self.stages = stages
+        self.overrides = overrides
+        self.config = config or get_config()
+
+    def key(self, name: str, output: str) -> str:
+        """Returns the cache key of one output of a stage."""
+        return self.cache.make_key(
+            self.file_path, f"{name}.{output}",
+            **stage_params(name, self.stages, self.overrides, self.config),
+        )
+
+    def load(
+        self,
+        name: str,
+        outputs: Sequence[str],
+    ) -> Optional[Tuple[Dict[str, np.ndarray], Dict[str, Any]]]:
+        """
+        Looks up the memoized outputs of a stage.
+
+        Args:
+            name: The stage name.
+            outputs: The output names that are needed.
+
+        Returns:
+            A tuple of (arrays by output name, metadata), or None unless every
+            requested output is memoized.
+        """
+        arrays: Dict[str, np.ndarray] = {}
+        metadata: Dict[str, Any] = {}
+        for output in outputs:
+            entry = self.cache.get(self.key(name, output))
+            if entry is None:
+                return None
+            arrays[output], metadata = entry
+        logger.info(f"Reusing memoized '{name}' stage for {self.file_path}.")
+        return arrays, metadata
+
+    def store(
+        self,
+        name: str,
+        arrays: Mapping[str, Optional[np.ndarray]],
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Memoizes the outputs of a stage. None values are skipped.
+
+        Args:
+            name: The stage name.
+            arrays: The outputs by name.
+            metadata: JSON-serialisable data stored with every output.
+        """
+        for output, array in arrays.items():
+            if array is not None:
+                self.cache.put(self.key(name, output), array, metadata)
@@ -3,42 +3,188 @@
 import os
 import logging
 import numpy as np
+from typing import Optional
 
-from .analysis import analyze_audio
-from .processing import slice_audio_on_beats
-from .export import save_processed_files
+from .analysis import AudioAnalysisResult, analyze_audio
+from .config import Config, get_config
+from .profiling import stage
+from .processing import beat_slice_points, slice_audio_on_beats, slice_features
+from .export import (
+    DEFAULT_EXPORT_WORKERS,
+    save_harmonic_track,
+    save_processed_files,
+    save_slice_container,
+    save_slice_table,
+    save_slices_from_file,
+    slice_file_name,
+    write_slice_manifest,
+)
+from .streaming import analyze_audio_streaming
 
 logger = logging.getLogger(__name__)
 
-def run_slicing_pipeline(input_file: str, output_dir: str):
+EXPORT_FORMATS = ('wav', 'container')
+
+def run_slicing_pipeline(
+    input_file: str,
+    output_dir: str,
+    streaming: bool = False,
+    block_size: Optional[int] = None,
+    export_format: Optional[str] = None,
+    slice_table: Optional[bool] = None,
+    config: Optional[Config] = None,
+) -> float:
     """
     Executes the full audio analysis, processing, and exporting pipeline.
 
     Args:
         input_file: The path to the source audio file.
         output_dir: The path to the directory where results will be saved.
+        streaming: Analyze the file block by block with bounded memory,
+            writing outputs to disk as they are produced.
+        block_size: Samples per block in streaming mode. Defaults to the
+            'streaming.block_size' config value.
+        export_format: 'wav' to write one WAV file per slice, or 'container'
+            to write the percussive track once with a JSON manifest of slice
+            offsets. Defaults to the 'export.format' config value.
+        slice_table: Also write the duration, RMS, spectral centroid and
+            MFCC statistics of every slice to ``<name>_slice_features.npz``.
+            Not available in streaming mode. Defaults to the
+            'export.slice_table' config value.
+        config: The configuration of the run, see ``rhythmslicer.config.Config``.
+            Defaults to ``get_config()``.
+
+    Returns:
+        The average detected tempo in BPM.
     """
+    config = config or get_config()
+    export_format = export_format or config.get('export.format', 'wav')
+    if slice_table is None:
+        slice_table = config.get('export.slice_table', False)
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format '{export_format}'. Expected one of {EXPORT_FORMATS}.")
+
     logger.info("--- RhythmSlicer Pipeline Started ---")
+    base_filename = os.path.splitext(os.path.basename(input_file))[0]
 
-    # 1. Analyze the audio. This now returns a single 'AudioAnalysisResult' object.
-    analysis_result = analyze_audio(input_file)
+    with stage('run_slicing_pipeline'):
+        if streaming:
+            if slice_table:
+                logger.warning("Slice feature tables are not written in streaming mode.")
+            tempo = _run_streaming(input_file, output_dir, base_filename, block_size, export_format, config)
+        else:
+            # 1. Analyze the audio. This now returns a single 'AudioAnalysisResult' object.
+            analysis_result = analyze_audio(input_file, config=config)
 
-    # 2. Process the percussive component by accessing the object's attributes.
-    percussive_slices = slice_audio_on_beats(
-        waveform=analysis_result.y_percussive, 
-        beat_frames=analysis_result.beat_frames
-    )
-
-    # 3. Export all the resulting audio files using attributes from the result object.
-    base_filename = os.path.splitext(os.path.basename(input_file))[0]
-    save_processed_files(
-        output_dir=output_dir,
-        base_filename=base_filename,
-        harmonic_track=analysis_result.y_harmonic,
-        percussive_slices=percussive_slices,
-        sample_rate=analysis_result.sr
-    )
+            # 2-3. Slice the percussive component and export the results.
+            export_analysis(analysis_result, output_dir, base_filename, export_format, slice_table, config)
+            tempo = analysis_result.tempo
 
     logger.info(f"--- RhythmSlicer Pipeline Finished for {input_file} ---")
-    print(f"\nAverage Tempo: {np.mean(analysis_result.tempo):.2f} BPM")
-    print(f"Output files saved in: {output_dir}")
\ No newline at end of file
+    print(f"\nAverage Tempo: {np.mean(tempo):.2f} BPM")
+    print(f"Output files saved in: {output_dir}")
+    return float(np.mean(tempo))
+
+def export_analysis(
+    analysis_result: AudioAnalysisResult,
+    output_dir: str,
+    base_filename: str,
+    export_format: str,
+    slice_table: bool = False,
+    config: Optional[Config] = None,
+) -> None:
+    """
+    Slices the percussive component on the beats and writes all outputs.
+
+    Args:
+        analysis_result: The result of ``analyze_audio`` or ``analyze_signal``.
+        output_dir: The path to the directory where results will be saved.
+        base_filename: The name used for the output files.
+        export_format: 'wav' or 'container', see ``run_slicing_pipeline``.
+        slice_table: Also write the per-slice feature table.
+        config: Provides the 'export.workers' setting. Defaults to ``get_config()``.
+    """
+    config = config or get_config()
+    if slice_table:
+        slice_points = beat_slice_points(analysis_result.beat_frames, len(analysis_result.y_percussive))
+        with stage('slice_features') as s:
+            features = slice_features(analysis_result.y_percussive, slice_points, analysis_result.sr)
+            s.arrays(fingerprint=features['fingerprint'])
+        slice_files = None
+        if export_format == 'wav':
+            slice_files = [
+                os.path.join("percussive_slices", slice_file_name(base_filename, i))
+                for i in range(len(slice_points) - 1)
+            ]
+        save_slice_table(output_dir, base_filename, features, analysis_result.sr, slice_files)
+
+    if export_format == 'container':
+        # Write the percussive track once with the slice offsets.
+        with stage('export'):
+            save_harmonic_track(output_dir, base_filename, analysis_result.y_harmonic, analysis_result.sr)
+            save_slice_container(
+                output_dir=output_dir,
+                base_filename=base_filename,
+                percussive_track=analysis_result.y_percussive,
+                slice_points=beat_slice_points(
+                    analysis_result.beat_frames, len(analysis_result.y_percussive)
+                ),
+                sample_rate=analysis_result.sr,
+            )
+        return
+
+    # Process the percussive component by accessing the object's attributes.
+    with stage('slice') as s:
+        percussive_slices = slice_audio_on_beats(
+            waveform=analysis_result.y_percussive, 
+            beat_frames=analysis_result.beat_frames,
+        )
+        s.arrays(percussive_slices=percussive_slices)
+
+    # Export all the resulting audio files using attributes from the result object.
+    with stage('export'):
+        save_processed_files(
+            output_dir=output_dir,
+            base_filename=base_filename,
+            harmonic_track=analysis_result.y_harmonic,
+            percussive_slices=percussive_slices,
+            sample_rate=analysis_result.sr,
+            workers=config.get('export.workers', DEFAULT_EXPORT_WORKERS),
+        )
+
+def _run_streaming(
+    input_file: str,
+    output_dir: str,
+    base_filename: str,
+    block_size: Optional[int],
+    export_format: str,
+    config: Config,
+):
+    """Runs the block-streaming variant of the pipeline and returns the tempo."""
+    # 1. Analyze block by block; the harmonic track is written as it goes and
+    #    the percussive track is spooled to disk as 32-bit float WAV.
+    with stage('analyze_streaming') as s:
+        result = analyze_audio_streaming(input_file, output_dir, base_filename, block_size, config)
+        s.arrays(beat_frames=result.beat_frames)
+    slice_points = beat_slice_points(result.beat_frames, result.n_samples)
+
+    if export_format == 'container':
+        # 2. The spool already is the container; keep it and describe the slices.
+        audio_path = os.path.join(output_dir, f"{base_filename}_percussive.wav")
+        with stage('export'):
+            os.replace(result.percussive_path, audio_path)
+            write_slice_manifest(output_dir, base_filename, audio_path, slice_points, result.sr)
+        return result.tempo
+
+    # 2. Cut the percussive slices back out of the spool file, one at a time.
+    try:
+        with stage('export'):
+            save_slices_from_file(
+                output_dir=output_dir,
+                base_filename=base_filename,
+                percussive_path=result.percussive_path,
+                slice_points=slice_points,
+            )
+    finally:
+        os.remove(result.percussive_path)
+    return result.tempo
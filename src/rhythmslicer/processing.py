@@ -3,21 +3,36 @@
 import librosa
 import numpy as np
 import logging
-from typing import List
+from typing import Dict, List
+
+from .analysis import HOP_LENGTH, N_FFT
 
 logger = logging.getLogger(__name__)
 
-def slice_audio_on_beats(
-    waveform: np.ndarray,
-    beat_frames: np.ndarray
-) -> List[np.ndarray]:
+def beat_slice_points(beat_frames: np.ndarray, n_samples: int) -> np.ndarray:
+    """
+    Converts beat frames into the sample boundaries of the beat-synced slices.
+
+    Args:
+        beat_frames: Frame indices of the detected beats.
+        n_samples: The length of the waveform being sliced.
+
+    Returns:
+        An array of slice boundaries, starting at 0 and ending at n_samples.
+    """
+    beat_samples = librosa.frames_to_samples(beat_frames)
+    slice_points = np.empty(len(beat_samples) + 2, dtype=np.int64)
+    slice_points[0], slice_points[-1] = 0, n_samples
+    slice_points[1:-1] = beat_samples
+    return slice_points
+
+def slice_audio_on_beats(waveform: np.ndarray, beat_frames: np.ndarray) -> List[np.ndarray]:
     """
     Slices an audio waveform into chunks based on detected beat frames.
     """
     logger.info(f"Slicing waveform into {len(beat_frames)} beat-synced chunks.")
 
-    beat_samples = librosa.frames_to_samples(beat_frames)
-    slice_points = np.concatenate([[0], beat_samples, [len(waveform)]])
+    slice_points = beat_slice_points(beat_frames, len(waveform))
 
     slices = []
     for i in range(len(slice_points) - 1):
@@ -26,4 +41,90 @@ def slice_audio_on_beats(
         slices.append(waveform[start:end])
 
     logger.info("Slicing process complete.")
-    return slices
\ No newline at end of file
+    return slices
+
+def slice_features(
+    waveform: np.ndarray,
+    slice_points: np.ndarray,
+    sr: int,
+    n_mfcc: int = 13,
+    n_fft: int = N_FFT,
+    hop_length: int = HOP_LENGTH,
+) -> Dict[str, np.ndarray]:
+    """
+    Computes descriptors of every slice in one pass over the whole waveform.
+
+    The spectrogram, MFCCs and spectral centroid are computed once per
+    frame for the full waveform, and each slice then aggregates the frames
+    whose centres fall inside it with cumulative sums. A slice that contains
+    no frame centre takes the next frame. The RMS comes from
+    cumulative sums of the squared samples, so it is exact.
+    The MFCC statistics match the fingerprints of the timbre matcher up to
+    edge frames, which here see the neighbouring slices.
+
+    Args:
+        waveform: The waveform being sliced, e.g. the percussive component.
+        slice_points: Sample boundaries of the slices, see ``beat_slice_points``.
+        sr: The sample rate of the waveform.
+        n_mfcc: The number of MFCCs to summarise.
+        n_fft: The FFT size of the spectrogram.
+        hop_length: The hop length of the spectrogram.
+
+    Returns:
+        Columns with one row per slice:
+        - start, end (int64): The slice boundaries in samples.
+        - duration (float64): The slice length in seconds.
+        - rms (float32): The root-mean-square amplitude.
+        - spectral_centroid (float32): The magnitude-weighted mean frequency
+          in Hz over all frames of the slice.
+        - mfcc_mean, mfcc_std (float32, n_slices x n_mfcc): MFCC statistics.
+        - fingerprint (float32, n_slices x 2 * n_mfcc): mfcc_mean and mfcc_std
+          side by side, like ``timbrematcher.analysis.timbral_fingerprint``.
+    """
+    magnitude = np.abs(librosa.stft(waveform, n_fft=n_fft, hop_length=hop_length))
+    mfcc = librosa.feature.mfcc(
+        S=librosa.power_to_db(librosa.feature.melspectrogram(S=magnitude ** 2, sr=sr)), n_mfcc=n_mfcc
+    )
+    frequencies = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+
+    # Per-frame values whose per-slice sums give the spectral descriptors
+    columns = np.vstack([
+        mfcc,
+        mfcc * mfcc,
+        magnitude.sum(axis=0),
+        frequencies @ magnitude,
+    ]).astype(np.float64)
+    sums = np.zeros((columns.shape[0], columns.shape[1] + 1))
+    np.cumsum(columns, axis=1, out=sums[:, 1:])
+
+    # Frame k is centred on sample k * hop_length, so a slice holds the frames
+    # from ceil(start / hop_length) up to, but excluding, ceil(end / hop_length)
+    starts = np.asarray(slice_points[:-1], dtype=np.int64)
+    ends = np.asarray(slice_points[1:], dtype=np.int64)
+    first = np.minimum(-(-starts // hop_length), columns.shape[1] - 1)
+    last = np.maximum(np.minimum(-(-ends // hop_length), columns.shape[1]), first + 1)
+    counts = last - first
+    totals = sums[:, last] - sums[:, first]
+
+    mean = totals[:n_mfcc] / counts
+    variance = np.maximum(totals[n_mfcc:2 * n_mfcc] / counts - mean * mean, 0.0)
+    weight = totals[2 * n_mfcc]
+    centroid = np.divide(totals[2 * n_mfcc + 1], weight, out=np.zeros_like(weight), where=weight > 0)
+    fingerprint = np.hstack([mean.T, np.sqrt(variance).T]).astype(np.float32)
+
+    squares = np.zeros(len(waveform) + 1)
+    np.cumsum(np.square(waveform, dtype=np.float64), out=squares[1:])
+    lengths = ends - starts
+    mean_square = np.divide(
+        squares[ends] - squares[starts], lengths, out=np.zeros(len(lengths)), where=lengths > 0
+    )
+    return {
+        'start': starts,
+        'end': ends,
+        'duration': lengths / sr,
+        'rms': np.sqrt(np.maximum(mean_square, 0.0)).astype(np.float32),
+        'spectral_centroid': centroid.astype(np.float32),
+        'mfcc_mean': fingerprint[:, :n_mfcc],
+        'mfcc_std': fingerprint[:, n_mfcc:],
+        'fingerprint': fingerprint,
+    }
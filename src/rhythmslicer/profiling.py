@@ -0,0 +1,233 @@
+# src/rhythmslicer/profiling.py
+
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StageRecord:
+    name: str
+    start_s: float
+    wall_s: float
+    cpu_s: float
+    peak_rss_mb: Optional[float]
+    depth: int
+    thread_id: int
+    arrays: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+
+class Stage:
+    """A stage being measured. Use ``arrays`` to attach the sizes of its outputs."""
+
+    def __init__(self):
+        self._arrays: Dict[str, Dict[str, Any]] = {}
+
+    def arrays(self, **named: Any) -> None:
+        """
+        Records the shape, dtype and size of array-like values.
+
+        A list of arrays is recorded as its length and total size. Values
+        without an ``nbytes`` attribute (e.g. None) are ignored.
+        """
+        for name, value in named.items():
+            if isinstance(value, (list, tuple)):
+                self._arrays[name] = {
+                    'count': len(value),
+                    'nbytes': int(sum(getattr(v, 'nbytes', 0) for v in value)),
+                }
+            elif hasattr(value, 'nbytes'):
+                self._arrays[name] = {
+                    'shape': list(getattr(value, 'shape', ())),
+                    'dtype': str(getattr(value, 'dtype', '')),
+                    'nbytes': int(value.nbytes),
+                }
+
+
+class _NullStage(Stage):
+    def arrays(self, **named: Any) -> None:
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Profiler:
+    """
+    Collects one StageRecord per ``stage`` block run while it is active.
+
+    Stages may be nested; each record keeps its nesting depth so that the
+    Chrome trace shows them as a call tree.
+    """
+
+    def __init__(self):
+        self.records: List[StageRecord] = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _add(self, record: StageRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the records, in order of completion, with totals per stage name."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for r in self.records:
+            total = totals.setdefault(r.name, {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+            total['calls'] += 1
+            total['wall_s'] += r.wall_s
+            total['cpu_s'] += r.cpu_s
+        return {
+            'stages': [asdict(r) for r in self.records],
+            'totals': totals,
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Returns the records in the Chrome trace event format (complete events)."""
+        pid = os.getpid()
+        events = []
+        for r in self.records:
+            events.append({
+                'name': r.name,
+                'cat': 'stage',
+                'ph': 'X',
+                'ts': r.start_s * 1e6,
+                'dur': r.wall_s * 1e6,
+                'pid': pid,
+                'tid': r.thread_id,
+                'args': {'cpu_s': r.cpu_s, 'peak_rss_mb': r.peak_rss_mb, 'arrays': r.arrays},
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, output_dir: str, prefix: str = 'profile') -> Tuple[str, str]:
+        """
+        Writes ``<prefix>.json`` and ``<prefix>.trace.json`` to ``output_dir``.
+
+        The trace file can be opened in chrome://tracing or Perfetto.
+
+        Args:
+            output_dir: The directory to write to. It is created if needed.
+            prefix: The file name prefix.
+
+        Returns:
+            A tuple of (summary path, trace path).
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        summary_path = os.path.join(output_dir, f"{prefix}.json")
+        trace_path = os.path.join(output_dir, f"{prefix}.trace.json")
+        with open(summary_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        with open(trace_path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+        return summary_path, trace_path
+
+
+_active: ContextVar[Optional[Profiler]] = ContextVar('rhythmslicer_profiler', default=None)
+_depth: ContextVar[int] = ContextVar('rhythmslicer_profile_depth', default=0)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Returns the peak resident set size of this process in MB, if available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+@contextmanager
+def profile() -> Iterator[Profiler]:
+    """
+    Activates a profiler for the current context.
+
+    Example:
+        with profile() as profiler:
+            run_slicing_pipeline(input_file, output_dir)
+        profiler.save(output_dir)
+    """
+    profiler = Profiler()
+    token = _active.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def profile_to(output_dir: Optional[str]) -> Iterator[Optional[Profiler]]:
+    """
+    Profiles a block and saves the results to ``output_dir`` when it exits.
+
+    The results are saved even if the block raises, so failed runs can be
+    inspected too. With ``output_dir=None`` nothing is profiled.
+
+    Args:
+        output_dir: The directory receiving ``profile.json`` and
+            ``profile.trace.json``, or None to disable profiling.
+    """
+    if output_dir is None:
+        yield None
+        return
+    with profile() as profiler:
+        try:
+            yield profiler
+        finally:
+            summary_path, trace_path = profiler.save(output_dir)
+            logger.info(f"Profile written to {summary_path} and {trace_path}")
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Stage]:
+    """
+    Measures a pipeline stage if a profiler is active, and does nothing otherwise.
+
+    Records wall time, CPU time of the process and the peak RSS reached by the
+    end of the stage. The RSS is a process-wide high-water mark, so a stage
+    only "owns" it if it is higher than that of the stages before it.
+
+    Args:
+        name: The stage name, e.g. 'hpss' or 'export'.
+
+    Yields:
+        A Stage whose ``arrays`` method attaches output sizes to the record.
+    """
+    profiler = _active.get()
+    if profiler is None:
+        yield _NULL_STAGE
+        return
+
+    current = Stage()
+    depth = _depth.get()
+    token = _depth.set(depth + 1)
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield current
+    finally:
+        wall_end = time.perf_counter()
+        cpu_end = time.process_time()
+        _depth.reset(token)
+        profiler._add(StageRecord(
+            name=name,
+            start_s=wall_start - profiler._origin,
+            wall_s=wall_end - wall_start,
+            cpu_s=cpu_end - cpu_start,
+            peak_rss_mb=peak_rss_mb(),
+            depth=depth,
+            thread_id=threading.get_ident(),
+            arrays=current._arrays,
+        ))
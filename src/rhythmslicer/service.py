@@ -0,0 +1,346 @@
+# src/rhythmslicer/service.py
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import numpy as np
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from .analysis import analyze_signal
+from .cache import use_memory_cache
+from .config import Config, get_config
+from .pipeline import run_slicing_pipeline
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_PENDING = 64
+DEFAULT_MEMORY_CACHE_MB = 1024
+
+# Latencies kept per endpoint for the percentiles reported by /metrics.
+LATENCY_WINDOW = 1024
+
+
+class ServiceBusy(Exception):
+    """Raised when a request arrives while too many are already pending."""
+
+
+class ServiceMetrics:
+    """Thread-safe request counters and latency percentiles per endpoint."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.started = time.time()
+        self._window = window
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.in_flight = 0
+
+    def begin(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def record(self, endpoint: str, status: int, seconds: float) -> None:
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, {'requests': 0, 'errors': 0, 'rejected': 0})
+            counts['requests'] += 1
+            if status == 503:
+                counts['rejected'] += 1
+            elif status >= 400:
+                counts['errors'] += 1
+            self._latencies.setdefault(endpoint, deque(maxlen=self._window)).append(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the counters and the latency of the recent requests per endpoint."""
+        with self._lock:
+            endpoints = {}
+            for endpoint, counts in self._counts.items():
+                latencies = np.array(self._latencies[endpoint])
+                p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+                endpoints[endpoint] = dict(
+                    counts,
+                    latency_s={
+                        'mean': float(latencies.mean()),
+                        'p50': float(p50),
+                        'p95': float(p95),
+                        'p99': float(p99),
+                        'max': float(latencies.max()),
+                    },
+                )
+            return {
+                'uptime_s': time.time() - self.started,
+                'in_flight': self.in_flight,
+                'endpoints': endpoints,
+            }
+
+
+class PipelineService:
+    """
+    Runs the rhythmslicer and timbrematcher pipelines for a long-lived server.
+
+    At most ``workers`` requests run at a time and up to ``max_pending``
+    are admitted in total; anything beyond that is rejected with
+    ServiceBusy, so a burst of requests cannot exhaust memory.
+
+    Requests may carry a ``config`` object of dotted-key overrides, e.g.
+    ``{"beat_tracker.tightness": 400}``. They apply to that request only, so
+    requests with different settings can run concurrently.
+
+    Args:
+        workers: The number of requests processed concurrently.
+        max_pending: The number of running plus waiting requests admitted.
+        config: The configuration requests start from. Defaults to
+            ``get_config()``.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_WORKERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        config: Optional[Config] = None,
+    ):
+        self.workers = workers
+        self.max_pending = max(max_pending, workers)
+        self.config = config or get_config()
+        self.metrics = ServiceMetrics()
+        self._slots = threading.BoundedSemaphore(workers)
+        self._admitted = 0
+        self._lock = threading.Lock()
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+            '/slice': self.slice,
+            '/match': self.match,
+        }
+
+    def warm_up(self) -> float:
+        """
+        Runs both pipelines once on a short synthetic signal.
+
+        This compiles librosa's numba kernels and loads every lazy import
+        before the first real request arrives.
+
+        Returns:
+            The time taken in seconds.
+        """
+        from timbrematcher.processing import find_best_match
+
+        started = time.perf_counter()
+        sr = 22050
+        rng = np.random.default_rng(0)
+        y = (0.1 * rng.standard_normal(2 * sr)).astype(np.float32)
+        y[::sr // 2] = 1.0  # clicks at 120 BPM
+        analyze_signal(y, sr, config=self.config)
+        find_best_match(y[:sr // 2], sr, y, sr)
+        seconds = time.perf_counter() - started
+        logger.info(f"Warm-up finished in {seconds:.2f}s.")
+        return seconds
+
+    def request_config(self, request: Dict[str, Any]) -> Config:
+        """Returns the service configuration with the request's 'config' overrides applied."""
+        overrides = request.get('config') or {}
+        if not isinstance(overrides, dict):
+            raise ValueError("'config' must be an object of dotted keys to values.")
+        return self.config.with_overrides(overrides) if overrides else self.config
+
+    def slice(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Handles POST /slice: {input_file, output_dir, export_format?, config?}."""
+        tempo = run_slicing_pipeline(
+            _required(request, 'input_file'),
+            _required(request, 'output_dir'),
+            export_format=request.get('export_format'),
+            config=self.request_config(request),
+        )
+        return {'tempo': tempo}
+
+    def match(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles POST /match: {target_file, source_file, output_dir, top_n?,
+        search?, max_overlap?, analysis_sr?, config?}.
+        """
+        from timbrematcher.pipeline import run_timbre_matching_pipeline
+
+        matches = run_timbre_matching_pipeline(
+            _required(request, 'target_file'),
+            _required(request, 'source_file'),
+            _required(request, 'output_dir'),
+            int(request.get('top_n', 5)),
+            request.get('search', 'exhaustive'),
+            request.get('max_overlap'),
+            request.get('analysis_sr'),
+            config=self.request_config(request),
+        )
+        return {'matches': [[float(start), float(end)] for start, end in matches]}
+
+    def handle(self, path: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Runs the handler of ``path`` once a worker slot is free.
+
+        Raises:
+            KeyError: If there is no handler for ``path``.
+            ServiceBusy: If ``max_pending`` requests are already admitted.
+        """
+        handler = self.handlers[path]
+        with self._lock:
+            if self._admitted >= self.max_pending:
+                raise ServiceBusy(f"{self._admitted} requests pending.")
+            self._admitted += 1
+        try:
+            with self._slots:
+                self.metrics.begin()
+                try:
+                    return handler(request)
+                finally:
+                    self.metrics.end()
+        finally:
+            with self._lock:
+                self._admitted -= 1
+
+
+def _required(request: Dict[str, Any], key: str) -> Any:
+    if key not in request:
+        raise ValueError(f"Missing field '{key}'.")
+    return request[key]
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Maps HTTP requests to a PipelineService, which is set on the server."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        elif self.path == '/metrics':
+            self._reply(200, self.server.service.metrics.to_dict())
+        else:
+            self._reply(404, {'error': f"Unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        service: PipelineService = self.server.service
+        if self.path not in service.handlers:
+            self.close_connection = True  # the request body is left unread
+            self._reply(404, {'error': f"Unknown path: {self.path}"})
+            return
+        started = time.perf_counter()
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            status, body = 200, service.handle(self.path, request)
+        except ServiceBusy as e:
+            status, body = 503, {'error': str(e)}
+        except (ValueError, FileNotFoundError) as e:
+            status, body = 400, {'error': str(e)}
+        except Exception as e:
+            logger.error(f"Request to {self.path} failed: {e}", exc_info=True)
+            status, body = 500, {'error': str(e)}
+        seconds = time.perf_counter() - started
+        service.metrics.record(self.path, status, seconds)
+        self._reply(status, dict(body, seconds=seconds))
+
+    def _reply(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # Unix-socket peers have no address; requests are logged at debug level
+        logger.debug(f"{self.command} {self.path}: {format % args}")
+
+
+class _UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self) -> Tuple[socket.socket, Tuple[str, int]]:
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+
+def create_server(
+    service: PipelineService,
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    socket_path: Optional[str] = None,
+):
+    """
+    Creates an HTTP server for a PipelineService, on TCP or a Unix socket.
+
+    Endpoints:
+    - ``POST /slice`` and ``POST /match`` take and return JSON; every
+      response includes its latency in ``seconds``.
+    - ``GET /metrics`` returns request counts and latency percentiles.
+    - ``GET /health`` returns ``{"status": "ok"}``.
+
+    Args:
+        service: The service handling the requests.
+        host: The interface to listen on for TCP.
+        port: The TCP port, or 0 to pick a free one.
+        socket_path: Listen on this Unix socket instead of TCP. An existing
+            socket file is replaced.
+
+    Returns:
+        The server; call ``serve_forever`` to start it.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixHTTPServer(socket_path, _RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    socket_path: Optional[str] = None,
+    workers: Optional[int] = None,
+    memory_cache_mb: Optional[float] = None,
+) -> None:
+    """
+    Runs the pipelines as a local service until interrupted.
+
+    Decoded audio and feature matrices are kept in an in-memory LRU cache in
+    front of the on-disk cache, and the pipelines are warmed up before the
+    server starts accepting requests.
+
+    Args:
+        host: The interface to listen on for TCP.
+        port: The TCP port.
+        socket_path: Listen on this Unix socket instead of TCP.
+        workers: Concurrent requests. Defaults to the 'service.workers' config value.
+        memory_cache_mb: The in-memory cache budget. Defaults to the
+            'service.memory_cache_mb' config value.
+    """
+    config = get_config()
+    workers = workers or config.get('service.workers', DEFAULT_WORKERS)
+    memory_cache_mb = memory_cache_mb or config.get('service.memory_cache_mb', DEFAULT_MEMORY_CACHE_MB)
+    use_memory_cache(int(memory_cache_mb * 1024 * 1024))
+
+    service = PipelineService(workers, config.get('service.max_pending', DEFAULT_MAX_PENDING), config)
+    service.warm_up()
+    server = create_server(service, host, port, socket_path)
+    address = socket_path or f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Serving on {address} with {workers} worker(s).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down.")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
@@ -0,0 +1,151 @@
+# src/rhythmslicer/staging.py
+
+import time
+import queue
+import logging
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the input on a stage queue.
+_DONE = object()
+
+
+@dataclass
+class PipelineStage:
+    """
+    One step of a staged run.
+
+    Args:
+        name: The stage name, used in the per-item timings.
+        fn: Called with the value produced by the previous stage (the input
+            item for the first stage) and returns the value for the next one.
+        workers: The number of threads running this stage.
+    """
+    name: str
+    fn: Callable[[Any], Any]
+    workers: int = 1
+
+
+@dataclass
+class StagedResult:
+    item: Any
+    value: Any = None
+    error: Optional[BaseException] = None
+    seconds: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class _Job:
+    index: int
+    result: StagedResult
+    value: Any
+
+
+def run_staged(
+    items: Iterable[Any],
+    stages: List[PipelineStage],
+    queue_size: int = 2,
+) -> List[StagedResult]:
+    """
+    Runs every item through a sequence of stages, with the stages overlapping.
+
+    Each stage runs on its own threads and hands its output to the next stage
+    through a queue holding at most ``queue_size`` items. A stage that gets
+    ahead blocks until the next one catches up, so at most
+    ``queue_size + workers`` items are held per stage no matter how many
+    items there are. Once the stages are busy, the throughput is set by the
+    slowest stage instead of the sum of all of them.
+
+    Stages should spend their time in code that releases the GIL (file I/O,
+    libsndfile, numpy and FFT kernels), which is the case for decoding,
+    analysis and export.
+
+    An exception raised by a stage is recorded in that item's result and
+    the item skips its remaining stages; the other items are not affected.
+    An active profiler also records the stages run on the worker threads.
+
+    Args:
+        items: The inputs of the first stage.
+        stages: The stages, in order.
+        queue_size: The capacity of the queue in front of every stage.
+
+    Returns:
+        One StagedResult per item, in input order. ``value`` holds the output
+        of the last stage and ``seconds`` the time spent in each stage.
+    """
+    if not stages:
+        raise ValueError("At least one stage is required.")
+    if any(stage.workers < 1 for stage in stages):
+        raise ValueError("Every stage needs at least one worker.")
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    finished: queue.Queue = queue.Queue()
+    remaining = [stage.workers for stage in stages]
+    lock = threading.Lock()
+
+    def forward(i: int, job: _Job) -> None:
+        if i + 1 < len(stages):
+            queues[i + 1].put(job)
+        else:
+            finished.put(job)
+
+    def work(i: int) -> None:
+        current = stages[i]
+        while True:
+            job = queues[i].get()
+            if job is _DONE:
+                break
+            if job.result.error is None:
+                started = time.perf_counter()
+                try:
+                    job.value = current.fn(job.value)
+                except Exception as e:
+                    logger.error(f"Stage '{current.name}' failed for {job.result.item}: {e}")
+                    job.result.error = e
+                    job.value = None
+                job.result.seconds[current.name] = time.perf_counter() - started
+            forward(i, job)
+
+        # The last worker of a stage to finish closes the next stage
+        with lock:
+            remaining[i] -= 1
+            last = remaining[i] == 0
+        if last:
+            for _ in range(stages[i + 1].workers if i + 1 < len(stages) else 1):
+                forward(i, _DONE)
+
+    def feed() -> None:
+        for index, item in enumerate(items):
+            queues[0].put(_Job(index, StagedResult(item), item))
+        for _ in range(stages[0].workers):
+            queues[0].put(_DONE)
+
+    # Worker threads see the caller's context, e.g. the active profiler
+    threads = [threading.Thread(target=contextvars.copy_context().run, args=(feed,), daemon=True)]
+    for i, current in enumerate(stages):
+        for n in range(current.workers):
+            threads.append(threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(work, i),
+                name=f"{current.name}-{n}",
+                daemon=True,
+            ))
+    for thread in threads:
+        thread.start()
+
+    jobs: List[_Job] = []
+    while True:
+        job = finished.get()
+        if job is _DONE:
+            break
+        jobs.append(job)
+    for thread in threads:
+        thread.join()
+
+    jobs.sort(key=lambda job: job.index)
+    for job in jobs:
+        job.result.value = job.value
+    return [job.result for job in jobs]
@@ -0,0 +1,188 @@
+# src/rhythmslicer/streaming.py
+
+import os
+import librosa
+import numpy as np
+import soundfile as sf
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from .analysis import HOP_LENGTH, separate_with_onsets
+from .config import Config, get_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_MARGIN = 1 << 15
+DEFAULT_CROSSFADE = 1 << 12
+
+
+@dataclass
+class StreamingAnalysisResult:
+    harmonic_path: str
+    percussive_path: str
+    tempo: float
+    beat_frames: np.ndarray
+    sr: int
+    n_samples: int
+
+
+class _OverlapAddWriter:
+    """
+    Stitches per-block outputs into one file with complementary cross-fades.
+
+    Every block contributes the span ``[start - fade, end + fade)``. The
+    first ``2 * fade`` samples are faded in and added to the faded-out tail
+    of the previous block, so the weights of neighbouring blocks always sum
+    to one.
+    """
+
+    def __init__(self, path: str, sr: int, fade: int, subtype: Optional[str] = None):
+        self._file = sf.SoundFile(path, mode='w', samplerate=sr, channels=1, subtype=subtype)
+        self._fade = fade
+        self._ramp_up = np.linspace(0.0, 1.0, 2 * fade, endpoint=False, dtype=np.float32)
+        self._pending: Optional[np.ndarray] = None
+
+    def add(self, segment: np.ndarray, is_last: bool) -> None:
+        segment = segment.astype(np.float32, copy=True)
+        overlap = 2 * self._fade
+        if self._pending is not None:
+            segment[:overlap] = segment[:overlap] * self._ramp_up + self._pending
+        if is_last or overlap == 0:
+            self._file.write(segment)
+            self._pending = None
+        else:
+            self._file.write(segment[:-overlap])
+            self._pending = segment[-overlap:] * self._ramp_up[::-1]
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def analyze_audio_streaming(
+    file_path: str,
+    output_dir: str,
+    base_filename: str,
+    block_size: Optional[int] = None,
+    config: Optional[Config] = None,
+) -> StreamingAnalysisResult:
+    """
+    Analyzes an audio file block by block with bounded memory.
+
+    The file is read in blocks of ``block_size`` samples, each extended by
+    ``margin`` samples of context on both sides so that the HPSS median
+    filters see the same neighbourhood they would in a whole-file analysis.
+    The separated blocks are cross-faded into the harmonic output file and a
+    percussive spool file as they are produced. The onset envelope of each
+    block's interior is appended to a running envelope (one value per hop),
+    and beats are tracked on that envelope once the last block is done.
+
+    Peak memory is proportional to ``block_size + 2 * margin``, independent
+    of the length of the file (apart from the onset envelope, which holds
+    one float per hop).
+
+    Args:
+        file_path: The full path to the input audio file.
+        output_dir: The directory where the harmonic track and the
+            percussive spool file are written.
+        base_filename: The name used for the output files.
+        block_size: Samples per block. Defaults to the 'streaming.block_size'
+            config value.
+        config: The 'streaming', 'hpss', 'beat_tracker' and 'analysis'
+            settings to use. Defaults to ``get_config()``.
+
+    Returns:
+        A StreamingAnalysisResult describing the files written and the beats.
+
+    Raises:
+        FileNotFoundError: If the input file does not exist.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Input file not found: {file_path}")
+
+    config = config or get_config()
+    block_size = block_size or config.get('streaming.block_size', DEFAULT_BLOCK_SIZE)
+    margin = config.get('streaming.margin', DEFAULT_MARGIN)
+    crossfade = config.get('streaming.crossfade', DEFAULT_CROSSFADE)
+
+    # Keep blocks and context on the hop grid so per-block frames line up
+    # with the frames of a whole-file analysis.
+    block_size = max(HOP_LENGTH, -(-block_size // HOP_LENGTH) * HOP_LENGTH)
+    margin = max(HOP_LENGTH, -(-margin // HOP_LENGTH) * HOP_LENGTH)
+    fade = min(crossfade, margin, block_size // 2)
+
+    hpss_params = config.get('hpss', {})
+    analysis_sr = config.get('analysis.sample_rate')
+    beat_tracker_params = config.get('beat_tracker', {})
+
+    os.makedirs(output_dir, exist_ok=True)
+    harmonic_path = os.path.join(output_dir, f"{base_filename}_harmonic.wav")
+    percussive_path = os.path.join(output_dir, f".{base_filename}_percussive.spool.wav")
+
+    logger.info(f"Starting streaming analysis for: {file_path} (block size {block_size} samples)")
+    with sf.SoundFile(file_path) as source:
+        sr = source.samplerate
+        harmonic_writer = _OverlapAddWriter(harmonic_path, sr, fade)
+        percussive_writer = _OverlapAddWriter(percussive_path, sr, fade, subtype='FLOAT')
+        onset_blocks = []
+        try:
+            # The frame count in some headers (e.g. MP3) is only an estimate,
+            # so the end of the file is detected from short reads instead.
+            start, is_last, k = 0, False, 0
+            while not is_last:
+                context_start = max(0, start - margin)
+                source.seek(context_start)
+                block = source.read(
+                    start + block_size + margin - context_start, dtype='float32', always_2d=True
+                )
+                block = block.mean(axis=1)
+
+                # A block whose right-hand context reaches the end of the file
+                # absorbs the remaining tail and becomes the last one.
+                context_end = context_start + len(block)
+                is_last = context_end < start + block_size + margin
+                end = context_end if is_last else start + block_size
+
+                spectral = separate_with_onsets(block, sr, hpss_params, analysis_sr=analysis_sr)
+                y_harmonic, y_percussive = spectral.y_harmonic, spectral.y_percussive
+
+                # Each block contributes [start - fade, end + fade), clipped to the file
+                out_start = start - fade if k > 0 else start
+                out_end = end if is_last else end + fade
+                region = slice(out_start - context_start, out_end - context_start)
+                harmonic_writer.add(y_harmonic[region], is_last)
+                percussive_writer.add(y_percussive[region], is_last)
+
+                # Keep the onset frames that fall inside this block's interior
+                block_onsets = spectral.onset_envelope
+                first = start // HOP_LENGTH
+                last = 1 + end // HOP_LENGTH if is_last else end // HOP_LENGTH
+                offset = context_start // HOP_LENGTH
+                onset_blocks.append(block_onsets[first - offset:last - offset])
+
+                k += 1
+                logger.info(f"Processed block {k} ({end / sr:.1f}s analyzed).")
+                start = end
+        finally:
+            harmonic_writer.close()
+            percussive_writer.close()
+
+    n_samples = end
+    onset_envelope = np.concatenate(onset_blocks)
+    tempo, beat_frames = librosa.beat.beat_track(
+        onset_envelope=onset_envelope,
+        sr=sr,
+        hop_length=HOP_LENGTH,
+        **beat_tracker_params
+    )
+    logger.info(f"Streaming analysis complete. Detected Tempo: {np.mean(tempo):.2f} BPM.")
+
+    return StreamingAnalysisResult(
+        harmonic_path=harmonic_path,
+        percussive_path=percussive_path,
+        tempo=tempo,
+        beat_frames=beat_frames,
+        sr=sr,
+        n_samples=n_samples,
+    )
@@ -1,20 +1,128 @@
 """Core analysis functions for timbre matching."""
+from dataclasses import dataclass
+from typing import Optional, Union
+
 import librosa
 import numpy as np
 
-def calculate_mfcc(y: np.ndarray, sr: int, n_mfcc: int = 13) -> np.ndarray:
+from rhythmslicer.analysis import HOP_LENGTH, N_FFT
+from rhythmslicer.audio_io import AudioSource, analysis_rate, as_audio, resample, resampled_length
+from rhythmslicer.cache import get_cache
+
+# STFT parameters of the frame-level MFCC matrix, so ``calculate_mfcc`` and
+# the sliding-window engine agree on the frame grid. They are the rhythm
+# slicer's, so ``rhythmslicer.processing.slice_features`` uses the same frames.
+MFCC_N_FFT = N_FFT
+MFCC_HOP_LENGTH = HOP_LENGTH
+
+# Fingerprints are stored and compared in float32. Prefix sums in
+# FrameMoments stay float64, because they accumulate over the whole source.
+FINGERPRINT_DTYPE = np.float32
+
+# MFCC frames computed per block when analysing an AudioSource (~47 s at 22.05 kHz).
+MFCC_BLOCK_FRAMES = 2048
+
+def calculate_mfcc(
+    y: Union[np.ndarray, AudioSource],
+    sr: int,
+    n_mfcc: int = 13,
+    analysis_sr: Optional[int] = None,
+) -> np.ndarray:
     """
     Calculates the Mel-Frequency Cepstral Coefficients (MFCCs) for an audio signal.
 
     Args:
-        y: The audio time series.
+        y: The audio time series, or an AudioSource to analyse block by block.
+        sr: The sampling rate of the audio.
+        n_mfcc: The number of MFCCs to return.
+        analysis_sr: If set, the signal is first resampled to this rate
+            (never upsampled), and the frames are on its grid.
+
+    Returns:
+        The float32 MFCCs, with shape (n_mfcc, time).
+    """
+    if isinstance(y, AudioSource):
+        return calculate_mfcc_blockwise(y, n_mfcc, analysis_sr=analysis_sr)
+    target_sr = analysis_rate(sr, analysis_sr)
+    return librosa.feature.mfcc(
+        y=resample(as_audio(y), sr, target_sr), sr=target_sr, n_mfcc=n_mfcc,
+        n_fft=MFCC_N_FFT, hop_length=MFCC_HOP_LENGTH,
+    )
+
+def calculate_mfcc_blockwise(
+    source: AudioSource,
+    n_mfcc: int = 13,
+    block_frames: int = MFCC_BLOCK_FRAMES,
+    analysis_sr: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Calculates the same MFCCs as ``calculate_mfcc`` without loading the whole file.
+
+    The mel power spectrogram is computed block by block from regions read
+    on demand, each padded by half an FFT window so frames line up exactly
+    with librosa's centred framing. The decibel scaling and DCT then run
+    once over the whole mel matrix, because ``power_to_db`` clips relative
+    to the global maximum.
+
+    Args:
+        source: The audio to analyse.
+        n_mfcc: The number of MFCCs to return.
+        block_frames: The number of frames computed per block.
+        analysis_sr: If set, regions are resampled to this rate as they are read.
+
+    Returns:
+        The MFCCs, with shape (n_mfcc, time).
+    """
+    sr = analysis_rate(source.samplerate, analysis_sr)
+    n_frames = 1 + resampled_length(len(source), source.samplerate, sr) // MFCC_HOP_LENGTH
+    half_window = MFCC_N_FFT // 2
+    mel = None
+    for first in range(0, n_frames, block_frames):
+        last = min(first + block_frames, n_frames)
+        start = first * MFCC_HOP_LENGTH - half_window
+        stop = (last - 1) * MFCC_HOP_LENGTH - half_window + MFCC_N_FFT
+
+        # Regions beyond either end of the file read as zeros, like centred STFT framing
+        block = librosa.feature.melspectrogram(
+            y=source.read_resampled(start, stop, sr), sr=sr, n_fft=MFCC_N_FFT,
+            hop_length=MFCC_HOP_LENGTH, center=False,
+        )
+        if mel is None:
+            mel = np.empty((block.shape[0], n_frames), dtype=block.dtype)
+        mel[:, first:last] = block
+    return librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=n_mfcc)
+
+def cached_mfcc(
+    file_path: str,
+    y: Union[np.ndarray, AudioSource],
+    sr: int,
+    n_mfcc: int = 13,
+    analysis_sr: Optional[int] = None,
+) -> np.ndarray:
+    """
+    Calculates the MFCCs of an audio file, reusing the on-disk feature cache.
+
+    Args:
+        file_path: The path the audio was decoded from, used as the cache key.
+        y: The decoded audio time series or an AudioSource, only analysed
+            on a cache miss.
         sr: The sampling rate of the audio.
         n_mfcc: The number of MFCCs to return.
+        analysis_sr: The rate to compute the MFCCs at, see ``calculate_mfcc``.
 
     Returns:
         The MFCCs, with shape (n_mfcc, time).
     """
-    return librosa.feature.mfcc(y=y, sr=sr, n_mfcc=n_mfcc)
+    cache = get_cache()
+    if cache is None:
+        return calculate_mfcc(y, sr, n_mfcc, analysis_sr)
+
+    key = cache.make_key(
+        file_path, 'mfcc', sr=analysis_rate(sr, analysis_sr), n_mfcc=n_mfcc,
+        n_fft=MFCC_N_FFT, hop_length=MFCC_HOP_LENGTH,
+    )
+    mfccs, _ = cache.get_or_compute(key, lambda: (calculate_mfcc(y, sr, n_mfcc, analysis_sr), {}))
+    return mfccs
 
 def timbral_fingerprint(mfccs: np.ndarray) -> np.ndarray:
     """
@@ -25,6 +133,92 @@ def timbral_fingerprint(mfccs: np.ndarray) -> np.ndarray:
         mfccs: The MFCCs, with shape (n_mfcc, time).
 
     Returns:
-        A 1D array representing the timbral fingerprint.
+        A 1D float32 array representing the timbral fingerprint.
+    """
+    n_mfcc = mfccs.shape[0]
+    fingerprint = np.empty(2 * n_mfcc, dtype=FINGERPRINT_DTYPE)
+    np.mean(mfccs, axis=1, out=fingerprint[:n_mfcc])
+    np.std(mfccs, axis=1, out=fingerprint[n_mfcc:])
+    return fingerprint
+
+@dataclass
+class FrameMoments:
+    """
+    Prefix sums of a frame-level feature matrix and of its square.
+
+    The sums are taken over the mean-centred features (``offset`` holds the
+    per-coefficient mean) to keep the running totals small, which limits
+    cancellation when the variance of a window is recovered from them.
+    """
+    sums: np.ndarray
+    squares: np.ndarray
+    offset: np.ndarray
+
+    @property
+    def n_frames(self) -> int:
+        """The number of frames covered by the prefix sums."""
+        return self.sums.shape[1] - 1
+
+def frame_moments(mfccs: np.ndarray) -> FrameMoments:
+    """
+    Precomputes the cumulative statistics needed by ``window_fingerprints``.
+
+    Args:
+        mfccs: The frame-level MFCCs, with shape (n_mfcc, time).
+
+    Returns:
+        A FrameMoments object with prefix sums of shape (n_mfcc, time + 1).
+    """
+    mfccs = np.asarray(mfccs, dtype=np.float64)
+    offset = mfccs.mean(axis=1) if mfccs.shape[1] else np.zeros(mfccs.shape[0])
+    centred = mfccs - offset[:, None]
+
+    n_mfcc, n_frames = centred.shape
+    sums = np.zeros((n_mfcc, n_frames + 1))
+    squares = np.zeros((n_mfcc, n_frames + 1))
+    np.cumsum(centred, axis=1, out=sums[:, 1:])
+    np.cumsum(centred * centred, axis=1, out=squares[:, 1:])
+    return FrameMoments(sums=sums, squares=squares, offset=offset)
+
+def window_fingerprints(
+    moments: FrameMoments,
+    start_frames: np.ndarray,
+    window_frames: int,
+    out: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Computes the timbral fingerprint of many frame windows at once.
+
+    Each row is the same mean/standard-deviation vector that
+    ``timbral_fingerprint`` returns for ``mfccs[:, start:start + window_frames]``,
+    but it is read off the prefix sums in constant time per window.
+
+    Args:
+        moments: Prefix sums produced by ``frame_moments``.
+        start_frames: The first frame index of each window.
+        window_frames: The number of frames in every window.
+        out: An optional preallocated array of shape (n_windows, 2 * n_mfcc)
+            to write the fingerprints into, e.g. a slice of a larger table.
+
+    Returns:
+        A float32 array of shape (n_windows, 2 * n_mfcc), or ``out``.
     """
-    return np.hstack([np.mean(mfccs, axis=1), np.std(mfccs, axis=1)])
+    starts = np.asarray(start_frames, dtype=np.intp)
+    ends = starts + window_frames
+    n_mfcc = moments.sums.shape[0]
+    if out is None:
+        out = np.empty((len(starts), 2 * n_mfcc), dtype=FINGERPRINT_DTYPE)
+
+    mean = moments.sums[:, ends]
+    mean -= moments.sums[:, starts]
+    mean /= window_frames
+    variance = moments.squares[:, ends]
+    variance -= moments.squares[:, starts]
+    variance /= window_frames
+    variance -= mean * mean
+    np.maximum(variance, 0.0, out=variance)
+
+    mean += moments.offset[:, None]
+    out[:, :n_mfcc] = mean.T
+    np.sqrt(variance.T, out=out[:, n_mfcc:], casting='same_kind')
+    return out
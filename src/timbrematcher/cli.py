@@ -1,26 +1,248 @@
 """Command-line interface for the Timbre Matcher."""
+from typing import List, Optional
+
 import typer
-from .pipeline import run_timbre_matching_pipeline
+from typer.core import TyperGroup
+
+# The pipeline and index modules pull in librosa, scipy and soundfile. They
+# are imported inside the commands that need them so that --help and argument
+# errors stay fast.
+
+
+class _DefaultMatchGroup(TyperGroup):
+    """Runs the `match` command when no sub-command name is given."""
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ("--help",):
+            args = ["match", *args]
+        return super().parse_args(ctx, args)
+
 
 app = typer.Typer(
     name="timbrematcher",
     help="Finds audio segments with a similar timbre to a target snippet.",
     add_completion=False,
     no_args_is_help=True,
+    cls=_DefaultMatchGroup,
 )
 
-@app.callback(invoke_without_command=True)
-def main(
+@app.command()
+def match(
     target_file: str = typer.Argument(..., help="Path to the target audio snippet."),
     source_file: str = typer.Argument(..., help="Path to the source audio file to search within."),
     output_dir: str = typer.Option("output/timbre_matches", "--out", "-o", help="Directory to save matched segments."),
     top_n: int = typer.Option(5, "--top-n", "-n", help="Number of best matches to find."),
+    search: str = typer.Option("exhaustive", "--search", help="'exhaustive', 'coarse_to_fine' (coarse grid, then frame-accurate refinement) or 'dtw' (MFCC sequences aligned with dynamic time warping)."),
+    max_overlap: Optional[float] = typer.Option(None, "--max-overlap", help="Maximum overlap between matches as a fraction of the window (e.g. 0.5)."),
+    analysis_sr: Optional[int] = typer.Option(None, "--analysis-sr", help="Sample rate to extract features at (e.g. 22050). Matches are still exported at the native rate."),
+    profile: bool = typer.Option(False, "--profile", help="Record per-stage timings and memory to profile.json and profile.trace.json (Chrome trace) in the output directory."),
+    config_file: str = typer.Option("config/defaults.yml", "--config", "-c", help="YAML configuration whose 'timbrematcher' section sets n_mfcc and hop_ratio."),
+    scales: Optional[List[float]] = typer.Option(None, "--scale", help="Also search windows of this many times the target length (repeatable, e.g. --scale 0.5 --scale 1 --scale 2). Matches of all lengths are ranked together."),
 ):
     """
     Finds and saves the best timbral matches from a source file.
     """
+    from rhythmslicer.config import Config
+    from rhythmslicer.profiling import profile_to
+    from .pipeline import run_timbre_matching_pipeline
+
+    try:
+        config = Config.from_file(config_file)
+        with profile_to(output_dir if profile else None):
+            run_timbre_matching_pipeline(
+                target_file, source_file, output_dir, top_n, search, max_overlap, analysis_sr, config,
+                scales or None,
+            )
+        if profile:
+            print(f"Profile written to {output_dir}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command()
+def batch(
+    source_file: str = typer.Argument(..., help="Path to the source audio file to search within."),
+    targets: List[str] = typer.Argument(..., help="Target snippets: files, directories, glob patterns or manifests."),
+    output_dir: str = typer.Option("output/timbre_matches", "--out", "-o", help="Directory that receives one sub-directory per target."),
+    top_n: int = typer.Option(5, "--top-n", "-n", help="Number of best matches to find per target."),
+    search: str = typer.Option("exhaustive", "--search", help="'exhaustive', 'coarse_to_fine' (coarse grid, then frame-accurate refinement) or 'dtw' (MFCC sequences aligned with dynamic time warping)."),
+    max_overlap: Optional[float] = typer.Option(None, "--max-overlap", help="Maximum overlap between matches as a fraction of the window (e.g. 0.5)."),
+    analysis_sr: Optional[int] = typer.Option(None, "--analysis-sr", help="Sample rate to extract features at (e.g. 22050). Matches are still exported at the native rate."),
+    profile: bool = typer.Option(False, "--profile", help="Record per-stage timings and memory to profile.json and profile.trace.json (Chrome trace) in the output directory."),
+    journal: Optional[str] = typer.Option(None, "--journal", help="SQLite job journal. Targets already matched with the same files and settings are skipped, so an interrupted batch can be resumed."),
+    shard: str = typer.Option("0/1", "--shard", help="Match only shard INDEX/COUNT of the targets (e.g. 2/4), to split a batch across machines."),
+    config_file: str = typer.Option("config/defaults.yml", "--config", "-c", help="YAML configuration whose 'timbrematcher' section sets n_mfcc and hop_ratio."),
+    scales: Optional[List[float]] = typer.Option(None, "--scale", help="Also search windows of this many times the target length (repeatable, e.g. --scale 0.5 --scale 1 --scale 2). Matches of all lengths are ranked together."),
+):
+    """
+    Matches many target snippets against one source file in a single pass.
+    """
+    from rhythmslicer.batch import collect_inputs
+    from rhythmslicer.config import Config
+    from rhythmslicer.journal import parse_shard
+    from rhythmslicer.profiling import profile_to
+    from .pipeline import run_batch_matching_pipeline
+
+    try:
+        shard_index, shard_count = parse_shard(shard)
+        config = Config.from_file(config_file)
+        with profile_to(output_dir if profile else None):
+            run_batch_matching_pipeline(
+                collect_inputs(targets), source_file, output_dir, top_n, search, max_overlap,
+                analysis_sr, journal, shard_index, shard_count, config, scales or None,
+            )
+        if profile:
+            print(f"Profile written to {output_dir}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command()
+def index(
+    index_dir: str = typer.Argument(..., help="Directory to write the corpus index to."),
+    corpus: List[str] = typer.Argument(..., help="Audio files, directories, glob patterns or manifests to index."),
+    window: float = typer.Option(1.0, "--window", "-w", help="Window length in seconds."),
+    list_size: int = typer.Option(256, "--list-size", help="Average number of windows per inverted list."),
+    projection_file: Optional[str] = typer.Option(None, "--projection", "-p", help="Projection written by 'timbrematcher fit-projection' to reduce the fingerprints with."),
+    dtype: str = typer.Option("float32", "--dtype", help="Storage type of the fingerprints: float32, float16 or int8."),
+    sr: int = typer.Option(22050, "--sr", help="Sample rate every file and query is resampled to before analysis."),
+    config_file: str = typer.Option("config/defaults.yml", "--config", "-c", help="YAML configuration whose 'timbrematcher' section sets n_mfcc and hop_ratio."),
+):
+    """
+    Precomputes timbral fingerprints over a corpus of recordings.
+    """
+    from rhythmslicer.batch import collect_inputs
+    from rhythmslicer.config import Config
+    from .index import CorpusIndex
+    from .projection import FingerprintProjection
+
     try:
-        run_timbre_matching_pipeline(target_file, source_file, output_dir, top_n)
+        config = Config.from_file(config_file)
+        files = collect_inputs(corpus)
+        projection = FingerprintProjection.load(projection_file) if projection_file else None
+        corpus_index = CorpusIndex.build(
+            files, window_seconds=window, list_size=list_size, projection=projection, vector_dtype=dtype, sr=sr,
+            config=config,
+        )
+        corpus_index.save(index_dir)
+        print(f"Indexed {len(corpus_index)} windows from {len(corpus_index.files)} file(s) into {index_dir}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command("fit-projection")
+def fit_projection(
+    projection_file: str = typer.Argument(..., help="NPZ file to write the projection to."),
+    corpus: List[str] = typer.Argument(..., help="Audio files, directories, glob patterns or manifests to fit on."),
+    dim: int = typer.Option(8, "--dim", "-d", help="Dimension to reduce fingerprints to."),
+    whiten: bool = typer.Option(True, "--whiten/--no-whiten", help="Scale every component to unit variance."),
+    window: float = typer.Option(1.0, "--window", "-w", help="Window length in seconds, as for 'timbrematcher index'."),
+    max_samples: int = typer.Option(100_000, "--max-samples", help="Largest number of windows to fit on, drawn at random."),
+    sr: int = typer.Option(22050, "--sr", help="Sample rate to analyse at, as for 'timbrematcher index'."),
+    config_file: str = typer.Option("config/defaults.yml", "--config", "-c", help="YAML configuration whose 'timbrematcher' section sets n_mfcc and hop_ratio."),
+):
+    """
+    Fits a PCA/whitening projection of timbral fingerprints on a corpus sample.
+    """
+    import numpy as np
+    from rhythmslicer.batch import collect_inputs
+    from rhythmslicer.config import Config
+    from .index import corpus_fingerprints
+    from .projection import FingerprintProjection
+
+    try:
+        _, fingerprints, _, _ = corpus_fingerprints(
+            collect_inputs(corpus), window_seconds=window, sr=sr, config=Config.from_file(config_file)
+        )
+        projection = FingerprintProjection.fit(fingerprints, n_components=dim, whiten=whiten, max_samples=max_samples)
+        projection.save(projection_file)
+        kept = projection.explained_variance.sum() / np.var(fingerprints, axis=0, ddof=1).sum()
+        print(f"Fitted a {dim}-dimensional projection on {min(len(fingerprints), max_samples)} windows "
+              f"({kept:.1%} of the variance) into {projection_file}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command()
+def query(
+    index_dir: str = typer.Argument(..., help="Directory containing a corpus index."),
+    target_file: str = typer.Argument(..., help="Path to the target audio snippet."),
+    top_n: int = typer.Option(5, "--top-n", "-n", help="Number of best matches to find."),
+    n_probe: int = typer.Option(8, "--n-probe", help="Number of inverted lists to scan."),
+):
+    """
+    Finds the closest timbral matches to a target snippet across an indexed corpus.
+    """
+    from rhythmslicer.cache import load_audio
+    from .index import CorpusIndex
+
+    try:
+        corpus_index = CorpusIndex.load(index_dir)
+        target_y, target_sr = load_audio(target_file, sr=None)
+        for m in corpus_index.query(target_y, target_sr, top_n=top_n, n_probe=n_probe):
+            print(f"{m.file}\t{m.start_time:.3f}\t{m.end_time:.3f}\t{m.distance:.4f}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command()
+def slices(
+    table_file: str = typer.Argument(..., help="A slice feature table written by 'rhythmslicer process --slice-table'."),
+    target_file: str = typer.Argument(..., help="Path to the target audio snippet."),
+    top_n: int = typer.Option(5, "--top-n", "-n", help="Number of best matching slices to find."),
+):
+    """
+    Finds the beat slices whose timbre is closest to a target snippet.
+    """
+    from rhythmslicer.cache import load_audio
+    from .slices import search_slice_table
+
+    try:
+        target_y, target_sr = load_audio(target_file, sr=None)
+        for m in search_slice_table(table_file, target_y, target_sr, top_n=top_n):
+            print(f"{m.index}\t{m.start_time:.3f}\t{m.end_time:.3f}\t{m.distance:.4f}\t{m.slice_file or ''}")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise typer.Exit(code=1)
+
+@app.command()
+def stream(
+    target_file: str = typer.Argument(..., help="Path to the target audio snippet."),
+    source: str = typer.Argument("-", help="An audio file, a raw PCM file, or '-' for raw PCM on stdin."),
+    threshold: float = typer.Option(..., "--threshold", "-t", help="Largest fingerprint distance reported as a match."),
+    sr: Optional[int] = typer.Option(None, "--sr", help="Sample rate of raw PCM input (required for raw PCM)."),
+    sample_format: str = typer.Option("s16le", "--format", help="Raw PCM sample format: s16le, s32le or f32le."),
+    channels: int = typer.Option(1, "--channels", help="Interleaved channels of raw PCM input."),
+    block_size: int = typer.Option(4096, "--block-size", help="Samples read per block."),
+    follow: bool = typer.Option(False, "--follow", "-f", help="Keep waiting for data at the end of a raw PCM file that is still being written."),
+):
+    """
+    Reports timbral matches in a live or very long stream as they happen.
+    """
+    import sys
+    from contextlib import ExitStack
+    from rhythmslicer.audio_io import AudioSource
+    from rhythmslicer.batch import AUDIO_EXTENSIONS
+    from rhythmslicer.cache import load_audio
+    from .streaming import StreamingMatcher, match_stream, pcm_blocks
+
+    try:
+        with ExitStack() as stack:
+            target_y, target_sr = load_audio(target_file, sr=None)
+            if source != "-" and source.lower().endswith(AUDIO_EXTENSIONS):
+                audio = stack.enter_context(AudioSource(source))
+                sr, blocks = audio.samplerate, audio.blocks(block_size)
+            elif sr is None:
+                raise ValueError("--sr is required for raw PCM input.")
+            else:
+                stream_in = sys.stdin.buffer if source == "-" else stack.enter_context(open(source, "rb"))
+                blocks = pcm_blocks(stream_in, block_size, sample_format, channels, follow=follow)
+
+            matcher = StreamingMatcher(target_y, target_sr, sr, threshold)
+            for event in match_stream(blocks, matcher):
+                print(f"{event.start_time:.3f}\t{event.end_time:.3f}\t{event.distance:.4f}", flush=True)
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"An error occurred: {e}")
         raise typer.Exit(code=1)
@@ -3,12 +3,15 @@ import os
 import soundfile as sf
 import numpy as np
 import librosa
+from typing import Union
+
+from rhythmslicer.audio_io import AudioSource
 
 def save_matched_segments(
     source_path: str,
     output_dir: str,
     matches: list[tuple[float, float]],
-    y: np.ndarray,
+    y: Union[np.ndarray, AudioSource],
     sr: int,
 ):
     """
@@ -18,7 +21,8 @@ def save_matched_segments(
         source_path: Path to the source audio file.
         output_dir: Directory to save the output files.
         matches: A list of (start_time, end_time) tuples for the matches.
-        y: The audio time series of the source file.
+        y: The audio time series of the source file, or an AudioSource, in
+            which case only the matched regions are read from disk.
         sr: The sampling rate of the source file.
     """
     os.makedirs(output_dir, exist_ok=True)
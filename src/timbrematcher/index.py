@@ -0,0 +1,418 @@
+"""On-disk corpus index for timbral nearest-neighbour search across many files."""
+import json
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+from scipy.cluster.vq import kmeans2
+from scipy.spatial import cKDTree
+
+from rhythmslicer.audio_io import as_audio, resample
+from rhythmslicer.cache import load_audio
+from rhythmslicer.config import Config, get_config
+
+from .analysis import (
+    MFCC_HOP_LENGTH,
+    cached_mfcc,
+    calculate_mfcc,
+    frame_moments,
+    timbral_fingerprint,
+    window_fingerprints,
+)
+from .processing import HOP_RATIO
+from .projection import CompactVectors, FingerprintProjection, quantize
+
+INDEX_FORMAT_VERSION = 4
+
+# Every file and query is resampled to one rate, so that all fingerprints
+# come from the same mel filterbank.
+INDEX_SR = 22050
+
+# Array files that make up an index directory, memory-mapped on load.
+_ARRAY_NAMES = ('fingerprints', 'scales', 'file_ids', 'start_frames', 'centroids', 'list_offsets')
+
+# The optional projection of an index directory.
+_PROJECTION_FILE = 'projection.npz'
+
+
+@dataclass
+class IndexMatch:
+    """A single window returned by a corpus index query."""
+    file: str
+    start_time: float
+    end_time: float
+    distance: float
+
+
+class CorpusIndex:
+    """
+    An inverted-file index over sliding-window timbral fingerprints.
+
+    Window fingerprints from every file are clustered with k-means into
+    lists of roughly ``list_size`` entries. A query only scans the lists
+    whose centroids are closest to the target fingerprint, and the centroids
+    themselves are searched with a KD-tree, so query cost depends on
+    ``n_probe * list_size`` rather than on the size of the corpus.
+
+    Corpus files and query targets are all analysed at the index rate
+    ``sr``, whatever their native rates, so their fingerprints are
+    comparable.
+
+    Entries are stored sorted by list, so each list is a contiguous slice of
+    the memory-mapped arrays described by ``list_offsets``.
+
+    With a ``FingerprintProjection``, fingerprints are projected before they
+    are clustered and stored, and queries are projected the same way. The
+    stored vectors (``fingerprints`` and ``scales``, see
+    ``CompactVectors``) can be float32, float16 or int8.
+    """
+
+    def __init__(
+        self,
+        files: list[dict],
+        n_mfcc: int,
+        window_seconds: float,
+        sr: int,
+        hop_ratio: float,
+        fingerprints: np.ndarray,
+        scales: np.ndarray,
+        file_ids: np.ndarray,
+        start_frames: np.ndarray,
+        centroids: np.ndarray,
+        list_offsets: np.ndarray,
+        projection: Optional[FingerprintProjection] = None,
+    ):
+        self.files = files
+        self.n_mfcc = n_mfcc
+        self.window_seconds = window_seconds
+        self.sr = sr
+        self.hop_ratio = hop_ratio
+        self.fingerprints = fingerprints
+        self.scales = scales
+        self.file_ids = file_ids
+        self.start_frames = start_frames
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.projection = projection
+        self._centroid_tree: Optional[cKDTree] = None
+
+    def __len__(self) -> int:
+        return len(self.fingerprints)
+
+    @property
+    def vectors(self) -> CompactVectors:
+        """The stored fingerprints, in the compact form they are scanned in."""
+        return CompactVectors(codes=self.fingerprints, scales=self.scales)
+
+    @classmethod
+    def build(
+        cls,
+        files: Iterable[str],
+        window_seconds: float = 1.0,
+        n_mfcc: Optional[int] = None,
+        list_size: int = 256,
+        projection: Optional[FingerprintProjection] = None,
+        vector_dtype: str = 'float32',
+        sr: int = INDEX_SR,
+        hop_ratio: Optional[float] = None,
+        config: Optional[Config] = None,
+    ) -> "CorpusIndex":
+        """
+        Fingerprints sliding windows over every file and clusters them into lists.
+
+        Windows are ``window_seconds`` long and step by ``hop_ratio`` of a
+        window, matching the search grid of ``find_best_match``.
+
+        Args:
+            files: The audio files to index.
+            window_seconds: The window duration in seconds.
+            n_mfcc: The number of MFCCs per frame. Defaults to the
+                'timbrematcher.n_mfcc' config value.
+            list_size: The average number of entries per inverted list.
+            projection: Projects the fingerprints before they are clustered
+                and stored, e.g. fitted with ``corpus_fingerprints``.
+            vector_dtype: The storage type of the fingerprints, one of
+                ``VECTOR_DTYPES``.
+            sr: The rate every file is resampled to before analysis.
+            hop_ratio: The step between windows as a fraction of the window.
+                Defaults to the 'timbrematcher.hop_ratio' config value.
+            config: Provides the defaults above. Defaults to ``get_config()``.
+
+        Returns:
+            The in-memory index, ready to be saved or queried. It records
+            ``n_mfcc`` and ``hop_ratio``, and queries use the same values.
+        """
+        n_mfcc, hop_ratio = _analysis_settings(n_mfcc, hop_ratio, config)
+        file_records, fingerprints, file_ids, start_frames = corpus_fingerprints(
+            files, window_seconds, n_mfcc, sr, hop_ratio
+        )
+        if projection is not None:
+            if projection.input_dim != fingerprints.shape[1]:
+                raise ValueError(
+                    f"The projection expects {projection.input_dim}-dimensional fingerprints, "
+                    f"but n_mfcc={n_mfcc} gives {fingerprints.shape[1]}."
+                )
+            fingerprints = projection.transform(fingerprints)
+
+        centroids, labels = _train_coarse_quantizer(fingerprints, list_size)
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels, minlength=len(centroids))
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        vectors = quantize(fingerprints[order], vector_dtype)
+
+        return cls(
+            files=file_records,
+            n_mfcc=n_mfcc,
+            window_seconds=window_seconds,
+            sr=sr,
+            hop_ratio=hop_ratio,
+            fingerprints=vectors.codes,
+            scales=vectors.scales,
+            file_ids=file_ids[order],
+            start_frames=start_frames[order],
+            centroids=centroids,
+            list_offsets=list_offsets,
+            projection=projection,
+        )
+
+    def save(self, index_dir: str) -> None:
+        """
+        Writes the index to a directory of ``.npy`` arrays and a JSON header.
+
+        Args:
+            index_dir: The directory to write. It is created if needed.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for name in _ARRAY_NAMES:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        projection_path = os.path.join(index_dir, _PROJECTION_FILE)
+        if self.projection is not None:
+            self.projection.save(projection_path)
+        elif os.path.exists(projection_path):
+            os.remove(projection_path)
+        header = {
+            'format_version': INDEX_FORMAT_VERSION,
+            'n_mfcc': self.n_mfcc,
+            'window_seconds': self.window_seconds,
+            'sr': self.sr,
+            'hop_ratio': self.hop_ratio,
+            'vector_dtype': str(self.fingerprints.dtype),
+            'projection': self.projection is not None,
+            'files': self.files,
+        }
+        with open(os.path.join(index_dir, 'index.json'), 'w') as f:
+            json.dump(header, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "CorpusIndex":
+        """
+        Opens an index written by ``save``. The arrays are memory-mapped.
+
+        Args:
+            index_dir: The index directory.
+
+        Returns:
+            The loaded index.
+
+        Raises:
+            FileNotFoundError: If the directory does not contain an index.
+            ValueError: If the index was written by an incompatible version.
+        """
+        header_path = os.path.join(index_dir, 'index.json')
+        if not os.path.exists(header_path):
+            raise FileNotFoundError(f"No corpus index found at: {index_dir}")
+        with open(header_path, 'r') as f:
+            header = json.load(f)
+        if header.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format version: {header.get('format_version')}")
+
+        arrays = {
+            name: np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode='r')
+            for name in _ARRAY_NAMES
+        }
+        projection = None
+        if header['projection']:
+            projection = FingerprintProjection.load(os.path.join(index_dir, _PROJECTION_FILE))
+        return cls(
+            files=header['files'],
+            n_mfcc=header['n_mfcc'],
+            window_seconds=header['window_seconds'],
+            sr=header['sr'],
+            hop_ratio=header['hop_ratio'],
+            projection=projection,
+            **arrays,
+        )
+
+    def query_fingerprint(
+        self,
+        fingerprint: np.ndarray,
+        top_n: int = 5,
+        n_probe: int = 8,
+    ) -> list[IndexMatch]:
+        """
+        Finds the indexed windows closest to a timbral fingerprint.
+
+        Args:
+            fingerprint: A fingerprint as returned by ``timbral_fingerprint``.
+                It is projected if the index has a projection.
+            top_n: The number of matches to return.
+            n_probe: The number of inverted lists to scan. Larger values
+                trade speed for recall.
+
+        Returns:
+            Up to ``top_n`` matches, closest first. Distances are measured
+            in the projected space if the index has a projection.
+        """
+        if self.projection is not None:
+            fingerprint = self.projection.transform(fingerprint)
+        if self._centroid_tree is None:
+            self._centroid_tree = cKDTree(self.centroids)
+        n_probe = min(n_probe, len(self.centroids))
+        _, lists = self._centroid_tree.query(fingerprint, k=n_probe)
+        lists = np.atleast_1d(lists)
+
+        candidates = np.concatenate([
+            np.arange(self.list_offsets[i], self.list_offsets[i + 1]) for i in lists
+        ])
+        if len(candidates) == 0:
+            return []
+
+        distances = self.vectors.distances(fingerprint, candidates)
+        k = min(top_n, len(candidates))
+        best = np.argpartition(distances, k - 1)[:k]
+        best = best[np.argsort(distances[best])]
+
+        matches = []
+        for i in best:
+            entry = candidates[i]
+            record = self.files[self.file_ids[entry]]
+            start_time = int(self.start_frames[entry]) * MFCC_HOP_LENGTH / self.sr
+            duration = record['window_frames'] * MFCC_HOP_LENGTH / self.sr
+            matches.append(IndexMatch(
+                file=record['path'],
+                start_time=start_time,
+                end_time=start_time + duration,
+                distance=float(distances[i]),
+            ))
+        return matches
+
+    def query(
+        self,
+        target_y: np.ndarray,
+        target_sr: int,
+        top_n: int = 5,
+        n_probe: int = 8,
+    ) -> list[IndexMatch]:
+        """
+        Finds the indexed windows whose timbre is closest to a target snippet.
+
+        Args:
+            target_y: The audio time series of the target snippet.
+            target_sr: The sampling rate of the target snippet. The target
+                is resampled to the index rate.
+            top_n: The number of matches to return.
+            n_probe: The number of inverted lists to scan.
+
+        Returns:
+            Up to ``top_n`` matches, closest first.
+        """
+        target_y = resample(as_audio(target_y), target_sr, self.sr)
+        target_fp = timbral_fingerprint(calculate_mfcc(target_y, self.sr, self.n_mfcc))
+        return self.query_fingerprint(target_fp, top_n=top_n, n_probe=n_probe)
+
+
+def corpus_fingerprints(
+    files: Iterable[str],
+    window_seconds: float = 1.0,
+    n_mfcc: Optional[int] = None,
+    sr: int = INDEX_SR,
+    hop_ratio: Optional[float] = None,
+    config: Optional[Config] = None,
+) -> tuple[list[dict], np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Fingerprints sliding windows over every file, as indexed by ``CorpusIndex.build``.
+
+    Args:
+        files: The audio files.
+        window_seconds: The window duration in seconds.
+        n_mfcc: The number of MFCCs per frame. Defaults to the
+            'timbrematcher.n_mfcc' config value.
+        sr: The rate every file is resampled to before analysis.
+        hop_ratio: The step between windows as a fraction of the window.
+            Defaults to the 'timbrematcher.hop_ratio' config value.
+        config: Provides the defaults above. Defaults to ``get_config()``.
+
+    Returns:
+        A tuple of (file records, fingerprints, file ids, start frames),
+        with one row per window. Files shorter than a window are skipped.
+
+    Raises:
+        ValueError: If no file is long enough for a window.
+    """
+    n_mfcc, hop_ratio = _analysis_settings(n_mfcc, hop_ratio, config)
+    file_records, all_fps, all_ids, all_starts = [], [], [], []
+    for file_path in files:
+        y, file_sr = load_audio(file_path, sr=None)
+        mfccs = cached_mfcc(file_path, resample(y, file_sr, sr), sr, n_mfcc)
+        moments = frame_moments(mfccs)
+
+        window_frames = max(1, int(round(window_seconds * sr / MFCC_HOP_LENGTH)))
+        if moments.n_frames < window_frames:
+            print(f"Skipping {file_path}: shorter than the index window.")
+            continue
+        hop_frames = max(1, int(window_frames * hop_ratio))
+        starts = np.arange(0, moments.n_frames - window_frames + 1, hop_frames)
+
+        file_id = len(file_records)
+        file_records.append(
+            {'path': os.path.abspath(file_path), 'window_frames': window_frames}
+        )
+        all_fps.append(window_fingerprints(moments, starts, window_frames))
+        all_ids.append(np.full(len(starts), file_id, dtype=np.int32))
+        all_starts.append(starts.astype(np.int32))
+        print(f"Fingerprinted {len(starts)} windows from {file_path}")
+
+    if not all_fps:
+        raise ValueError("No indexable audio files were found.")
+    return file_records, np.concatenate(all_fps), np.concatenate(all_ids), np.concatenate(all_starts)
+
+
+def _analysis_settings(
+    n_mfcc: Optional[int],
+    hop_ratio: Optional[float],
+    config: Optional[Config],
+) -> tuple[int, float]:
+    """Fills in n_mfcc and hop_ratio from the 'timbrematcher' config section."""
+    config = config or get_config()
+    if n_mfcc is None:
+        n_mfcc = config.get('timbrematcher.n_mfcc', 13)
+    if hop_ratio is None:
+        hop_ratio = config.get('timbrematcher.hop_ratio', HOP_RATIO)
+    return n_mfcc, hop_ratio
+
+
+def _train_coarse_quantizer(
+    fingerprints: np.ndarray,
+    list_size: int,
+    max_training_points: int = 64,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Clusters fingerprints with k-means and assigns every entry to a list.
+
+    Args:
+        fingerprints: The (n_entries, dim) fingerprint matrix.
+        list_size: The target average number of entries per list.
+        max_training_points: Training sample size per centroid.
+
+    Returns:
+        A tuple of (centroids, labels).
+    """
+    n_lists = max(1, int(np.ceil(len(fingerprints) / list_size)))
+    rng = np.random.default_rng(0)
+    n_train = min(len(fingerprints), n_lists * max_training_points)
+    sample = fingerprints[rng.choice(len(fingerprints), n_train, replace=False)]
+
+    centroids, _ = kmeans2(sample.astype(np.float64), n_lists, minit='++', seed=rng)
+    _, labels = cKDTree(centroids).query(fingerprints)
+    return centroids.astype(np.float32), labels.astype(np.int64)
@@ -1,7 +1,16 @@
 """The main pipeline for the timbre matching feature."""
-import librosa
+import os
+from typing import Optional, Sequence
 
-from .processing import find_best_match
+from rhythmslicer.audio_io import AudioSource
+from rhythmslicer.batch import _output_dirs
+from rhythmslicer.cache import load_audio
+from rhythmslicer.config import Config, get_config
+from rhythmslicer.journal import atomic_output_dir, input_hash, open_journal, params_hash, shard
+from rhythmslicer.profiling import stage
+
+from .analysis import cached_mfcc
+from .processing import HOP_RATIO, find_best_match, find_best_matches
 from .export import save_matched_segments
 
 def run_timbre_matching_pipeline(
@@ -9,6 +18,11 @@ def run_timbre_matching_pipeline(
     source_file: str,
     output_dir: str,
     top_n: int,
+    search: str = 'exhaustive',
+    max_overlap: Optional[float] = None,
+    analysis_sr: Optional[int] = None,
+    config: Optional[Config] = None,
+    scales: Optional[Sequence[float]] = None,
 ):
     """
     The main pipeline for the timbre matching process.
@@ -18,21 +32,183 @@ def run_timbre_matching_pipeline(
         source_file: Path to the source audio file to search within.
         output_dir: Directory to save matched segments.
         top_n: Number of best matches to find.
+        search: 'exhaustive', 'coarse_to_fine' or 'dtw', see ``find_best_match``.
+        max_overlap: Maximum overlap between matches as a fraction of the
+            window length, or None to allow any overlap.
+        analysis_sr: Sample rate to extract features at, or None for the
+            source's native rate. Matches are exported at the native rate.
+        config: Provides the 'timbrematcher.n_mfcc' and
+            'timbrematcher.hop_ratio' settings. Defaults to ``get_config()``.
+        scales: Window lengths to search as multiples of the target length,
+            or None for the target length only. See ``find_best_match``.
+    """
+    config = config or get_config()
+    n_mfcc = config.get('timbrematcher.n_mfcc', 13)
+    with stage('run_timbre_matching_pipeline'):
+        print(f"Loading target file: {target_file}")
+        with stage('decode_target') as s:
+            target_y, target_sr = load_audio(target_file, sr=None)
+            s.arrays(target_y=target_y)
+
+        # The source is opened lazily: only its MFCCs and the matched regions
+        # are ever held in memory for WAV, FLAC and AIFF files.
+        print(f"Loading source file: {source_file}")
+        with stage('open_source'):
+            source = AudioSource(source_file)
+        with source:
+            source_sr = source.samplerate
+
+            print("Finding best matches...")
+            with stage('source_mfcc') as s:
+                source_mfcc = cached_mfcc(source_file, source, source_sr, n_mfcc, analysis_sr)
+                s.arrays(source_mfcc=source_mfcc)
+            with stage('match'):
+                matches = find_best_match(
+                    target_y,
+                    target_sr,
+                    source,
+                    source_sr,
+                    n_mfcc=n_mfcc,
+                    top_n=top_n,
+                    source_mfcc=source_mfcc,
+                    search=search,
+                    max_overlap=max_overlap,
+                    analysis_sr=analysis_sr,
+                    hop_ratio=config.get('timbrematcher.hop_ratio', HOP_RATIO),
+                    scales=scales,
+                )
+
+            if not matches:
+                print("No suitable matches found.")
+                return matches
+
+            print(f"Found {len(matches)} match(es). Saving segments...")
+            with stage('export'):
+                save_matched_segments(source_file, output_dir, matches, source, source_sr)
+    return matches
+
+def run_batch_matching_pipeline(
+    target_files: list[str],
+    source_file: str,
+    output_dir: str,
+    top_n: int,
+    search: str = 'exhaustive',
+    max_overlap: Optional[float] = None,
+    analysis_sr: Optional[int] = None,
+    journal_path: Optional[str] = None,
+    shard_index: int = 0,
+    shard_count: int = 1,
+    config: Optional[Config] = None,
+    scales: Optional[Sequence[float]] = None,
+):
+    """
+    Matches many target snippets against one source file in a single pass.
+
+    The source is decoded and analysed once, and the matches for each target
+    are saved to their own sub-directory of ``output_dir``, named after the
+    target file, with a numeric suffix for repeated names. A sub-directory
+    only appears once all its segments are written.
+
+    With a journal, targets already matched against the same source with the
+    same settings are skipped and their recorded matches returned, so an
+    interrupted batch can be resumed. With several shards, each node matches
+    a disjoint part of the targets.
+
+    Args:
+        target_files: Paths to the target audio snippets.
+        source_file: Path to the source audio file to search within.
+        output_dir: Directory that receives one sub-directory per target.
+        top_n: Number of best matches to find per target.
+        search: 'exhaustive', 'coarse_to_fine' or 'dtw', see ``find_best_match``.
+        max_overlap: Maximum overlap between matches as a fraction of the
+            window length, or None to allow any overlap.
+        analysis_sr: Sample rate to extract features at, or None for the
+            source's native rate. Matches are exported at the native rate.
+        journal_path: A SQLite job journal (see
+            ``rhythmslicer.journal.JobJournal``) to resume from and record to.
+        shard_index: The shard of this node, from 0 to ``shard_count - 1``.
+        shard_count: The number of nodes sharing the targets.
+        config: See ``run_timbre_matching_pipeline``.
+        scales: See ``run_timbre_matching_pipeline``.
+
+    Returns:
+        One list of (start_time, end_time) matches per target of the shard,
+        in input order.
     """
-    print(f"Loading target file: {target_file}")
-    target_y, target_sr = librosa.load(target_file, sr=None)
+    config = config or get_config()
+    n_mfcc = config.get('timbrematcher.n_mfcc', 13)
+    # Output directories are assigned before sharding, as in rhythmslicer.batch
+    items = shard(list(zip(target_files, _output_dirs(target_files, output_dir))), shard_index, shard_count)
+    target_files = [target_file for target_file, _ in items]
+    target_dirs = [target_dir for _, target_dir in items]
+    target_names = [os.path.basename(target_dir) for target_dir in target_dirs]
+    with open_journal(journal_path) as journal:
+        config_hash = params_hash(
+            settings=config.get('timbrematcher', {}),
+            top_n=top_n,
+            search=search,
+            max_overlap=max_overlap,
+            analysis_sr=analysis_sr,
+            scales=sorted(set(scales)) if scales else None,
+        )
+        all_matches: list = [None] * len(target_files)
+        hashes = [''] * len(target_files)
+        if journal is not None:
+            for i, target_file in enumerate(target_files):
+                hashes[i] = input_hash(target_file, source_file)
+                if not journal.is_done(target_names[i], hashes[i], config_hash):
+                    continue
+                matches = [tuple(m) for m in journal.get(target_names[i]).result]
+                # Re-run targets whose saved segments were deleted since
+                if not matches or os.path.isdir(target_dirs[i]):
+                    all_matches[i] = matches
+            n_done = sum(m is not None for m in all_matches)
+            if n_done:
+                print(f"Skipping {n_done} target(s) already matched with the same settings.")
+        pending = [i for i, matches in enumerate(all_matches) if matches is None]
+        if not pending:
+            return all_matches
 
-    print(f"Loading source file: {source_file}")
-    source_y, source_sr = librosa.load(source_file, sr=None)
+        with stage('run_batch_matching_pipeline'):
+            print(f"Loading source file: {source_file}")
+            with stage('open_source'):
+                source = AudioSource(source_file)
+            with source:
+                source_sr = source.samplerate
 
-    print("Finding best matches...")
-    matches = find_best_match(
-        target_y, target_sr, source_y, source_sr, top_n=top_n
-    )
+                print(f"Loading {len(pending)} target file(s)...")
+                with stage('decode_targets') as s:
+                    targets = [load_audio(target_files[i], sr=None) for i in pending]
+                    s.arrays(targets=[target_y for target_y, _ in targets])
 
-    if not matches:
-        print("No suitable matches found.")
-        return
+                print("Finding best matches...")
+                with stage('source_mfcc') as s:
+                    source_mfcc = cached_mfcc(source_file, source, source_sr, n_mfcc, analysis_sr)
+                    s.arrays(source_mfcc=source_mfcc)
+                with stage('match'):
+                    pending_matches = find_best_matches(
+                        targets,
+                        source,
+                        source_sr,
+                        n_mfcc=n_mfcc,
+                        top_n=top_n,
+                        source_mfcc=source_mfcc,
+                        search=search,
+                        max_overlap=max_overlap,
+                        analysis_sr=analysis_sr,
+                        hop_ratio=config.get('timbrematcher.hop_ratio', HOP_RATIO),
+                        scales=scales,
+                    )
 
-    print(f"Found {len(matches)} match(es). Saving segments...")
-    save_matched_segments(source_file, output_dir, matches, source_y, source_sr)
+                with stage('export'):
+                    for i, matches in zip(pending, pending_matches):
+                        all_matches[i] = matches
+                        if not matches:
+                            print(f"No suitable matches found for {target_files[i]}.")
+                        else:
+                            print(f"Found {len(matches)} match(es) for {target_files[i]}. Saving segments...")
+                            with atomic_output_dir(target_dirs[i]) as tmp_dir:
+                                save_matched_segments(source_file, tmp_dir, matches, source, source_sr)
+                        if journal is not None:
+                            journal.record(target_names[i], 'done', hashes[i], config_hash, result=matches)
+    return all_matches
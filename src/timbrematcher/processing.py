@@ -1,9 +1,35 @@
 """Core processing functions for finding timbre matches."""
+from typing import Optional, Sequence, Union
+
 import librosa
 import numpy as np
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
 from scipy.spatial.distance import cdist
 
-from .analysis import calculate_mfcc, timbral_fingerprint
+from rhythmslicer.audio_io import analysis_rate, as_audio, resample, resampled_length
+from rhythmslicer.profiling import stage
+
+from .analysis import (
+    FINGERPRINT_DTYPE,
+    MFCC_HOP_LENGTH,
+    FrameMoments,
+    calculate_mfcc,
+    frame_moments,
+    timbral_fingerprint,
+    window_fingerprints,
+)
+
+SEARCH_MODES = ('exhaustive', 'coarse_to_fine', 'dtw')
+
+# Step between scored windows as a fraction of the window length (75% overlap).
+HOP_RATIO = 0.25
+
+# Sakoe-Chiba band radius of the 'dtw' search, as a fraction of the target length.
+DTW_BAND = 0.1
+
+# Size of each temporary array in ``lb_keogh``. Long targets evaluate fewer
+# candidate windows at once, so memory does not grow with the target length.
+LB_CHUNK_BYTES = 16 * 2**20
 
 def find_best_match(
     target_y: np.ndarray,
@@ -12,52 +38,445 @@ def find_best_match(
     source_sr: int,
     n_mfcc: int = 13,
     top_n: int = 1,
+    source_mfcc: Optional[np.ndarray] = None,
+    search: str = 'exhaustive',
+    max_overlap: Optional[float] = None,
+    analysis_sr: Optional[int] = None,
+    dtw_band: float = DTW_BAND,
+    hop_ratio: float = HOP_RATIO,
+    scales: Optional[Sequence[float]] = None,
 ) -> list[tuple[float, float]]:
     """
     Finds the best matching segment(s) in a source audio file for a given target snippet.
 
+    The source MFCCs are computed once for the whole signal. The fingerprint
+    of every candidate window is then aggregated from cumulative sums of that
+    matrix, so the cost grows linearly with the length of the source.
+
     Args:
         target_y: The audio time series of the target snippet.
         target_sr: The sampling rate of the target snippet.
-        source_y: The audio time series of the source file.
+        source_y: The audio time series of the source file, or an
+            AudioSource reading it from disk on demand.
         source_sr: The sampling rate of the source file.
         n_mfcc: The number of MFCCs to use for the analysis.
         top_n: The number of best matches to return.
+        source_mfcc: Precomputed MFCCs of the source (as returned by
+            ``calculate_mfcc`` with the same ``analysis_sr``), e.g. from the
+            feature cache.
+        search: 'exhaustive' scores every window on a grid with 75% overlap
+            (see ``hop_ratio``); 'coarse_to_fine' scores that grid, then refines around the best
+            candidates at the resolution of the MFCC frames; 'dtw' compares
+            the MFCC sequences of the target and of the windows at every
+            frame offset with constrained dynamic time warping, so the order
+            of sounds matters and not just their statistics.
+        max_overlap: If set, matches may overlap each other by at most this
+            fraction of the window length (non-maximum suppression).
+        analysis_sr: If set, the source and target are resampled to this
+            rate (never upsampled) before extracting features. The returned
+            times refer to the original signals either way.
+        dtw_band: The warping band radius of the 'dtw' search, as a fraction
+            of the target length.
+        hop_ratio: The step between the windows of the 'exhaustive' grid and
+            the coarse 'coarse_to_fine' grid, as a fraction of the window.
+        scales: Window lengths to search, as multiples of the target length,
+            e.g. ``(0.5, 0.75, 1.0, 1.5, 2.0)`` to allow for tempo
+            differences. Every length is fingerprinted from the same source
+            moments, and matches of all lengths are ranked together. Not
+            supported by the 'dtw' search. Defaults to the target length only.
 
     Returns:
         A list of tuples, where each tuple contains the start and end time
-        of a matched segment in the source audio.
+        of a matched segment in the source audio. With several scales, the
+        matches can differ in length.
     """
-    # Resample if necessary
-    if target_sr != source_sr:
-        target_y = librosa.resample(target_y, orig_sr=target_sr, target_sr=source_sr)
+    return find_best_matches(
+        [(target_y, target_sr)],
+        source_y,
+        source_sr,
+        n_mfcc=n_mfcc,
+        top_n=top_n,
+        source_mfcc=source_mfcc,
+        search=search,
+        max_overlap=max_overlap,
+        analysis_sr=analysis_sr,
+        dtw_band=dtw_band,
+        hop_ratio=hop_ratio,
+        scales=scales,
+    )[0]
 
-    # Calculate target fingerprint
-    target_mfcc = calculate_mfcc(target_y, source_sr, n_mfcc)
-    target_fp = timbral_fingerprint(target_mfcc)
+def find_best_matches(
+    targets: Sequence[tuple[np.ndarray, int]],
+    source_y: np.ndarray,
+    source_sr: int,
+    n_mfcc: int = 13,
+    top_n: int = 1,
+    source_mfcc: Optional[np.ndarray] = None,
+    search: str = 'exhaustive',
+    max_overlap: Optional[float] = None,
+    analysis_sr: Optional[int] = None,
+    dtw_band: float = DTW_BAND,
+    hop_ratio: float = HOP_RATIO,
+    scales: Optional[Sequence[float]] = None,
+) -> list[list[tuple[float, float]]]:
+    """
+    Finds the best matching segments in one source for many target snippets.
+
+    The source MFCCs are computed once for all targets. Targets are grouped
+    by length, the source windows of each distinct length are aggregated
+    once per scale, and every target in the group is scored in a single
+    distance matrix computation.
 
-    # Create overlapping frames from the source audio
-    frame_length = len(target_y)
-    hop_length = frame_length // 4  # 75% overlap
-    source_frames = librosa.util.frame(source_y, frame_length=frame_length, hop_length=hop_length).T
+    Args:
+        targets: A sequence of (audio time series, sampling rate) pairs.
+        source_y: The audio time series of the source file, or an AudioSource.
+        source_sr: The sampling rate of the source file.
+        n_mfcc: The number of MFCCs to use for the analysis.
+        top_n: The number of best matches to return per target.
+        source_mfcc: Precomputed MFCCs of the source.
+        search: 'exhaustive', 'coarse_to_fine' or 'dtw', see ``find_best_match``.
+        max_overlap: The maximum allowed overlap between matches, as a
+            fraction of the window length, or None to allow any overlap.
+        analysis_sr: The rate to extract features at, see ``find_best_match``.
+        dtw_band: The warping band of the 'dtw' search, see ``find_best_match``.
+        hop_ratio: The step of the window grid, see ``find_best_match``.
+        scales: The window lengths to search, see ``find_best_match``.
+
+    Returns:
+        One list of (start_time, end_time) tuples per target, in input order.
+    """
+    if search not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{search}'. Expected one of {SEARCH_MODES}.")
+    if scales is not None:
+        if search == 'dtw':
+            raise ValueError("The 'dtw' search does not support scales; its warping band already allows for tempo differences.")
+        if not scales or min(scales) <= 0:
+            raise ValueError(f"Scales must be positive, got {list(scales)}.")
+    scales = sorted(set(scales)) if scales is not None else [1.0]
+    # Everything below works on the analysis grid; times are rate-independent
+    sr = analysis_rate(source_sr, analysis_sr)
+    n_source = resampled_length(len(source_y), source_sr, sr)
+    with stage('source_features') as s:
+        if source_mfcc is None:
+            source_mfcc = calculate_mfcc(source_y, source_sr, n_mfcc, analysis_sr)
+        moments = frame_moments(source_mfcc)
+        s.arrays(source_mfcc=source_mfcc, prefix_sums=moments.sums)
 
-    # Calculate fingerprint for each source frame
-    source_fps = []
-    for frame in source_frames:
-        frame_mfcc = calculate_mfcc(frame, source_sr, n_mfcc)
-        source_fps.append(timbral_fingerprint(frame_mfcc))
+    # Fingerprint every target and group them by window length in samples
+    groups: dict[int, list[tuple[int, np.ndarray, int]]] = {}
+    target_mfccs: dict[int, np.ndarray] = {}
+    with stage('target_features'):
+        for i, (target_y, target_sr) in enumerate(targets):
+            target_y = resample(as_audio(target_y), target_sr, sr)
+            target_mfcc = calculate_mfcc(target_y, sr, n_mfcc)
+            if search == 'dtw':
+                target_mfccs[i] = target_mfcc
+            groups.setdefault(len(target_y), []).append(
+                (i, timbral_fingerprint(target_mfcc), target_mfcc.shape[1])
+            )
 
-    # Find the closest matches
-    distances = cdist([target_fp], source_fps, metric='euclidean')[0]
-    best_indices = np.argsort(distances)[:top_n]
+    results: list[list[tuple[float, float]]] = [[] for _ in targets]
+    with stage('search'):
+        for frame_length, members in groups.items():
+            if search == 'dtw':
+                if n_source < frame_length:
+                    continue
+                for i, _, _ in members:
+                    start_samples = _dtw_search(
+                        source_mfcc, target_mfccs[i], top_n, max_overlap, dtw_band
+                    )
+                    results[i] = _to_times(start_samples, frame_length, sr)
+                continue
+            # Candidate windows of every member at every scale, ranked together at the end
+            candidates: dict[int, list[tuple[np.ndarray, np.ndarray, np.ndarray]]] = {
+                i: [] for i, _, _ in members
+            }
+            for scale in scales:
+                scaled_length = max(1, int(round(frame_length * scale)))
+                if n_source < scaled_length:
+                    continue
+                if search == 'coarse_to_fine':
+                    for i, fp, target_frames in members:
+                        start_samples, distances = _coarse_to_fine(
+                            moments, fp, max(1, int(round(target_frames * scale))),
+                            top_n, max_overlap, hop_ratio,
+                        )
+                        candidates[i].append(
+                            (distances, start_samples, np.full(len(start_samples), scaled_length))
+                        )
+                    continue
 
-    # Convert frame indices to time
+                start_samples, source_fps = _source_windows(
+                    moments, n_source, scaled_length, max(1, int(round(members[0][2] * scale))), hop_ratio
+                )
+
+                # Score the whole group against the shared source windows at once
+                target_fps = np.empty((len(members), source_fps.shape[1]), dtype=FINGERPRINT_DTYPE)
+                for row, (_, fp, _) in zip(target_fps, members):
+                    row[:] = fp
+                distances = cdist(target_fps, source_fps, metric='euclidean')
+                lengths = np.full(len(start_samples), scaled_length)
+                for (i, _, _), row in zip(members, distances):
+                    candidates[i].append((row, start_samples, lengths))
+
+            for i, scored in candidates.items():
+                if not scored:
+                    continue
+                distances, start_samples, lengths = (np.concatenate(column) for column in zip(*scored))
+                best_indices = select_matches(
+                    distances, start_samples, start_samples + lengths, top_n, max_overlap
+                )
+                results[i] = _to_times(start_samples[best_indices], lengths[best_indices], sr)
+
+    return results
+
+def _coarse_to_fine(
+    moments: FrameMoments,
+    target_fp: np.ndarray,
+    target_frames: int,
+    top_n: int,
+    max_overlap: Optional[float],
+    hop_ratio: float = HOP_RATIO,
+    oversample: int = 4,
+) -> np.ndarray:
+    """
+    Searches the source on a coarse grid, then refines around the best windows.
+
+    The coarse grid steps by ``hop_ratio`` of the window. The best
+    ``oversample * top_n`` coarse windows are kept (after the same overlap
+    suppression as the final result), and every frame offset
+    within one coarse step of them is scored as well, so the final matches
+    are located to the nearest MFCC frame without scoring every frame offset
+    in the source.
+
+    Returns:
+        A tuple of (start samples, distances) of the selected windows, best first.
+    """
+    window_frames = min(target_frames, moments.n_frames)
+    last_start = moments.n_frames - window_frames
+    coarse_hop = max(1, int(window_frames * hop_ratio))
+
+    coarse_starts = np.arange(0, last_start + 1, coarse_hop)
+    coarse_fps = window_fingerprints(moments, coarse_starts, window_frames)
+    coarse_distances = cdist([target_fp], coarse_fps, metric='euclidean')[0]
+    candidates = coarse_starts[select_matches(
+        coarse_distances, coarse_starts, coarse_starts + window_frames, oversample * top_n, max_overlap
+    )]
+
+    # Score every frame offset within one coarse step of each candidate
+    offsets = np.arange(-coarse_hop + 1, coarse_hop)
+    fine_starts = np.unique(np.clip(candidates[:, None] + offsets, 0, last_start))
+    fine_fps = window_fingerprints(moments, fine_starts, window_frames)
+    fine_distances = cdist([target_fp], fine_fps, metric='euclidean')[0]
+
+    best = select_matches(
+        fine_distances, fine_starts, fine_starts + window_frames, top_n, max_overlap
+    )
+    return fine_starts[best] * MFCC_HOP_LENGTH, fine_distances[best]
+
+def _dtw_search(
+    source_mfcc: np.ndarray,
+    target_mfcc: np.ndarray,
+    top_n: int,
+    max_overlap: Optional[float],
+    band: float,
+    batch: int = 32,
+) -> np.ndarray:
+    """
+    Finds the windows with the smallest DTW distance to the target.
+
+    Every frame offset is a candidate. Candidates are visited in order of
+    their LB_Keogh lower bound, and exact DTW distances are computed in
+    batches (doubling in size) until the next lower bound exceeds the
+    distance of the last selected match. No unvisited window can then be selected, so the result
+    is the same as computing DTW everywhere.
+
+    Returns:
+        The start samples of the selected windows, best first.
+    """
+    window_frames = min(target_mfcc.shape[1], source_mfcc.shape[1])
+    target_mfcc = target_mfcc[:, :window_frames]
+    radius = max(1, int(round(band * window_frames)))
+    starts = np.arange(source_mfcc.shape[1] - window_frames + 1)
+    ends = starts + window_frames
+
+    bounds = lb_keogh(source_mfcc, target_mfcc, radius, starts)
+    order = np.argsort(bounds, kind='stable')
+    distances = np.full(len(starts), np.inf)
+    k = min(top_n, len(starts))
+    visited = 0
+    while visited < len(order):
+        for j in order[visited:visited + batch]:
+            distances[j] = dtw_distance(target_mfcc, source_mfcc[:, j:j + window_frames], radius)
+        visited = min(visited + batch, len(order))
+        batch *= 2
+        best = select_matches(distances, starts, ends, top_n, max_overlap)
+        if len(best) == k and (visited == len(order) or bounds[order[visited]] > distances[best[-1]]):
+            break
+    return starts[best] * MFCC_HOP_LENGTH
+
+def dtw_distance(query: np.ndarray, candidate: np.ndarray, radius: int) -> float:
+    """
+    Computes the DTW distance between two feature sequences of equal length.
+
+    Frames are compared by squared Euclidean distance, the warping path may
+    stray at most ``radius`` frames from the diagonal (Sakoe-Chiba band), and
+    the distance is the square root of the accumulated cost along the best
+    path, which ``lb_keogh`` bounds from below.
+
+    Args:
+        query: The features of the target, with shape (n_features, time).
+        candidate: The features of a source window, with the same shape.
+        radius: The band radius in frames.
+
+    Returns:
+        The DTW distance.
+    """
+    cost = cdist(query.T, candidate.T, metric='sqeuclidean')
+    offsets = np.arange(cost.shape[0])
+    cost[np.abs(offsets[:, None] - offsets[None, :]) > radius] = np.inf
+    accumulated = librosa.sequence.dtw(C=cost, backtrack=False)
+    return float(np.sqrt(accumulated[-1, -1]))
+
+def lb_keogh(
+    source: np.ndarray,
+    query: np.ndarray,
+    radius: int,
+    start_frames: np.ndarray,
+    chunk_bytes: int = LB_CHUNK_BYTES,
+) -> np.ndarray:
+    """
+    Computes the LB_Keogh lower bound of ``dtw_distance`` for many windows.
+
+    The bound is taken both ways and the larger one is kept. Every frame of
+    a window is matched to some query frame within the band, so its
+    distance to the query's upper and lower envelopes bounds its cost on any
+    warping path. The same holds for every query frame and the envelopes of
+    the source, which are computed once over the whole source.
+
+    Args:
+        source: The source features, with shape (n_features, time).
+        query: The query features, with shape (n_features, window_frames).
+        radius: The band radius in frames.
+        start_frames: The first frame of each window.
+        chunk_bytes: The size of each temporary array. As many windows are
+            evaluated at once as fit in it, and at least one.
+
+    Returns:
+        One lower bound per window.
+    """
+    size = 2 * radius + 1
+    window_frames = query.shape[1]
+    query_upper = maximum_filter1d(query, size, axis=1, mode='nearest')[:, None, :]
+    query_lower = minimum_filter1d(query, size, axis=1, mode='nearest')[:, None, :]
+    windows = np.lib.stride_tricks.sliding_window_view(source, window_frames, axis=1)
+    # Envelopes over the whole source are at least as wide as within each window
+    source_upper = np.lib.stride_tricks.sliding_window_view(
+        maximum_filter1d(source, size, axis=1, mode='nearest'), window_frames, axis=1
+    )
+    source_lower = np.lib.stride_tricks.sliding_window_view(
+        minimum_filter1d(source, size, axis=1, mode='nearest'), window_frames, axis=1
+    )
+    query = query[:, None, :]
+
+    chunk = max(1, chunk_bytes // (query.size * np.result_type(source, query).itemsize))
+    bounds = np.empty(len(start_frames))
+    for first in range(0, len(start_frames), chunk):
+        starts = start_frames[first:first + chunk]
+        block = windows[:, starts, :]
+        excess = np.maximum(block - query_upper, 0) + np.maximum(query_lower - block, 0)
+        forward = np.einsum('fkt,fkt->k', excess, excess)
+        excess = np.maximum(query - source_upper[:, starts, :], 0)
+        excess += np.maximum(source_lower[:, starts, :] - query, 0)
+        backward = np.einsum('fkt,fkt->k', excess, excess)
+        bounds[first:first + chunk] = np.sqrt(np.maximum(forward, backward))
+    return bounds
+
+def select_matches(
+    distances: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    top_n: int,
+    max_overlap: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Picks the ``top_n`` closest windows, optionally suppressing overlaps.
+
+    Without ``max_overlap`` this is a partial selection (``argpartition``)
+    followed by a sort of only the selected entries. With ``max_overlap``,
+    windows are accepted greedily in order of distance, and a window is
+    skipped if it overlaps an accepted one by more than ``max_overlap`` of
+    the shorter of the two.
+
+    Args:
+        distances: The distance of every candidate window.
+        starts: The start position of every candidate window.
+        ends: The end position of every candidate window.
+        top_n: The maximum number of windows to select.
+        max_overlap: The maximum allowed overlap fraction, or None.
+
+    Returns:
+        The indices of the selected windows, closest first.
+    """
+    n = len(distances)
+    k = min(top_n, n)
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+    if max_overlap is None:
+        best = np.argpartition(distances, k - 1)[:k]
+        return best[np.argsort(distances[best], kind='stable')]
+
+    # Greedy non-maximum suppression over a growing prefix of the ranking
+    pool = min(n, 8 * k)
+    while True:
+        ranked = np.argpartition(distances, pool - 1)[:pool]
+        ranked = ranked[np.argsort(distances[ranked], kind='stable')]
+        selected: list[int] = []
+        for i in ranked:
+            intersection = np.minimum(ends[i], ends[selected]) - np.maximum(starts[i], starts[selected])
+            shorter = np.minimum(ends[i] - starts[i], ends[selected] - starts[selected])
+            if np.all(intersection <= max_overlap * shorter):
+                selected.append(i)
+                if len(selected) == k:
+                    break
+        if len(selected) == k or pool == n:
+            return np.array(selected, dtype=np.intp)
+        pool = min(n, 2 * pool)
+
+def _source_windows(
+    moments: FrameMoments,
+    n_samples: int,
+    frame_length: int,
+    target_frames: int,
+    hop_ratio: float = HOP_RATIO,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Lays out windows of ``frame_length`` samples every ``hop_ratio`` of a
+    window over the source and fingerprints them from the source's frame
+    moments.
+
+    Returns:
+        A tuple of (window start samples, window fingerprints).
+    """
+    hop_length = max(1, int(frame_length * hop_ratio))
+    n_windows = 1 + (n_samples - frame_length) // hop_length
+    start_samples = np.arange(n_windows) * hop_length
+
+    window_frames = min(target_frames, moments.n_frames)
+    start_frames = (start_samples + MFCC_HOP_LENGTH // 2) // MFCC_HOP_LENGTH
+    start_frames = np.minimum(start_frames, moments.n_frames - window_frames)
+    return start_samples, window_fingerprints(moments, start_frames, window_frames)
+
+def _to_times(
+    start_samples: np.ndarray,
+    frame_length: Union[int, np.ndarray],
+    sr: int,
+) -> list[tuple[float, float]]:
+    """Converts window start samples and lengths to (start_time, end_time) tuples."""
     matches = []
-    for i in best_indices:
-        start_sample = i * hop_length
-        end_sample = start_sample + frame_length
-        start_time = start_sample / source_sr
-        end_time = end_sample / source_sr
+    for start_sample, length in zip(start_samples, np.broadcast_to(frame_length, np.shape(start_samples))):
+        end_sample = start_sample + length
+        start_time = start_sample / sr
+        end_time = end_sample / sr
         matches.append((start_time, end_time))
-
     return matches
@@ -0,0 +1,228 @@
+"""Compact fingerprint space: a learned PCA/whitening projection and quantized vectors."""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from .analysis import FINGERPRINT_DTYPE
+
+PROJECTION_FORMAT_VERSION = 1
+
+# Storage types of CompactVectors. int8 codes are scaled per dimension.
+VECTOR_DTYPES = ('float32', 'float16', 'int8')
+
+# Rows decoded at a time when scanning CompactVectors, to bound the
+# float64 temporaries of a large scan.
+SCAN_BLOCK_ROWS = 65536
+
+@dataclass
+class FingerprintProjection:
+    """
+    A linear map from timbral fingerprints to a smaller, decorrelated space.
+
+    Fingerprints are centred on the training mean and projected onto the
+    leading principal components. With whitening, every component is also
+    divided by its standard deviation, so no single MFCC statistic dominates
+    the Euclidean distance the way the loud low-order coefficients do in
+    the raw fingerprint.
+
+    Example:
+        projection = FingerprintProjection.fit(corpus_fps, n_components=8)
+        projection.save("output/projection.npz")
+        compact = projection.transform(fingerprints)
+    """
+    mean: np.ndarray
+    components: np.ndarray
+    explained_variance: np.ndarray
+    whiten: bool = True
+
+    @property
+    def n_components(self) -> int:
+        """The dimension of projected fingerprints."""
+        return self.components.shape[1]
+
+    @property
+    def input_dim(self) -> int:
+        """The dimension of the fingerprints the projection was fitted on."""
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(
+        cls,
+        fingerprints: np.ndarray,
+        n_components: int = 8,
+        whiten: bool = True,
+        max_samples: int = 100_000,
+        seed: int = 0,
+    ) -> "FingerprintProjection":
+        """
+        Fits the projection to a sample of fingerprints.
+
+        Args:
+            fingerprints: The (n, dim) fingerprint matrix, e.g. the window
+                fingerprints of a corpus.
+            n_components: The dimension to reduce fingerprints to.
+            whiten: Scale every component to unit variance.
+            max_samples: At most this many rows, drawn at random, are used.
+            seed: The seed of the random sample.
+
+        Returns:
+            The fitted projection.
+
+        Raises:
+            ValueError: If ``n_components`` is out of range or there are
+                fewer than two fingerprints.
+        """
+        fingerprints = np.asarray(fingerprints)
+        n, dim = fingerprints.shape
+        if not 0 < n_components <= dim:
+            raise ValueError(f"n_components must be between 1 and {dim}, got {n_components}.")
+        if n < 2:
+            raise ValueError("At least two fingerprints are needed to fit a projection.")
+        if n > max_samples:
+            rng = np.random.default_rng(seed)
+            fingerprints = fingerprints[rng.choice(n, max_samples, replace=False)]
+
+        sample = fingerprints.astype(np.float64)
+        mean = sample.mean(axis=0)
+        _, singular_values, vt = np.linalg.svd(sample - mean, full_matrices=False)
+        explained_variance = singular_values[:n_components] ** 2 / (len(sample) - 1)
+        components = vt[:n_components].T
+        if whiten:
+            # Components without variance are left unscaled instead of blown up
+            std = np.sqrt(explained_variance)
+            components = components / np.where(std > 1e-12 * max(std[0], 1.0), std, 1.0)
+        return cls(
+            mean=mean.astype(FINGERPRINT_DTYPE),
+            components=components.astype(FINGERPRINT_DTYPE),
+            explained_variance=explained_variance.astype(FINGERPRINT_DTYPE),
+            whiten=whiten,
+        )
+
+    def transform(self, fingerprints: np.ndarray) -> np.ndarray:
+        """
+        Projects fingerprints.
+
+        Args:
+            fingerprints: One fingerprint of shape (dim,) or a matrix of shape (n, dim).
+
+        Returns:
+            The float32 projected fingerprints, of shape (n_components,) or
+            (n, n_components).
+        """
+        fingerprints = np.asarray(fingerprints, dtype=FINGERPRINT_DTYPE)
+        if fingerprints.shape[-1] != self.input_dim:
+            raise ValueError(
+                f"Expected fingerprints of dimension {self.input_dim}, got {fingerprints.shape[-1]}."
+            )
+        return (fingerprints - self.mean) @ self.components
+
+    def save(self, path: str) -> None:
+        """Writes the projection to an NPZ file."""
+        np.savez(
+            path,
+            format_version=np.array(PROJECTION_FORMAT_VERSION),
+            mean=self.mean,
+            components=self.components,
+            explained_variance=self.explained_variance,
+            whiten=np.array(self.whiten),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "FingerprintProjection":
+        """
+        Reads a projection written by ``save``.
+
+        Raises:
+            ValueError: If the file was written by an incompatible version.
+        """
+        with np.load(path, allow_pickle=False) as data:
+            version = int(data['format_version'])
+            if version != PROJECTION_FORMAT_VERSION:
+                raise ValueError(f"Unsupported projection format version: {version}")
+            return cls(
+                mean=data['mean'],
+                components=data['components'],
+                explained_variance=data['explained_variance'],
+                whiten=bool(data['whiten']),
+            )
+
+@dataclass
+class CompactVectors:
+    """
+    Vectors stored as float32, float16 or int8 codes.
+
+    A vector is decoded as ``codes * scales``. Scans decode at most
+    ``SCAN_BLOCK_ROWS`` rows at a time and take their differences to the
+    queries in float64. Expanding ``|q - v|^2`` into ``|q|^2 - 2 q.v + |v|^2``
+    would avoid decoding, but cancels badly for raw fingerprints, whose
+    first MFCC mean alone is in the hundreds.
+    """
+    codes: np.ndarray
+    scales: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """The memory taken by the codes."""
+        return self.codes.nbytes
+
+    def decode(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Returns the float32 vectors, or only the given rows."""
+        codes = self.codes if rows is None else self.codes[rows]
+        return codes.astype(np.float32) * self.scales
+
+    def distances(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Computes Euclidean distances from queries to the stored vectors.
+
+        Args:
+            queries: One float vector of shape (dim,) or a matrix of shape (m, dim).
+            rows: Only compare against these rows.
+
+        Returns:
+            The float32 distances, of shape (n,) for one query or (m, n).
+        """
+        queries = np.asarray(queries, dtype=np.float64)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        n = len(self.codes) if rows is None else len(rows)
+
+        scales = self.scales.astype(np.float64)
+        distances = np.empty((len(queries), n), dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            block = slice(start, min(start + SCAN_BLOCK_ROWS, n))
+            selected = block if rows is None else rows[block]
+            distances[:, block] = cdist(queries, self.codes[selected].astype(np.float64) * scales)
+        return distances[0] if single else distances
+
+def quantize(vectors: np.ndarray, dtype: str = 'int8') -> CompactVectors:
+    """
+    Stores vectors in a compact type.
+
+    int8 codes use a symmetric scale per dimension, set by the largest
+    absolute value of that dimension, so no value is clipped and the
+    rounding error is at most half a step.
+
+    Args:
+        vectors: The (n, dim) float vectors, e.g. projected fingerprints.
+        dtype: One of ``VECTOR_DTYPES``.
+
+    Returns:
+        The compact vectors.
+    """
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype '{dtype}'. Expected one of {VECTOR_DTYPES}.")
+    vectors = np.asarray(vectors, dtype=np.float32)
+    dim = vectors.shape[1]
+    if dtype == 'int8':
+        peak = np.abs(vectors).max(axis=0) if len(vectors) else np.zeros(dim, dtype=np.float32)
+        scales = np.where(peak > 0, peak / 127.0, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+    else:
+        scales = np.ones(dim, dtype=np.float32)
+        codes = vectors.astype(dtype)
+    return CompactVectors(codes=codes, scales=scales)
@@ -0,0 +1,69 @@
+"""Timbral search over the per-slice feature table written by rhythmslicer."""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+from scipy.spatial.distance import cdist
+
+from rhythmslicer.audio_io import as_audio, resample
+from rhythmslicer.export import load_slice_table
+
+from .analysis import calculate_mfcc, timbral_fingerprint
+
+@dataclass
+class SliceMatch:
+    """A slice of a feature table that matches the target."""
+    index: int
+    start_time: float
+    end_time: float
+    distance: float
+    slice_file: Optional[str] = None
+
+def find_best_slices(
+    target_y: np.ndarray,
+    target_sr: int,
+    table: dict,
+    top_n: int = 5,
+) -> list[SliceMatch]:
+    """
+    Ranks the slices of a feature table by timbral distance to a target.
+
+    The slices themselves are the candidate set, so no audio is decoded or
+    analysed apart from the target: its fingerprint is compared with the
+    precomputed fingerprint of every slice.
+
+    Args:
+        target_y: The audio time series of the target snippet.
+        target_sr: The sampling rate of the target snippet.
+        table: A table read with ``rhythmslicer.export.load_slice_table``.
+        top_n: The number of slices to return.
+
+    Returns:
+        The closest slices, best first.
+    """
+    sr = table['sample_rate']
+    n_mfcc = table['mfcc_mean'].shape[1]
+    target_fp = timbral_fingerprint(calculate_mfcc(resample(as_audio(target_y), target_sr, sr), sr, n_mfcc))
+    distances = cdist(target_fp[np.newaxis, :], table['fingerprint'], 'euclidean')[0]
+
+    order = np.argsort(distances, kind='stable')[:top_n]
+    slice_files = table.get('slice_file')
+    return [
+        SliceMatch(
+            index=int(i),
+            start_time=float(table['start'][i] / sr),
+            end_time=float(table['end'][i] / sr),
+            distance=float(distances[i]),
+            slice_file=None if slice_files is None else str(slice_files[i]),
+        )
+        for i in order
+    ]
+
+def search_slice_table(
+    table_path: str,
+    target_y: np.ndarray,
+    target_sr: int,
+    top_n: int = 5,
+) -> list[SliceMatch]:
+    """Loads a slice feature table and returns ``find_best_slices`` for the target."""
+    return find_best_slices(target_y, target_sr, load_slice_table(table_path), top_n)
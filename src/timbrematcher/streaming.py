@@ -0,0 +1,236 @@
+"""Timbre matching over an audio stream of unknown length."""
+import time
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import librosa
+import numpy as np
+
+from rhythmslicer.audio_io import as_audio, resample
+from rhythmslicer.cache import AUDIO_DTYPE
+
+from .analysis import FINGERPRINT_DTYPE, MFCC_HOP_LENGTH, MFCC_N_FFT, timbral_fingerprint
+from .processing import HOP_RATIO
+
+# Raw PCM sample formats accepted by ``pcm_blocks``, with their scale to [-1, 1).
+PCM_FORMATS = {
+    's16le': ('<i2', 2.0 ** 15),
+    's32le': ('<i4', 2.0 ** 31),
+    'f32le': ('<f4', 1.0),
+}
+
+@dataclass
+class MatchEvent:
+    """A window of the stream whose timbre is close to the target."""
+    start_time: float
+    end_time: float
+    distance: float
+
+def stream_mfcc(y: np.ndarray, sr: int, n_mfcc: int = 13) -> np.ndarray:
+    """
+    Calculates MFCCs the way ``StreamingMatcher`` does, for a whole signal.
+
+    Frames are not centred: frame ``k`` covers samples
+    ``[k * hop, k * hop + n_fft)``. The decibel scale is absolute, without
+    the clip relative to the loudest frame that ``calculate_mfcc`` applies,
+    because a stream has no known maximum.
+
+    Args:
+        y: The audio time series.
+        sr: The sampling rate of the audio.
+        n_mfcc: The number of MFCCs to return.
+
+    Returns:
+        The MFCCs, with shape (n_mfcc, time).
+    """
+    mel = librosa.feature.melspectrogram(
+        y=as_audio(y), sr=sr, n_fft=MFCC_N_FFT, hop_length=MFCC_HOP_LENGTH, center=False,
+    )
+    return librosa.feature.mfcc(S=librosa.power_to_db(mel, top_db=None), n_mfcc=n_mfcc)
+
+class StreamingMatcher:
+    """
+    Finds windows of an audio stream that match the timbre of a target.
+
+    Audio is pushed in blocks of any size. Only the samples of an incomplete
+    MFCC frame are carried over between blocks, and the frames of the
+    current window are kept in a ring buffer together with their running
+    sum and sum of squares. Every frame therefore costs the same constant
+    work, and memory does not grow with the length of the stream.
+
+    A window is scored every ``hop_frames`` frames. Windows closer than
+    ``threshold`` become candidates, and a candidate is emitted as a
+    MatchEvent once the stream has moved a full window past its start
+    without a closer overlapping window, so events do not overlap and are
+    reported at most about one window late.
+
+    Example:
+        matcher = StreamingMatcher(target_y, target_sr, sr=22050, threshold=40.0)
+        for event in match_stream(pcm_blocks(sys.stdin.buffer, 4096), matcher):
+            print(event.start_time, event.distance)
+
+    Args:
+        target_y: The audio time series of the target snippet.
+        target_sr: The sampling rate of the target snippet.
+        sr: The sampling rate of the stream. The target is resampled to it.
+        threshold: The largest fingerprint distance reported as a match.
+        n_mfcc: The number of MFCCs to use for the analysis.
+        hop_frames: Frames between scored windows. Defaults to ``HOP_RATIO``
+            of the window, the grid of the exhaustive search.
+    """
+
+    def __init__(
+        self,
+        target_y: np.ndarray,
+        target_sr: int,
+        sr: int,
+        threshold: float,
+        n_mfcc: int = 13,
+        hop_frames: Optional[int] = None,
+    ):
+        target_y = resample(as_audio(target_y), target_sr, sr)
+        if len(target_y) < MFCC_N_FFT:
+            raise ValueError(f"The target must be at least {MFCC_N_FFT} samples long at {sr} Hz.")
+        target_mfcc = stream_mfcc(target_y, sr, n_mfcc)
+
+        self.sr = sr
+        self.threshold = threshold
+        self.n_mfcc = n_mfcc
+        self.target_fp = timbral_fingerprint(target_mfcc)
+        self.window_frames = target_mfcc.shape[1]
+        self.window_seconds = len(target_y) / sr
+        self.hop_frames = hop_frames or max(1, int(self.window_frames * HOP_RATIO))
+
+        # Frames are centred on the target mean to keep the running sums small
+        self._offset = self.target_fp[:n_mfcc].astype(np.float64)
+        self._ring = np.zeros((self.window_frames, n_mfcc))
+        self._sum = np.zeros(n_mfcc)
+        self._squares = np.zeros(n_mfcc)
+        self._tail = np.zeros(0, dtype=AUDIO_DTYPE)
+        self._fingerprint = np.empty(2 * n_mfcc, dtype=FINGERPRINT_DTYPE)
+        self.n_frames = 0
+        self._candidate: Optional[tuple[int, float]] = None
+        self._next_free = 0  # first frame a new event may start at
+
+    def push(self, block: np.ndarray) -> list[MatchEvent]:
+        """
+        Adds a block of mono samples to the stream.
+
+        Args:
+            block: The next samples of the stream, at the rate ``sr``.
+
+        Returns:
+            The match events that became final with this block.
+        """
+        samples = np.concatenate([self._tail, as_audio(block)])
+        n_new = 0 if len(samples) < MFCC_N_FFT else 1 + (len(samples) - MFCC_N_FFT) // MFCC_HOP_LENGTH
+        self._tail = samples[n_new * MFCC_HOP_LENGTH:]
+        if n_new == 0:
+            return []
+
+        mfccs = stream_mfcc(samples[:(n_new - 1) * MFCC_HOP_LENGTH + MFCC_N_FFT], self.sr, self.n_mfcc)
+        events = []
+        for frame in mfccs.T:
+            self._add_frame(frame - self._offset)
+            start = self.n_frames - self.window_frames
+            if start >= 0 and start % self.hop_frames == 0:
+                events.extend(self._score(start))
+        return events
+
+    def flush(self) -> list[MatchEvent]:
+        """Ends the stream and returns the pending match, if any."""
+        events = []
+        if self._candidate is not None:
+            events.append(self._emit(*self._candidate))
+        return events
+
+    def _add_frame(self, frame: np.ndarray) -> None:
+        slot = self.n_frames % self.window_frames
+        if self.n_frames >= self.window_frames:
+            leaving = self._ring[slot]
+            self._sum -= leaving
+            self._squares -= leaving * leaving
+        self._ring[slot] = frame
+        self._sum += frame
+        self._squares += frame * frame
+        self.n_frames += 1
+
+        # Refresh the sums once per window so rounding errors cannot build up
+        if slot == self.window_frames - 1:
+            self._sum = self._ring.sum(axis=0)
+            self._squares = np.square(self._ring).sum(axis=0)
+
+    def _score(self, start: int) -> list[MatchEvent]:
+        events = []
+        if self._candidate is not None and start - self._candidate[0] >= self.window_frames:
+            # No window overlapping the candidate is still to come
+            events.append(self._emit(*self._candidate))
+
+        mean = self._sum / self.window_frames
+        variance = np.maximum(self._squares / self.window_frames - mean * mean, 0.0)
+        self._fingerprint[:self.n_mfcc] = mean + self._offset
+        self._fingerprint[self.n_mfcc:] = np.sqrt(variance)
+        distance = float(np.linalg.norm(self._fingerprint - self.target_fp))
+
+        if distance <= self.threshold and start >= self._next_free:
+            if self._candidate is None or distance < self._candidate[1]:
+                self._candidate = (start, distance)
+        return events
+
+    def _emit(self, start: int, distance: float) -> MatchEvent:
+        self._candidate = None
+        self._next_free = start + self.window_frames
+        start_time = start * MFCC_HOP_LENGTH / self.sr
+        return MatchEvent(start_time, start_time + self.window_seconds, distance)
+
+def match_stream(blocks: Iterable[np.ndarray], matcher: StreamingMatcher) -> Iterator[MatchEvent]:
+    """Pushes every block into ``matcher`` and yields the events as they become final."""
+    for block in blocks:
+        yield from matcher.push(block)
+    yield from matcher.flush()
+
+def pcm_blocks(
+    stream: BinaryIO,
+    block_size: int,
+    sample_format: str = 's16le',
+    channels: int = 1,
+    follow: bool = False,
+    poll_interval: float = 0.1,
+) -> Iterator[np.ndarray]:
+    """
+    Reads raw interleaved PCM from a binary stream in blocks.
+
+    Args:
+        stream: The stream to read, e.g. ``sys.stdin.buffer`` or an open file.
+        block_size: The number of frames per block.
+        sample_format: One of ``PCM_FORMATS``.
+        channels: The number of interleaved channels; they are averaged.
+        follow: At the end of the stream, wait for more data instead of
+            stopping, like ``tail -f`` (for a file that is still growing).
+        poll_interval: Seconds to wait between reads when following.
+
+    Yields:
+        Mono float32 blocks of up to ``block_size`` samples.
+    """
+    if sample_format not in PCM_FORMATS:
+        raise ValueError(f"Unknown sample format '{sample_format}'. Expected one of {tuple(PCM_FORMATS)}.")
+    dtype, scale = PCM_FORMATS[sample_format]
+    frame_bytes = np.dtype(dtype).itemsize * channels
+    pending = b''
+    while True:
+        data = stream.read(block_size * frame_bytes - len(pending))
+        if not data:
+            if follow:
+                time.sleep(poll_interval)
+                continue
+            break
+        pending += data
+        usable = len(pending) - len(pending) % frame_bytes
+        if usable == 0:
+            continue
+        frames = np.frombuffer(pending[:usable], dtype=dtype).reshape(-1, channels)
+        pending = pending[usable:]
+        block = frames.mean(axis=1, dtype=AUDIO_DTYPE) if channels > 1 else frames[:, 0].astype(AUDIO_DTYPE)
+        if scale != 1.0:
+            block /= AUDIO_DTYPE(scale)
+        yield block
@@ -0,0 +1,18 @@
+# tests/conftest.py
+
+import pytest
+from pathlib import Path
+
+from rhythmslicer import cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path: Path, monkeypatch):
+    """
+    Gives every test its own, initially empty, feature cache, so tests never
+    write to the user's cache or depend on what an earlier test cached.
+    Worker processes inherit the directory through the environment.
+    """
+    monkeypatch.setenv("TIMBRESWAP_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(cache, "_default_cache", None)
+    monkeypatch.setattr(cache, "_memory_cache", None)
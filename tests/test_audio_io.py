@@ -0,0 +1,53 @@
+"""Tests for lazy region-based audio access."""
+import numpy as np
+import soundfile as sf
+import librosa
+import pytest
+from pathlib import Path
+
+from rhythmslicer.audio_io import AudioSource, resample
+from timbrematcher.analysis import calculate_mfcc, calculate_mfcc_blockwise
+
+
+@pytest.mark.parametrize("subtype", ["PCM_16", "PCM_24", "FLOAT"])
+def test_audio_source_regions_match_full_decode(tmp_path: Path, subtype: str):
+    rng = np.random.default_rng(0)
+    audio_file = tmp_path / "stereo.wav"
+    sf.write(audio_file, rng.uniform(-0.5, 0.5, (22050, 2)), 22050, subtype=subtype)
+    expected, sr = librosa.load(audio_file, sr=None)
+
+    with AudioSource(str(audio_file)) as source:
+        assert source.is_lazy
+        assert (len(source), source.samplerate) == (len(expected), sr)
+        np.testing.assert_array_equal(source[1000:5000], expected[1000:5000])
+        np.testing.assert_array_equal(source[22000:30000], expected[22000:])
+
+
+def test_blockwise_mfcc_matches_whole_signal(tmp_path: Path):
+    rng = np.random.default_rng(1)
+    audio_file = tmp_path / "noise.wav"
+    sf.write(audio_file, rng.uniform(-0.5, 0.5, 3 * 22050 + 77), 22050, subtype="FLOAT")
+    y, sr = librosa.load(audio_file, sr=None)
+
+    with AudioSource(str(audio_file)) as source:
+        blockwise = calculate_mfcc_blockwise(source, block_frames=16)
+
+    np.testing.assert_allclose(blockwise, calculate_mfcc(y, sr), atol=1e-3)
+
+
+def test_resampled_regions_match_whole_signal_resampling(tmp_path: Path):
+    rng = np.random.default_rng(2)
+    audio_file = tmp_path / "48k.wav"
+    y = rng.uniform(-0.5, 0.5, 48000 + 17).astype(np.float32)
+    sf.write(audio_file, y, 48000, subtype="FLOAT")
+    expected = resample(y, 48000, 22050)
+
+    with AudioSource(str(audio_file)) as source:
+        np.testing.assert_allclose(source.read_resampled(5000, 9000, 22050), expected[5000:9000], atol=1e-6)
+        # Positions before the start and past the end read as zeros
+        head = source.read_resampled(-100, 500, 22050)
+        np.testing.assert_array_equal(head[:100], 0)
+        np.testing.assert_allclose(head[100:], expected[:500], atol=1e-6)
+        tail = source.read_resampled(len(expected) - 50, len(expected) + 50, 22050)
+        np.testing.assert_allclose(tail[:50], expected[-50:], atol=1e-6)
+        np.testing.assert_array_equal(tail[50:], 0)
@@ -0,0 +1,75 @@
+"""Tests for the on-disk feature cache."""
+import os
+import numpy as np
+import soundfile as sf
+from pathlib import Path
+
+from rhythmslicer.cache import FeatureCache, MemoryCache, load_audio
+
+
+def test_cache_round_trip_is_keyed_by_content(tmp_path: Path):
+    cache = FeatureCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    audio_file = tmp_path / "a.wav"
+    sf.write(audio_file, np.zeros(1000), 8000)
+
+    key = cache.make_key(str(audio_file), "mfcc", n_mfcc=13)
+    assert cache.get(key) is None
+
+    stored = cache.put(key, np.arange(10, dtype=np.float32), {"sr": 8000})
+    assert isinstance(stored, np.memmap)
+    array, metadata = cache.get(key)
+    np.testing.assert_array_equal(array, np.arange(10))
+    assert metadata == {"sr": 8000}
+
+    # Different parameters or different contents give a different key
+    assert cache.make_key(str(audio_file), "mfcc", n_mfcc=20) != key
+    sf.write(audio_file, np.ones(1000) * 0.5, 8000)
+    assert cache.make_key(str(audio_file), "mfcc", n_mfcc=13) != key
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path):
+    array = np.zeros(1000, dtype=np.float64)  # ~8 KB per entry
+    cache = FeatureCache(str(tmp_path / "cache"), max_bytes=20_000)
+    cache.put("first", array)
+    cache.put("second", array)
+
+    # Age 'second' and read 'first', so 'second' is the least recently used
+    os.utime(tmp_path / "cache" / "second.npy", (0, 0))
+    cache.get("first")
+    cache.put("third", array)
+
+    assert cache.get("first") is not None
+    assert cache.get("second") is None
+    assert cache.get("third") is not None
+    assert cache.size_bytes() <= 20_000
+
+
+def test_load_audio_serves_repeat_decodes_from_cache(tmp_path: Path):
+    cache = FeatureCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    audio_file = tmp_path / "tone.wav"
+    sf.write(audio_file, np.sin(np.linspace(0, 100, 8000)), 8000)
+
+    y1, sr1 = load_audio(str(audio_file), cache=cache)
+    y2, sr2 = load_audio(str(audio_file), cache=cache)
+
+    assert sr1 == sr2 == 8000
+    assert isinstance(y2, np.memmap)
+    np.testing.assert_array_equal(y1, y2)
+
+
+def test_memory_cache_serves_from_memory_and_fills_from_backing(tmp_path: Path):
+    backing = FeatureCache(str(tmp_path / "cache"), max_bytes=1 << 30)
+    backing.put("on_disk", np.arange(10, dtype=np.float32), {"sr": 8000})
+    cache = MemoryCache(max_bytes=820, backing=backing)
+
+    array, metadata = cache.get("on_disk")
+    assert not isinstance(array, np.memmap) and not array.flags.writeable
+    assert metadata == {"sr": 8000}
+    assert cache.get("on_disk")[0] is array
+
+    # New entries go to both caches; the least recently used one is evicted
+    cache.put("a", np.zeros(100, dtype=np.float32))
+    cache.put("b", np.zeros(100, dtype=np.float32))
+    assert len(cache) == 2 and cache.size_bytes() == 800
+    assert backing.get("a") is not None
+    assert cache.get("on_disk")[0] is not array  # reloaded from disk
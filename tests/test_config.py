@@ -0,0 +1,68 @@
+"""Tests for the instance-scoped configuration."""
+import numpy as np
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from rhythmslicer import config as config_module
+from rhythmslicer.analysis import analyze_signal
+from rhythmslicer.config import Config, get_config, load_config
+
+
+def test_overrides_return_a_new_config_and_leave_the_original_unchanged():
+    base = Config({"hpss": {"margin": 1.0, "kernel_size": 31}, "analysis": {"sample_rate": 22050}})
+    tuned = base.with_overrides({"hpss.margin": 2.0, "analysis.sample_rate": None, "timbrematcher.n_mfcc": 20})
+
+    assert base.get("hpss") == {"margin": 1.0, "kernel_size": 31}
+    assert tuned.get("hpss") == {"margin": 2.0, "kernel_size": 31}
+    assert tuned.get("analysis.sample_rate", 44100) is None
+    assert tuned.get("timbrematcher.n_mfcc") == 20
+    assert base.digest() != tuned.digest()
+
+    # Values handed out are copies
+    base.get("hpss")["margin"] = 5.0
+    assert base.get("hpss.margin") == 1.0
+
+
+@pytest.mark.parametrize("key, value", [
+    ("export.format", "mp3"),
+    ("export.workers", 0),
+    ("pipeline.queue_size", True),
+    ("timbrematcher.hop_ratio", 1.5),
+    ("hpss", "strong"),
+])
+def test_invalid_values_are_rejected(key, value):
+    with pytest.raises(ValueError, match=key):
+        Config().with_overrides({key: value})
+
+
+def test_load_config_replaces_the_process_default(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(config_module, "_default_config", Config())
+    first, second = tmp_path / "first.yml", tmp_path / "second.yml"
+    first.write_text("beat_tracker:\n  tightness: 100\n")
+    second.write_text("beat_tracker:\n  tightness: 400\n")
+
+    load_config(str(first))
+    assert get_config().get("beat_tracker.tightness") == 100
+    load_config(str(second))
+    assert get_config().get("beat_tracker.tightness") == 400
+
+
+def test_concurrent_analyses_with_different_configs_match_sequential_runs():
+    sr = 22050
+    y = np.zeros(4 * sr, dtype=np.float32)
+    for start in range(0, len(y), sr // 2):
+        y[start:start + 100] = 1.0
+    configs = [
+        Config({"hpss": {"margin": 1.0}, "beat_tracker": {"tightness": 100}}),
+        Config({"hpss": {"margin": 3.0}, "beat_tracker": {"tightness": 400, "start_bpm": 60}}),
+    ] * 2
+
+    sequential = [analyze_signal(y, sr, config=c) for c in configs]
+    with ThreadPoolExecutor(max_workers=len(configs)) as pool:
+        concurrent = list(pool.map(lambda c: analyze_signal(y, sr, config=c), configs))
+
+    assert not np.array_equal(sequential[0].beat_frames, sequential[1].beat_frames)
+    for expected, result in zip(sequential, concurrent):
+        np.testing.assert_array_equal(result.y_percussive, expected.y_percussive)
+        np.testing.assert_array_equal(result.beat_frames, expected.beat_frames)
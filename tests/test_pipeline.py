@@ -1,10 +1,20 @@
 # tests/test_pipeline.py
 
+import json
 import numpy as np
+import pytest
 import soundfile as sf
 from pathlib import Path
 
+from rhythmslicer.analysis import analyze_audio
+from rhythmslicer.batch import collect_inputs, run_batch, run_pipelined
+from rhythmslicer.export import load_slice_table, load_slices
+from rhythmslicer.journal import atomic_output_dir
 from rhythmslicer.pipeline import run_slicing_pipeline
+from rhythmslicer.processing import beat_slice_points, slice_audio_on_beats
+from rhythmslicer.config import Config
+from rhythmslicer.profiling import profile, profile_to
+
 
 def create_dummy_audio_file(file_path: Path, sr=22050, duration=5, tempo=120):
     """
@@ -53,4 +63,259 @@ def test_full_pipeline(tmp_path: Path):
 
     # Check that at least one slice file was generated
     wav_slices = list(slices_dir.glob("*.wav"))
-    assert len(wav_slices) > 0, "At least one percussive slice file should be created."
\ No newline at end of file
+    assert len(wav_slices) > 0, "At least one percussive slice file should be created."
+
+def test_streaming_pipeline_matches_whole_file_analysis(tmp_path: Path):
+    """
+    Streaming with small blocks should reproduce the whole-file harmonic
+    track and beat positions, and write the same kind of outputs.
+    """
+    input_file = tmp_path / "test_song.wav"
+    output_dir = tmp_path / "output"
+    create_dummy_audio_file(input_file)
+
+    reference = analyze_audio(str(input_file))
+    run_slicing_pipeline(str(input_file), str(output_dir), streaming=True, block_size=32768)
+
+    harmonic, _ = sf.read(output_dir / "test_song_harmonic.wav")
+    assert len(harmonic) == len(reference.y_harmonic)
+    assert np.corrcoef(harmonic, reference.y_harmonic)[0, 1] > 0.99
+
+    slices = sorted((output_dir / "percussive_slices").glob("*.wav"))
+    assert len(slices) == len(reference.beat_frames) + 1
+    assert sum(sf.info(str(p)).frames for p in slices) == len(reference.y_percussive)
+    assert not list(output_dir.glob(".*spool*")), "The percussive spool file should be removed."
+
+
+def test_batch_isolates_per_file_failures(tmp_path: Path):
+    """
+    A batch over a directory should process every good file in its own
+    sub-directory, record the broken one as an error, and write a report.
+    """
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    create_dummy_audio_file(input_dir / "a.wav", duration=3)
+    create_dummy_audio_file(input_dir / "b.wav", duration=3, tempo=90)
+    (input_dir / "broken.wav").write_bytes(b"not audio")
+    output_dir = tmp_path / "output"
+
+    input_files = collect_inputs([str(input_dir)])
+    results = run_batch(input_files, str(output_dir), workers=2)
+
+    assert [Path(r.input_file).name for r in results] == ["a.wav", "b.wav", "broken.wav"]
+    assert [r.status for r in results] == ["ok", "ok", "error"]
+    assert all(r.tempo > 0 for r in results[:2])
+    assert (output_dir / "a" / "a_harmonic.wav").exists()
+
+    report = json.loads((output_dir / "batch_report.json").read_text())
+    assert report["succeeded"] == 2 and report["failed"] == 1
+
+
+def test_pipelined_batch_matches_sequential_runs(tmp_path: Path):
+    """
+    A pipelined batch should write the same outputs and tempos as running
+    the pipeline on each file, and isolate per-file failures the same way.
+    """
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    create_dummy_audio_file(input_dir / "a.wav", duration=3)
+    (input_dir / "broken.wav").write_bytes(b"not audio")
+    create_dummy_audio_file(input_dir / "c.wav", duration=3, tempo=90)
+    output_dir = tmp_path / "output"
+
+    input_files = collect_inputs([str(input_dir)])
+    results = run_pipelined(input_files, str(output_dir), compute_workers=2, queue_size=1)
+
+    assert [Path(r.input_file).name for r in results] == ["a.wav", "broken.wav", "c.wav"]
+    assert [r.status for r in results] == ["ok", "error", "ok"]
+    for r in (results[0], results[2]):
+        name = Path(r.input_file).stem
+        tempo = run_slicing_pipeline(r.input_file, str(tmp_path / "reference" / name))
+        assert r.tempo == tempo
+        assert sorted(p.name for p in (output_dir / name / "percussive_slices").iterdir()) == \
+            sorted(p.name for p in (tmp_path / "reference" / name / "percussive_slices").iterdir())
+
+    report = json.loads((output_dir / "batch_report.json").read_text())
+    assert report["succeeded"] == 2 and report["failed"] == 1
+    assert report["mode"] == "pipelined" and report["workers"] is None
+    assert report["pipeline"] == {"compute_workers": 2, "write_workers": 2, "queue_size": 1}
+
+
+def test_journaled_shards_resume_and_rerun_only_changed_files(tmp_path: Path):
+    """
+    Shards should split a batch into disjoint parts, and a restarted shard
+    should skip its finished files unless their content changed.
+    """
+    input_dir = tmp_path / "inputs"
+    input_dir.mkdir()
+    for name, tempo in (("a", 120), ("b", 90), ("c", 100)):
+        create_dummy_audio_file(input_dir / f"{name}.wav", duration=2, tempo=tempo)
+    output_dir = tmp_path / "output"
+    input_files = collect_inputs([str(input_dir)])
+
+    journals = [str(tmp_path / f"journal-{i}.sqlite") for i in range(2)]
+    shards = [
+        run_pipelined(input_files, str(output_dir), journal_path=journals[i], shard_index=i, shard_count=2)
+        for i in range(2)
+    ]
+    assert [[Path(r.input_file).name for r in results] for results in shards] == [["a.wav", "c.wav"], ["b.wav"]]
+    assert all(r.status == "ok" for results in shards for r in results)
+    assert sorted(p.name for p in output_dir.iterdir()) == [
+        "a", "b", "batch_report.shard-0-of-2.json", "batch_report.shard-1-of-2.json", "c",
+    ]
+
+    create_dummy_audio_file(input_dir / "c.wav", duration=2, tempo=140)
+    rerun = run_pipelined(input_files, str(output_dir), journal_path=journals[0], shard_index=0, shard_count=2)
+    assert [r.status for r in rerun] == ["skipped", "ok"]
+    assert rerun[0].tempo == shards[0][0].tempo
+
+
+def test_atomic_output_dir_only_replaces_outputs_on_success(tmp_path: Path):
+    output_dir = tmp_path / "out" / "song"
+    with atomic_output_dir(str(output_dir)) as tmp_dir:
+        (Path(tmp_dir) / "first.txt").write_text("1")
+        assert not output_dir.exists()
+    assert [p.name for p in output_dir.iterdir()] == ["first.txt"]
+
+    with pytest.raises(RuntimeError):
+        with atomic_output_dir(str(output_dir)) as tmp_dir:
+            (Path(tmp_dir) / "partial.txt").write_text("2")
+            raise RuntimeError("interrupted")
+    assert [p.name for p in output_dir.iterdir()] == ["first.txt"]
+
+    with atomic_output_dir(str(output_dir)) as tmp_dir:
+        (Path(tmp_dir) / "second.txt").write_text("3")
+    assert [p.name for p in output_dir.iterdir()] == ["second.txt"]
+    assert [p.name for p in output_dir.parent.iterdir()] == ["song"]
+
+def test_container_export_round_trips_slices(tmp_path: Path):
+    """
+    The container format should store the percussive track once, and the
+    reader should return memory-mapped views equal to the in-memory slices.
+    """
+    input_file = tmp_path / "test_song.wav"
+    output_dir = tmp_path / "output"
+    create_dummy_audio_file(input_file)
+
+    reference = analyze_audio(str(input_file))
+    expected = slice_audio_on_beats(reference.y_percussive, reference.beat_frames)
+    run_slicing_pipeline(str(input_file), str(output_dir), export_format="container")
+
+    assert not (output_dir / "percussive_slices").exists()
+    slices = load_slices(str(output_dir / "test_song_slices.json"))
+    assert len(slices) == len(expected)
+    assert all(isinstance(s, np.memmap) for s in slices)
+    for loaded, original in zip(slices, expected):
+        np.testing.assert_array_equal(loaded, original)
+
+
+def test_slice_table_describes_every_written_slice(tmp_path: Path):
+    """
+    The slice feature table should have one row per slice file, pointing at
+    that file and holding its exact RMS and duration.
+    """
+    input_file = tmp_path / "test_song.wav"
+    output_dir = tmp_path / "output"
+    create_dummy_audio_file(input_file)
+
+    run_slicing_pipeline(str(input_file), str(output_dir), slice_table=True)
+
+    table = load_slice_table(str(output_dir / "test_song_slice_features.npz"))
+    slice_files = sorted((output_dir / "percussive_slices").glob("*.wav"))
+    assert table["sample_rate"] == 22050
+    assert [output_dir / f for f in table["slice_file"]] == slice_files
+    assert table["fingerprint"].shape == (len(slice_files), 26)
+    for i, path in enumerate(slice_files):
+        y, sr = sf.read(path, dtype="float32")
+        assert table["duration"][i] == pytest.approx(len(y) / sr)
+        # Slices are written as 16-bit PCM
+        assert table["rms"][i] == pytest.approx(np.sqrt(np.mean(np.square(y))), abs=1e-4)
+
+
+def test_band_limited_onsets_keep_beats_on_the_native_grid(tmp_path: Path):
+    """
+    Beats tracked on a reduced analysis band should land on the same slice
+    boundaries as full-band tracking, while the components stay native.
+    """
+    input_file = tmp_path / "test_song.wav"
+    create_dummy_audio_file(input_file, sr=44100)
+
+    native = analyze_audio(str(input_file), analysis_sr=44100)
+    reduced = analyze_audio(str(input_file), analysis_sr=22050)
+
+    assert reduced.sr == 44100
+    assert len(reduced.y_percussive) == len(native.y_percussive)
+    native_points = beat_slice_points(native.beat_frames, len(native.y_percussive))
+    reduced_points = beat_slice_points(reduced.beat_frames, len(reduced.y_percussive))
+    assert len(reduced_points) == len(native_points)
+    # Within two native-rate hops (~23 ms) of each other
+    assert np.max(np.abs(reduced_points - native_points)) <= 2 * 512
+
+
+def test_analysis_reconstructs_only_requested_outputs(tmp_path: Path):
+    input_file = tmp_path / "test_song.wav"
+    create_dummy_audio_file(input_file)
+
+    full = analyze_audio(str(input_file))
+    percussive_only = analyze_audio(str(input_file), outputs=("percussive",))
+
+    assert percussive_only.y_harmonic is None
+    np.testing.assert_array_equal(percussive_only.y_percussive, full.y_percussive)
+    np.testing.assert_array_equal(percussive_only.beat_frames, full.beat_frames)
+
+
+def test_profile_records_every_stage(tmp_path: Path):
+    """
+    Profiling a run should record each pipeline stage and write both the
+    JSON summary and a Chrome trace.
+    """
+    input_file = tmp_path / "test_song.wav"
+    output_dir = tmp_path / "output"
+    create_dummy_audio_file(input_file)
+
+    with profile_to(str(output_dir)) as profiler:
+        run_slicing_pipeline(str(input_file), str(output_dir))
+
+    names = [r.name for r in profiler.records]
+    assert names == [
+        "decode", "stft", "hpss", "onset_envelope", "istft", "beat_track",
+        "slice", "export", "run_slicing_pipeline",
+    ]
+    istft = profiler.records[4]
+    assert istft.depth == 1 and istft.wall_s > 0
+    assert istft.arrays["y_harmonic"]["nbytes"] > 0
+
+    summary = json.loads((output_dir / "profile.json").read_text())
+    assert summary["totals"]["hpss"]["calls"] == 1
+    trace = json.loads((output_dir / "profile.trace.json").read_text())
+    assert {e["name"] for e in trace["traceEvents"]} == set(names)
+    assert all(e["ph"] == "X" for e in trace["traceEvents"])
+
+
+def test_config_changes_rerun_only_affected_stages(tmp_path: Path):
+    """
+    A new beat tracking setting should reuse the memoized separation, while
+    a new HPSS setting should re-run everything downstream of decoding.
+    """
+    input_file = tmp_path / "test_song.wav"
+    create_dummy_audio_file(input_file)
+    base = Config({"beat_tracker": {"tightness": 100}, "hpss": {"margin": 1.0}})
+
+    def stages_run(run_config):
+        with profile() as profiler:
+            result = analyze_audio(str(input_file), config=run_config)
+        return [r.name for r in profiler.records], result
+
+    names, first = stages_run(base)
+    assert "hpss" in names and "beat_track" in names
+    names, again = stages_run(base)
+    assert names == []
+    np.testing.assert_array_equal(again.y_percussive, first.y_percussive)
+    np.testing.assert_array_equal(again.beat_frames, first.beat_frames)
+    assert np.mean(again.tempo) == np.mean(first.tempo)
+
+    names, _ = stages_run(base.with_overrides({"beat_tracker.tightness": 400}))
+    assert names == ["beat_track"]
+
+    names, _ = stages_run(base.with_overrides({"beat_tracker.tightness": 400, "hpss.margin": 2.0}))
+    assert "decode" in names and "hpss" in names and "beat_track" in names
@@ -0,0 +1,125 @@
+"""Tests for the local pipeline service."""
+import json
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+import soundfile as sf
+from pathlib import Path
+
+import pytest
+
+from rhythmslicer.cache import use_memory_cache
+from rhythmslicer.service import PipelineService, ServiceBusy, create_server
+
+
+@pytest.fixture
+def memory_cache():
+    # As installed by ``serve``, in front of the test's on-disk cache
+    return use_memory_cache(64 * 1024 * 1024)
+
+
+@pytest.fixture
+def server(memory_cache):
+    service = PipelineService(workers=2)
+    server = create_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _call(url: str, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    try:
+        with urllib.request.urlopen(url, data=data) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_service_runs_both_pipelines_and_reports_metrics(server, tmp_path: Path):
+    sr = 22050
+    rng = np.random.default_rng(0)
+    y = 0.1 * rng.standard_normal(4 * sr)
+    y[::sr // 2] += 1.0
+    sf.write(tmp_path / "source.wav", y, sr)
+    sf.write(tmp_path / "target.wav", y[sr:2 * sr], sr)
+
+    status, body = _call(f"{server}/slice", {
+        "input_file": str(tmp_path / "source.wav"), "output_dir": str(tmp_path / "slices"),
+    })
+    assert status == 200 and body["tempo"] > 0
+    assert (tmp_path / "slices" / "source_harmonic.wav").exists()
+
+    status, body = _call(f"{server}/match", {
+        "target_file": str(tmp_path / "target.wav"), "source_file": str(tmp_path / "source.wav"),
+        "output_dir": str(tmp_path / "matches"), "top_n": 1,
+    })
+    assert status == 200
+    assert body["matches"][0] == pytest.approx([1.0, 2.0], abs=0.05)
+
+    status, _ = _call(f"{server}/slice", {"output_dir": str(tmp_path / "slices")})
+    assert status == 400
+
+    status, metrics = _call(f"{server}/metrics")
+    assert status == 200
+    assert metrics["endpoints"]["/slice"]["requests"] == 2
+    assert metrics["endpoints"]["/slice"]["errors"] == 1
+    assert metrics["endpoints"]["/match"]["latency_s"]["p50"] > 0
+
+
+def test_service_serves_repeated_requests_from_memory(server, memory_cache, tmp_path: Path, monkeypatch):
+    sr = 22050
+    y = 0.1 * np.random.default_rng(0).standard_normal(4 * sr)
+    y[::sr // 2] += 1.0
+    sf.write(tmp_path / "source.wav", y, sr)
+    sf.write(tmp_path / "target.wav", y[sr:2 * sr], sr)
+
+    def requests(run):
+        return [
+            _call(f"{server}/slice", {
+                "input_file": str(tmp_path / "source.wav"), "output_dir": str(tmp_path / f"slices_{run}"),
+            }),
+            _call(f"{server}/match", {
+                "target_file": str(tmp_path / "target.wav"), "source_file": str(tmp_path / "source.wav"),
+                "output_dir": str(tmp_path / f"matches_{run}"), "top_n": 1,
+            }),
+        ]
+
+    first = requests(1)
+    assert [status for status, _ in first] == [200, 200]
+    n_entries = len(memory_cache)
+    assert n_entries > 0
+
+    # Every lookup of the repeat must be answered from memory
+    def backing_get(key):
+        raise AssertionError(f"Memory cache miss: {key}")
+
+    monkeypatch.setattr(memory_cache.backing, "get", backing_get)
+    (_, sliced), (_, matched) = requests(2)
+    assert sliced["tempo"] == first[0][1]["tempo"]
+    assert matched["matches"] == first[1][1]["matches"]
+    assert len(memory_cache) == n_entries
+
+
+def test_service_rejects_requests_beyond_max_pending():
+    service = PipelineService(workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow(request):
+        started.set()
+        release.wait(timeout=10)
+        return {}
+
+    service.handlers["/slow"] = slow
+    worker = threading.Thread(target=service.handle, args=("/slow", {}))
+    worker.start()
+    assert started.wait(timeout=10)
+
+    with pytest.raises(ServiceBusy, match="pending"):
+        service.handle("/slow", {})
+    release.set()
+    worker.join()
@@ -0,0 +1,15 @@
+"""Tests that the command-line entry points start without heavy imports."""
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("module", ["rhythmslicer.cli", "timbrematcher.cli"])
+def test_cli_import_defers_heavy_dependencies(module):
+    code = (
+        f"import sys, {module}; "
+        "print(','.join(m for m in ('librosa', 'scipy', 'soundfile') if m in sys.modules))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "", f"{module} imported: {result.stdout.strip()}"
@@ -1,11 +1,35 @@
 """Tests for the Timbre Matcher feature."""
 import os
+import json
+import shutil
 import numpy as np
 import soundfile as sf
 import pytest
 from pathlib import Path
+from typer.testing import CliRunner
 
-from timbrematcher.pipeline import run_timbre_matching_pipeline
+from rhythmslicer.config import Config
+from rhythmslicer.processing import slice_features
+from timbrematcher.analysis import (
+    MFCC_HOP_LENGTH,
+    calculate_mfcc,
+    frame_moments,
+    timbral_fingerprint,
+    window_fingerprints,
+)
+from timbrematcher.cli import app
+from timbrematcher.index import CorpusIndex, corpus_fingerprints
+from timbrematcher.pipeline import run_batch_matching_pipeline, run_timbre_matching_pipeline
+from timbrematcher.projection import FingerprintProjection, quantize
+from timbrematcher.processing import (
+    dtw_distance,
+    find_best_match,
+    find_best_matches,
+    lb_keogh,
+    select_matches,
+)
+from timbrematcher.slices import find_best_slices
+from timbrematcher.streaming import StreamingMatcher, match_stream, pcm_blocks, stream_mfcc
 
 
 @pytest.fixture
@@ -22,7 +46,7 @@ def audio_files(tmp_path: Path):
     # Create a source with the target sine wave embedded
     source_duration = 5
     source_t = np.linspace(0., source_duration, int(sr * source_duration), endpoint=False)
-    source_y = np.random.randn(len(source_t)) * 0.1  # Noise
+    source_y = np.random.default_rng(0).standard_normal(len(source_t)) * 0.1  # Noise
     start_sample = int(2 * sr)  # Embed at 2 seconds
     end_sample = start_sample + len(target_y)
     source_y[start_sample:end_sample] += target_y
@@ -43,3 +67,389 @@ def test_timbre_matching_pipeline(audio_files, tmp_path: Path):
     # Check for the matched file
     output_files = list(output_dir.glob("*.wav"))
     assert len(output_files) > 0, "At least one matched file should be created."
+
+
+def test_journaled_batch_matching_skips_finished_targets(audio_files, tmp_path: Path, monkeypatch):
+    target_file, source_file = audio_files
+    output_dir = tmp_path / "output"
+    journal = str(tmp_path / "journal.sqlite")
+
+    first = run_batch_matching_pipeline([target_file], source_file, str(output_dir), 2, journal_path=journal)
+    assert len(list((output_dir / "target").glob("*.wav"))) == 2
+
+    # A resumed run must not search again
+    with monkeypatch.context() as m:
+        m.setattr("timbrematcher.pipeline.find_best_matches", None)
+        second = run_batch_matching_pipeline([target_file], source_file, str(output_dir), 2, journal_path=journal)
+    assert second == [[tuple(m) for m in first[0]]]
+
+    # Deleted outputs are matched and written again
+    shutil.rmtree(output_dir / "target")
+    third = run_batch_matching_pipeline([target_file], source_file, str(output_dir), 2, journal_path=journal)
+    assert third == first
+    assert len(list((output_dir / "target").glob("*.wav"))) == 2
+
+    # Targets with the same file name get their own directory and journal entry
+    (tmp_path / "other").mkdir()
+    other_target = shutil.copy(target_file, tmp_path / "other" / "target.wav")
+    fourth = run_batch_matching_pipeline([target_file, other_target], source_file, str(output_dir), 2, journal_path=journal)
+    assert fourth[0] == third[0]
+    assert len(list((output_dir / "target_2").glob("*.wav"))) == 2
+
+def test_window_fingerprints_match_timbral_fingerprint():
+    rng = np.random.default_rng(0)
+    mfccs = rng.normal(scale=50.0, size=(13, 200))
+    window_frames = 17
+    starts = np.array([0, 5, 90, 183])
+
+    moments = frame_moments(mfccs)
+    fps = window_fingerprints(moments, starts, window_frames)
+
+    expected = np.vstack([
+        timbral_fingerprint(mfccs[:, s:s + window_frames]) for s in starts
+    ])
+    assert fps.dtype == np.float32
+    np.testing.assert_allclose(fps, expected, rtol=1e-5, atol=1e-4)
+
+
+def test_find_best_match_locates_embedded_target(audio_files):
+    target_file, source_file = audio_files
+    target_y, target_sr = sf.read(target_file)
+    source_y, source_sr = sf.read(source_file)
+
+    matches = find_best_match(target_y, target_sr, source_y, source_sr, top_n=1)
+
+    start_time, end_time = matches[0]
+    assert abs(start_time - 2.0) <= 0.3  # within one 0.25 s hop
+    assert end_time - start_time == pytest.approx(1.0)
+
+
+def test_reduced_rate_search_reports_native_times():
+    sr = 44100
+    rng = np.random.default_rng(0)
+    t = np.arange(sr) / sr
+    source_y = rng.standard_normal(5 * sr) * 0.1
+    source_y[2 * sr:3 * sr] += np.sin(2 * np.pi * 440 * t)
+    target_y = source_y[2 * sr:3 * sr].copy()
+
+    native = find_best_match(target_y, sr, source_y, sr, top_n=1)
+    reduced = find_best_match(target_y, sr, source_y, sr, top_n=1, analysis_sr=11025)
+
+    start_time, end_time = reduced[0]
+    assert start_time == pytest.approx(native[0][0], abs=1e-3)
+    assert end_time - start_time == pytest.approx(1.0, abs=1e-3)
+
+
+def test_corpus_index_query_returns_embedded_window(audio_files, tmp_path: Path):
+    target_file, source_file = audio_files
+    index_dir = tmp_path / "index"
+
+    built = CorpusIndex.build([source_file], window_seconds=1.0, list_size=16)
+    built.save(str(index_dir))
+    corpus_index = CorpusIndex.load(str(index_dir))
+    assert len(corpus_index) == len(built)
+
+    target_y, target_sr = sf.read(target_file)
+    matches = corpus_index.query(target_y, target_sr, top_n=3, n_probe=len(corpus_index.centroids))
+
+    assert len(matches) == 3
+    assert matches[0].file == os.path.abspath(source_file)
+    assert abs(matches[0].start_time - 2.0) <= 0.3
+    assert [m.distance for m in matches] == sorted(m.distance for m in matches)
+
+
+def test_corpus_index_compares_files_and_targets_at_one_rate(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    t = np.arange(44100) / 44100
+    source_y = rng.standard_normal(5 * 44100) * 0.1
+    source_y[2 * 44100:3 * 44100] += np.sin(2 * np.pi * 440 * t)
+    sf.write(tmp_path / "source.wav", source_y, 44100)
+    sf.write(tmp_path / "other.wav", rng.standard_normal(5 * 16000) * 0.1, 16000)
+
+    built = CorpusIndex.build([str(tmp_path / "source.wav"), str(tmp_path / "other.wav")], list_size=16)
+    built.save(str(tmp_path / "index"))
+    assert json.loads((tmp_path / "index" / "index.json").read_text())["sr"] == 22050
+
+    # The same tone and noise, recorded at 48 kHz
+    t = np.arange(48000) / 48000
+    target_y = np.sin(2 * np.pi * 440 * t) + rng.standard_normal(48000) * 0.1
+    corpus_index = CorpusIndex.load(str(tmp_path / "index"))
+    (best,) = corpus_index.query(target_y, 48000, top_n=1, n_probe=len(corpus_index.centroids))
+    assert best.file == str(tmp_path / "source.wav")
+    assert abs(best.start_time - 2.0) <= 0.3
+    assert best.end_time - best.start_time == pytest.approx(1.0, abs=0.05)
+
+
+def test_corpus_index_records_analysis_settings_from_config(audio_files, tmp_path: Path):
+    _, source_file = audio_files
+    config = Config().with_overrides({"timbrematcher.n_mfcc": 20, "timbrematcher.hop_ratio": 0.5})
+
+    built = CorpusIndex.build([source_file], window_seconds=1.0, list_size=16, config=config)
+    built.save(str(tmp_path / "index"))
+    header = json.loads((tmp_path / "index" / "index.json").read_text())
+    assert (header["n_mfcc"], header["hop_ratio"]) == (20, 0.5)
+    assert built.fingerprints.shape[1] == 40
+    # Half-window steps over the 5 s source give 9 one-second windows
+    assert len(built) == 9
+
+    corpus_index = CorpusIndex.load(str(tmp_path / "index"))
+    assert (corpus_index.n_mfcc, corpus_index.hop_ratio) == (20, 0.5)
+    target_y, target_sr = sf.read(audio_files[0])
+    assert corpus_index.query(target_y, target_sr, top_n=1)
+
+
+def test_projection_whitens_and_quantized_distances_track_exact_ones(tmp_path: Path):
+    rng = np.random.default_rng(0)
+    # Correlated fingerprints whose first dimensions dominate the raw distance
+    fingerprints = (rng.normal(size=(2000, 26)) @ rng.normal(size=(26, 26))) * np.linspace(50, 1, 26)
+
+    projection = FingerprintProjection.fit(fingerprints, n_components=8)
+    projection.save(str(tmp_path / "projection.npz"))
+    projection = FingerprintProjection.load(str(tmp_path / "projection.npz"))
+    projected = projection.transform(fingerprints)
+    assert projected.shape == (2000, 8)
+    np.testing.assert_allclose(np.cov(projected, rowvar=False), np.eye(8), atol=1e-3)
+
+    query = projected[0] + rng.normal(scale=0.1, size=8)
+    exact = np.linalg.norm(projected - query, axis=1)
+    for dtype, tolerance in (('float32', 1e-4), ('float16', 1e-2), ('int8', 0.1)):
+        vectors = quantize(projected, dtype)
+        np.testing.assert_allclose(vectors.distances(query), exact, atol=tolerance)
+        rows = np.array([5, 0, 17])
+        np.testing.assert_allclose(vectors.distances(query[None, :], rows)[0], exact[rows], atol=tolerance)
+    assert quantize(projected, 'int8').nbytes * 8 < fingerprints.astype(np.float32).nbytes
+
+
+def test_float32_distances_stay_exact_for_raw_fingerprints():
+    rng = np.random.default_rng(0)
+    # Raw fingerprints sit far from the origin: the first MFCC mean is around -400
+    fingerprints = rng.normal(size=(1000, 26)).astype(np.float32)
+    fingerprints[:, 0] -= 400.0
+    query = fingerprints[3] + np.float32(1e-3)
+
+    exact = np.linalg.norm(fingerprints.astype(np.float64) - query, axis=1)
+    np.testing.assert_allclose(quantize(fingerprints, 'float32').distances(query), exact, rtol=1e-6, atol=1e-6)
+
+
+def test_projected_int8_corpus_index_returns_embedded_window(audio_files, tmp_path: Path):
+    _, source_file = audio_files
+    _, fingerprints, _, _ = corpus_fingerprints([source_file], window_seconds=1.0)
+    # Too few windows to whiten reliably; the unit test above covers whitening
+    projection = FingerprintProjection.fit(fingerprints, n_components=6, whiten=False)
+
+    built = CorpusIndex.build([source_file], window_seconds=1.0, list_size=16, projection=projection, vector_dtype='int8')
+    built.save(str(tmp_path / "index"))
+    corpus_index = CorpusIndex.load(str(tmp_path / "index"))
+    assert corpus_index.fingerprints.dtype == np.int8
+    assert corpus_index.fingerprints.shape == (len(built), 6)
+
+    source_y, source_sr = sf.read(source_file)
+    target_y = source_y[2 * source_sr:3 * source_sr]
+    matches = corpus_index.query(target_y, source_sr, top_n=3, n_probe=len(corpus_index.centroids))
+    assert abs(matches[0].start_time - 2.0) <= 0.3
+    assert [m.distance for m in matches] == sorted(m.distance for m in matches)
+
+
+def test_cli_defaults_to_match_command(audio_files, tmp_path: Path):
+    target_file, source_file = audio_files
+    output_dir = tmp_path / "cli_output"
+
+    result = CliRunner().invoke(app, [target_file, source_file, "--out", str(output_dir), "-n", "1"])
+
+    assert result.exit_code == 0, result.output
+    assert len(list(output_dir.glob("*.wav"))) == 1
+
+
+def test_cli_profile_writes_stage_trace(audio_files, tmp_path: Path):
+    target_file, source_file = audio_files
+    output_dir = tmp_path / "cli_output"
+
+    result = CliRunner().invoke(app, ["match", target_file, source_file, "--out", str(output_dir), "--profile"])
+
+    assert result.exit_code == 0, result.output
+    summary = json.loads((output_dir / "profile.json").read_text())
+    assert {"open_source", "source_mfcc", "search", "export"} <= set(summary["totals"])
+    assert (output_dir / "profile.trace.json").exists()
+
+
+def test_find_best_matches_scores_many_targets_like_single_calls(audio_files):
+    target_file, source_file = audio_files
+    target_y, sr = sf.read(target_file)
+    source_y, _ = sf.read(source_file)
+    targets = [(target_y, sr), (target_y[: sr // 2], sr), (target_y[: sr // 2] * 0.5, sr)]
+
+    batched = find_best_matches(targets, source_y, sr, top_n=3)
+
+    assert len(batched) == 3
+    for (y, target_sr), matches in zip(targets, batched):
+        assert matches == find_best_match(y, target_sr, source_y, sr, top_n=3)
+
+
+def test_coarse_to_fine_search_agrees_with_exhaustive_frame_search(audio_files):
+    target_file, source_file = audio_files
+    target_y, sr = sf.read(target_file)
+    source_y, _ = sf.read(source_file)
+
+    # Score every frame offset in the source to find the true best window
+    target_mfcc = calculate_mfcc(target_y, sr)
+    moments = frame_moments(calculate_mfcc(source_y, sr))
+    window_frames = target_mfcc.shape[1]
+    all_starts = np.arange(moments.n_frames - window_frames + 1)
+    distances = np.linalg.norm(
+        window_fingerprints(moments, all_starts, window_frames) - timbral_fingerprint(target_mfcc),
+        axis=1,
+    )
+    best_start = all_starts[np.argmin(distances)] * MFCC_HOP_LENGTH / sr
+
+    matches = find_best_match(
+        target_y, sr, source_y, sr, top_n=3, search="coarse_to_fine", max_overlap=0.5
+    )
+
+    assert matches[0][0] == pytest.approx(best_start)
+    starts = sorted(start for start, _ in matches)
+    assert all(b - a >= 0.5 - 1e-9 for a, b in zip(starts, starts[1:]))
+
+
+def test_select_matches_suppresses_overlapping_windows():
+    distances = np.array([0.1, 0.2, 0.3, 0.4, 0.5])
+    starts = np.array([0, 1, 10, 11, 20])
+
+    assert list(select_matches(distances, starts, starts + 4, top_n=3)) == [0, 1, 2]
+    assert list(select_matches(distances, starts, starts + 4, top_n=3, max_overlap=0.5)) == [0, 2, 4]
+
+
+def test_dtw_search_with_pruning_equals_exhaustive_dtw():
+    sr = 22050
+    rng = np.random.default_rng(0)
+    t = np.arange(sr) / sr
+    source_y = rng.standard_normal(8 * sr) * 0.1
+    source_y[3 * sr:4 * sr] += np.sin(2 * np.pi * (440 + 440 * t) * t)  # a rising chirp
+    target_y = source_y[3 * sr:4 * sr].copy()
+
+    source_mfcc = calculate_mfcc(source_y, sr)
+    target_mfcc = calculate_mfcc(target_y, sr)
+    window_frames = target_mfcc.shape[1]
+    radius = round(0.1 * window_frames)
+    starts = np.arange(source_mfcc.shape[1] - window_frames + 1)
+    distances = np.array([
+        dtw_distance(target_mfcc, source_mfcc[:, s:s + window_frames], radius) for s in starts
+    ])
+    bounds = lb_keogh(source_mfcc, target_mfcc, radius, starts)
+    assert np.all(bounds <= distances + 1e-6)
+    # A budget below one window still evaluates them one at a time
+    np.testing.assert_array_equal(lb_keogh(source_mfcc, target_mfcc, radius, starts, chunk_bytes=1), bounds)
+
+    expected = starts[select_matches(distances, starts, starts + window_frames, 3, 0.5)]
+    matches = find_best_match(target_y, sr, source_y, sr, top_n=3, search="dtw", max_overlap=0.5)
+    assert [round(start * sr / MFCC_HOP_LENGTH) for start, _ in matches] == list(expected)
+    assert matches[0][0] == pytest.approx(3.0, abs=MFCC_HOP_LENGTH / sr)
+
+
+def test_streaming_matcher_is_independent_of_block_size():
+    sr = 22050
+    rng = np.random.default_rng(0)
+    t = np.arange(sr) / sr
+    source_y = (rng.standard_normal(12 * sr) * 0.1).astype(np.float32)
+    source_y[5 * sr:6 * sr] += np.sin(2 * np.pi * 880 * t)
+    target_y = source_y[5 * sr:6 * sr].copy()
+
+    events = {}
+    for block_size in (1000, 4096, len(source_y)):
+        blocks = (source_y[i:i + block_size] for i in range(0, len(source_y), block_size))
+        matcher = StreamingMatcher(target_y, sr, sr, threshold=10.0)
+        events[block_size] = list(match_stream(blocks, matcher))
+    assert events[1000] == events[4096] == events[len(source_y)]
+
+    # One event, on the embedded target, scored like the offline fingerprint
+    (event,) = events[1000]
+    assert event.start_time == pytest.approx(5.0, abs=matcher.hop_frames * MFCC_HOP_LENGTH / sr)
+    start = round(event.start_time * sr / MFCC_HOP_LENGTH)
+    window = stream_mfcc(source_y, sr)[:, start:start + matcher.window_frames]
+    offline = np.linalg.norm(timbral_fingerprint(window) - matcher.target_fp)
+    assert event.distance == pytest.approx(offline, rel=1e-3, abs=1e-3)
+
+
+def test_pcm_blocks_decodes_interleaved_int16(tmp_path: Path):
+    stereo = np.array([[0, 16384], [-32768, 0], [32767, 32767]], dtype="<i2")
+    raw_file = tmp_path / "stream.raw"
+    raw_file.write_bytes(stereo.tobytes())
+
+    with open(raw_file, "rb") as f:
+        blocks = list(pcm_blocks(f, block_size=2, channels=2))
+    assert [len(b) for b in blocks] == [2, 1]
+    np.testing.assert_allclose(np.concatenate(blocks), [0.25, -0.5, 32767 / 32768], rtol=1e-6)
+
+
+def test_slice_features_aggregate_the_frames_centred_in_each_slice():
+    sr = 22050
+    waveform = np.random.default_rng(0).standard_normal(sr).astype(np.float32)
+    mfcc = calculate_mfcc(waveform, sr).astype(np.float64)
+
+    # Frame k is centred on sample 512 * k; [1, 512) holds no centre and takes frame 1
+    features = slice_features(waveform, np.array([0, 1, 512, 1537, sr]), sr)
+    np.testing.assert_allclose(features["mfcc_mean"][0], mfcc[:, 0], rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(features["mfcc_mean"][1], mfcc[:, 1], rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(features["mfcc_mean"][2], mfcc[:, 1:4].mean(axis=1), rtol=1e-4, atol=1e-3)
+    np.testing.assert_allclose(features["mfcc_mean"][3], mfcc[:, 4:].mean(axis=1), rtol=1e-4, atol=1e-3)
+
+
+def test_find_best_slices_ranks_the_slice_with_the_target_timbre_first():
+    sr = 22050
+    rng = np.random.default_rng(0)
+    t = np.arange(sr) / sr
+    sections = [
+        0.1 * rng.standard_normal(sr),
+        np.sin(2 * np.pi * 440 * t),
+        np.sign(np.sin(2 * np.pi * 110 * t)) * 0.5,
+        0.3 * rng.standard_normal(sr) * np.sin(2 * np.pi * 3 * t),
+    ]
+    waveform = np.concatenate(sections).astype(np.float32)
+    features = slice_features(waveform, np.arange(5) * sr, sr)
+    table = dict(features, sample_rate=sr, slice_file=np.array([f"{i}.wav" for i in range(4)]))
+
+    for i, section in enumerate(sections):
+        (best,) = find_best_slices(section[sr // 4:3 * sr // 4], sr, table, top_n=1)
+        assert (best.index, best.slice_file) == (i, f"{i}.wav")
+        assert (best.start_time, best.end_time) == (i, i + 1)
+
+
+def test_hop_ratio_sets_the_window_grid(audio_files):
+    target_file, source_file = audio_files
+    target_y, sr = sf.read(target_file)
+    source_y, _ = sf.read(source_file)
+
+    # With one window per hop, the candidates start on whole seconds
+    (match,) = find_best_match(target_y, sr, source_y, sr, top_n=1, hop_ratio=1.0)
+    assert match == (2.0, 3.0)
+
+
+def test_multiscale_search_finds_a_slower_rendition_of_the_target():
+    sr = 22050
+    rng = np.random.default_rng(0)
+
+    def phrase(note_seconds):
+        t = np.arange(int(note_seconds * sr)) / sr
+        return np.concatenate([np.sin(2 * np.pi * f * t) for f in (220, 550, 1320)])
+
+    # Fingerprints ignore the order of the notes, so only a window spanning
+    # all three slower notes has the same note proportions as the target
+    target_y = phrase(1 / 3) + rng.standard_normal(3 * int(sr / 3)) * 0.1
+    source_y = rng.standard_normal(8 * sr) * 0.1
+    region = int(2.25 * sr)  # on the grid of the 3 s windows, which step by 0.75 s
+    source_y[region:region + 3 * sr] += phrase(1.0)
+
+    (single,) = find_best_match(target_y, sr, source_y, sr, top_n=1)
+    assert single[1] - single[0] == pytest.approx(1.0, abs=1e-3)
+    assert find_best_match(target_y, sr, source_y, sr, top_n=3, scales=[1.0]) == \
+        find_best_match(target_y, sr, source_y, sr, top_n=3)
+
+    for search in ("exhaustive", "coarse_to_fine"):
+        matches = find_best_match(
+            target_y, sr, source_y, sr, top_n=3, search=search, max_overlap=0.5, scales=[0.5, 1.0, 2.0, 3.0]
+        )
+        start_time, end_time = matches[0]
+        assert end_time - start_time == pytest.approx(3.0, abs=1e-3)
+        assert start_time == pytest.approx(2.25, abs=0.05)
+
+    with pytest.raises(ValueError):
+        find_best_match(target_y, sr, source_y, sr, search="dtw", scales=[1.0, 2.0])